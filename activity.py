@@ -0,0 +1,68 @@
+"""Per-farm activity counters for the data viewer's Users tab.
+
+farm_activity holds one row per farm: how many sensor readings,
+notifications and water history rows it has in the database, and when it
+last wrote any of them. Triggers on those tables add and subtract as rows
+are inserted and deleted, so listing farms with their activity reads one
+counter row per farm instead of counting every farm's rows on each render.
+
+Counts cover rows held in SQLite: rows moved to the archive tier or purged
+leave them. last_activity only ever moves forward. A farm that never wrote
+anything has no row, so readers LEFT JOIN it and take missing counts as 0.
+"""
+
+# Counter column -> (table it counts, SQL for a row's time as 'YYYY-MM-DD HH:MM:SS')
+SOURCES = {
+    "sensor_records": ("sensor_readings", "datetime({row}.ts, 'unixepoch')"),
+    "notifications": ("notifications", "{row}.created_at"),
+    "history_rows": ("water_level_history", "{row}.created_at"),
+}
+
+
+# ------------------ SCHEMA ------------------
+def create_activity(conn):
+    """Create farm_activity and its triggers, then backfill it from existing rows"""
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS farm_activity
+                     (user_id TEXT PRIMARY KEY,
+                      {", ".join(f"{counter} INTEGER NOT NULL DEFAULT 0" for counter in SOURCES)},
+                      last_activity TIMESTAMP) WITHOUT ROWID''')
+
+    for counter, (table, at) in SOURCES.items():
+        # MAX() of anything and NULL is NULL, so a missing time keeps the other
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_insert_activity
+                         AFTER INSERT ON {table}
+                         BEGIN
+                             INSERT INTO farm_activity (user_id, {counter}, last_activity)
+                             VALUES (NEW.user_id, 1, {at.format(row="NEW")})
+                             ON CONFLICT (user_id) DO UPDATE SET
+                                 {counter} = {counter} + 1,
+                                 last_activity = COALESCE(MAX(last_activity, excluded.last_activity),
+                                                          last_activity, excluded.last_activity);
+                         END''')
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_delete_activity
+                         AFTER DELETE ON {table}
+                         BEGIN
+                             UPDATE farm_activity SET {counter} = {counter} - 1
+                             WHERE user_id = OLD.user_id;
+                         END''')
+
+    # Backfill: one grouped pass over each table
+    counts = " UNION ALL ".join(
+        f'''SELECT user_id, {", ".join(("COUNT(*)" if other == counter else "0") + f" AS {other}"
+                                      for other in SOURCES)},
+                   MAX({at.format(row=table)}) AS last_activity
+            FROM {table} GROUP BY user_id'''
+        for counter, (table, at) in SOURCES.items())
+    conn.execute(f'''INSERT OR REPLACE INTO farm_activity (user_id, {", ".join(SOURCES)}, last_activity)
+                     SELECT user_id, {", ".join(f"SUM({counter})" for counter in SOURCES)}, MAX(last_activity)
+                     FROM ({counts})
+                     GROUP BY user_id''')
+
+
+# ------------------ QUERIES ------------------
+def farm_counts(conn, user_id):
+    """Counters of one farm by name, zero for a farm that never wrote anything"""
+    row = conn.execute(f"SELECT {', '.join(SOURCES)} FROM farm_activity WHERE user_id = ?",
+                       (user_id,)).fetchone()
+    return dict(zip(SOURCES, row or [0] * len(SOURCES)))
+
@@ -16,6 +16,17 @@ import os
 import subprocess
 import sys
 
+import archive
+import database as db
+import export
+import migrations
+import pagination
+import simulation
+import cache
+import stats
+import readings
+import timeseries
+
 # Set page configuration
 st.set_page_config(
     page_title="AgriGurd",
@@ -27,64 +38,16 @@ st.set_page_config(
 # ------------------ DATABASE SETUP ------------------
 def init_db():
     """Initialize SQLite database"""
-    conn = sqlite3.connect('smart_agriculture.db')
-    c = conn.cursor()
-    
-    # Users table
-    c.execute('''CREATE TABLE IF NOT EXISTS users
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  username TEXT UNIQUE NOT NULL,
-                  password_hash TEXT NOT NULL,
-                  user_id TEXT UNIQUE NOT NULL,
-                  farm_name TEXT NOT NULL,
-                  location TEXT,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  is_admin INTEGER DEFAULT 0)''')
-    
-    # Sensor data table
-    c.execute('''CREATE TABLE IF NOT EXISTS sensor_data
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  user_id TEXT NOT NULL,
-                  solar_input REAL DEFAULT 0,
-                  battery_level REAL DEFAULT 0,
-                  water_level REAL DEFAULT 0,
-                  drain_status INTEGER DEFAULT 0,
-                  last_update TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  FOREIGN KEY (user_id) REFERENCES users(user_id))''')
-    
-    # Notifications table
-    c.execute('''CREATE TABLE IF NOT EXISTS notifications
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  user_id TEXT NOT NULL,
-                  title TEXT NOT NULL,
-                  message TEXT NOT NULL,
-                  notification_type TEXT DEFAULT 'info',
-                  is_read INTEGER DEFAULT 0,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-    
-    # Water level history table
-    c.execute('''CREATE TABLE IF NOT EXISTS water_level_history
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  user_id TEXT NOT NULL,
-                  water_level REAL NOT NULL,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-    
-    # Check if admin user exists, if not create it
-    admin_hash = hashlib.sha256("admin@1234".encode()).hexdigest()
-    c.execute("SELECT COUNT(*) FROM users WHERE username = 'admin'")
-    if c.fetchone()[0] == 0:
-        c.execute('''INSERT INTO users (username, password_hash, user_id, farm_name, location, is_admin)
-                     VALUES (?, ?, ?, ?, ?, ?)''',
-                  ('admin', admin_hash, 'ADMIN001', 'System Administration', 'Control Center', 1))
-    else:
-        # Ensure admin user has is_admin set to 1
-        c.execute("UPDATE users SET is_admin = 1 WHERE username = 'admin'")
-    
-    conn.commit()
-    conn.close()
+    migrations.bootstrap()
 
-# Initialize database on startup
-init_db()
+# Initialize database once per process; later reruns only check a cached flag
+migrations.ensure_bootstrapped()
+
+# Recent readings per farm are served from memory, loaded once per process
+timeseries.ensure_warm()
+
+# Farms advance on a background thread, independent of open dashboards
+simulation.ensure_scheduler()
 
 # ------------------ AUDIO FILES (Base64 Encoded) ------------------
 EMERGENCY_SOUND = """
@@ -114,6 +77,12 @@ def safe_st_folium(m, height=300):
         st.map(pd.DataFrame({'lat': [10.79], 'lon': [78.70]}), zoom=13)
 
 # ------------------ USER MANAGEMENT WITH SQLite ------------------
+# Notification types written immediately instead of through the write-behind buffer
+URGENT_NOTIFICATION_TYPES = ("emergency", "warning")
+
+# Tables behind the main dashboard, polled for changes by the auto refresh
+DASHBOARD_TABLES = ("sensor_data", "notifications", "water_level_history")
+
 class UserManager:
     def __init__(self):
         if "current_user" not in st.session_state:
@@ -129,19 +98,17 @@ class UserManager:
         return hashlib.sha256(password.encode()).hexdigest()
     
     def create_user(self, username, password, farm_name, location):
-        conn = sqlite3.connect('smart_agriculture.db')
-        c = conn.cursor()
-        
-        # Check if username exists
-        c.execute("SELECT username FROM users WHERE username = ?", (username,))
-        if c.fetchone():
-            conn.close()
-            return False, "Username already exists"
-        
         user_id = str(uuid.uuid4())[:8]
         password_hash = self.hash_password(password)
         
-        try:
+        def insert_user(conn):
+            c = conn.cursor()
+            
+            # Check if username exists
+            c.execute("SELECT username FROM users WHERE username = ?", (username,))
+            if c.fetchone():
+                return False, "Username already exists"
+            
             # Insert user
             c.execute('''INSERT INTO users (username, password_hash, user_id, farm_name, location)
                          VALUES (?, ?, ?, ?, ?)''',
@@ -161,27 +128,21 @@ class UserManager:
                        f"Your farm '{farm_name}' is now being monitored", "info"))
             
             # Initialize water level history
-            for i in range(24):
-                level = random.randint(40, 70)
-                c.execute('''INSERT INTO water_level_history (user_id, water_level, created_at)
+            c.executemany('''INSERT INTO water_level_history (user_id, water_level, created_at)
                              VALUES (?, ?, datetime('now', ?))''',
-                         (user_id, level, f'-{23-i} hours'))
+                          [(user_id, random.randint(40, 70), f'-{23-i} hours') for i in range(24)])
             
-            conn.commit()
-            conn.close()
             return True, user_id
-            
+        
+        try:
+            return db.write(insert_user)
         except Exception as e:
-            conn.close()
             return False, f"Database error: {str(e)}"
     
     def authenticate(self, username, password):
-        conn = sqlite3.connect('smart_agriculture.db')
-        c = conn.cursor()
-        
-        c.execute("SELECT user_id, password_hash, is_admin FROM users WHERE username = ?", (username,))
-        result = c.fetchone()
-        conn.close()
+        with db.connection() as conn:
+            result = conn.execute("SELECT user_id, password_hash, is_admin FROM users WHERE username = ?",
+                                  (username,)).fetchone()
         
         if not result:
             return False, "User not found"
@@ -210,96 +171,105 @@ class UserManager:
         st.rerun()
     
     def get_current_user_data(self):
-        if not st.session_state.current_user_id:
+        user_id = st.session_state.current_user_id
+        if not user_id:
             return None, None, None
         
-        conn = sqlite3.connect('smart_agriculture.db')
-        c = conn.cursor()
+        # Account info and farm state are cached apart: accounts rarely change,
+        # farm state changes on every write and simulation tick
+        user_info = cache.account_cache.get(user_id, db.table_versions(("users",))["users"],
+                                            lambda: self._load_user_info(user_id))
+        if not user_info:
+            return None, None, None
         
-        # Get user info
-        c.execute('''SELECT username, user_id, farm_name, location, created_at, is_admin 
-                     FROM users WHERE user_id = ?''', 
-                  (st.session_state.current_user_id,))
-        user_row = c.fetchone()
+        # The table counters see commits from other processes; the local
+        # version sees this process's writes still held by the write-behind buffer
+        version = (tuple(db.table_versions(DASHBOARD_TABLES).values()), cache.data_version(user_id))
+        sensor_data, user_data = cache.state_cache.get(user_id, version,
+                                                       lambda: self._load_farm_state(user_id))
+        return user_info, sensor_data, user_data
+    
+    def _load_user_info(self, user_id):
+        with db.connection() as conn:
+            user_row = conn.execute('''SELECT username, user_id, farm_name, location, created_at, is_admin 
+                                       FROM users WHERE user_id = ?''', 
+                                    (user_id,)).fetchone()
         
         if not user_row:
-            conn.close()
-            return None, None, None
+            return None
         
         username, user_id, farm_name, location, created_at, is_admin = user_row
-        
-        # Get sensor data
-        c.execute('''SELECT solar_input, battery_level, water_level, drain_status, last_update
-                     FROM sensor_data WHERE user_id = ? ORDER BY last_update DESC LIMIT 1''',
-                  (user_id,))
-        sensor_row = c.fetchone()
-        
-        if sensor_row:
-            solar_input, battery_level, water_level, drain_status, last_update = sensor_row
-            sensor_data = {
-                "solar_input": float(solar_input),
-                "battery_level": float(battery_level),
-                "water_level": float(water_level),
-                "drain_status": bool(drain_status),
-                "last_update": last_update
-            }
-        else:
-            # Initialize with default values
-            sensor_data = {
-                "solar_input": random.randint(800, 1000),
-                "battery_level": random.randint(80, 100),
-                "water_level": random.randint(50, 70),
-                "drain_status": False,
-                "last_update": datetime.now().isoformat()
-            }
-            # Save to database
-            c.execute('''INSERT INTO sensor_data (user_id, solar_input, battery_level, water_level, drain_status)
-                         VALUES (?, ?, ?, ?, ?)''',
-                      (user_id, sensor_data["solar_input"], sensor_data["battery_level"], 
-                       sensor_data["water_level"], sensor_data["drain_status"]))
-            conn.commit()
-        
-        # Get notifications
-        c.execute('''SELECT title, message, notification_type, created_at, is_read
-                     FROM notifications WHERE user_id = ? 
-                     ORDER BY created_at DESC LIMIT 15''',
-                  (user_id,))
+        return {
+            "username": username,
+            "user_id": user_id,
+            "farm_name": farm_name,
+            "location": location,
+            "created_at": created_at,
+            "is_admin": bool(is_admin)
+        }
+    
+    def _load_farm_state(self, user_id):
+        with db.connection() as conn:
+            # Get sensor data: one key lookup on the current-state table
+            sensor_row = readings.current_state(conn, user_id)
+            
+            if sensor_row:
+                sensor_data = {
+                    "solar_input": float(sensor_row["solar_input"]),
+                    "battery_level": float(sensor_row["battery_level"]),
+                    "water_level": float(sensor_row["water_level"]),
+                    "drain_status": bool(sensor_row["drain_status"]),
+                    "last_update": sensor_row["last_update"]
+                }
+            else:
+                # Initialize with default values
+                sensor_data = {
+                    "solar_input": random.randint(800, 1000),
+                    "battery_level": random.randint(80, 100),
+                    "water_level": random.randint(50, 70),
+                    "drain_status": False,
+                    "last_update": datetime.now().isoformat()
+                }
+                # Save to database
+                db.execute('''INSERT INTO sensor_data (user_id, solar_input, battery_level, water_level, drain_status)
+                              VALUES (?, ?, ?, ?, ?)
+                              ON CONFLICT (user_id) DO NOTHING''',
+                           (user_id, sensor_data["solar_input"], sensor_data["battery_level"], 
+                            sensor_data["water_level"], sensor_data["drain_status"]))
+                # Reload next time in case another writer got there first
+                cache.bump(user_id)
+            
+        # Notifications and history are topped up with the rows added since
+        # the last load instead of re-reading the whole window
+        rows = [row[2:] for row in cache.live_rows("notifications", user_id, 15)]
+        # Include notifications still waiting in the write-behind buffer
+        rows += [(title, message, n_type, n_created_at, 0) for _, title, message, n_type, n_created_at
+                 in db.buffered_rows("notifications", user_id)]
+        rows = sorted(rows, key=lambda row: row[3], reverse=True)[:15]
         notifications = []
-        for row in c.fetchall():
-            title, message, n_type, created_at, is_read = row
+        for row in rows:
+            title, message, n_type, n_created_at, is_read = row
             notifications.append({
                 "title": title,
                 "message": message,
                 "type": n_type,
-                "time": created_at,
+                "time": n_created_at,
                 "read": bool(is_read)
             })
         
         # Get water level history
-        c.execute('''SELECT water_level, created_at 
-                     FROM water_level_history 
-                     WHERE user_id = ? 
-                     ORDER BY created_at DESC LIMIT 24''',
-                  (user_id,))
+        rows = [row[2:] for row in cache.live_rows("water_level_history", user_id, 24)]
+        rows += [(level, h_created_at) for _, level, h_created_at
+                 in db.buffered_rows("water_level_history", user_id)]
+        rows = sorted(rows, key=lambda row: row[1], reverse=True)[:24]
         history = []
-        for row in c.fetchall():
-            level, created_at = row
+        for row in rows:
+            level, h_created_at = row
             history.append({
-                "time": created_at[11:16] if len(created_at) > 10 else created_at,  # Extract HH:MM
+                "time": h_created_at[11:16] if len(h_created_at) > 10 else h_created_at,  # Extract HH:MM
                 "level": float(level)
             })
         
-        conn.close()
-        
-        user_info = {
-            "username": username,
-            "user_id": user_id,
-            "farm_name": farm_name,
-            "location": location,
-            "created_at": created_at,
-            "is_admin": bool(is_admin)
-        }
-        
         user_data = {
             "notifications": notifications,
             "water_level_history": history,
@@ -310,90 +280,69 @@ class UserManager:
             ]
         }
         
-        return user_info, sensor_data, user_data
+        return sensor_data, user_data
     
     def update_sensor_data(self, user_id, data):
-        conn = sqlite3.connect('smart_agriculture.db')
-        c = conn.cursor()
-        
-        # First check if record exists
-        c.execute("SELECT COUNT(*) FROM sensor_data WHERE user_id = ?", (user_id,))
-        if c.fetchone()[0] == 0:
-            # Insert new record
-            c.execute('''INSERT INTO sensor_data (user_id, solar_input, battery_level, water_level, drain_status)
-                         VALUES (?, ?, ?, ?, ?)''',
-                      (user_id, data.get("solar_input", 0), data.get("battery_level", 0),
-                       data.get("water_level", 0), data.get("drain_status", 0)))
-        else:
-            # Update existing record
-            c.execute('''UPDATE sensor_data 
-                         SET solar_input = ?, battery_level = ?, water_level = ?, 
-                             drain_status = ?, last_update = CURRENT_TIMESTAMP
-                         WHERE user_id = ?''',
-                      (data.get("solar_input", 0), data.get("battery_level", 0),
-                       data.get("water_level", 0), data.get("drain_status", 0),
-                       user_id))
-        
-        # Add to water level history (only if water level changed)
-        if "water_level" in data:
-            c.execute('''INSERT INTO water_level_history (user_id, water_level)
-                         VALUES (?, ?)''',
-                      (user_id, data.get("water_level", 0)))
-        
-        conn.commit()
-        conn.close()
+        def apply_update(conn):
+            # Read-modify-write on the farm's state row: fields the caller
+            # left out keep their current values
+            state = readings.current_state(conn, user_id) or dict.fromkeys(readings.STATE_FIELDS, 0)
+            state.update(data)
+            accepts = [readings.record(conn, user_id, state)]
+            # Add to water level history (only if water level changed beyond the deadband)
+            if "water_level" in data:
+                accepts.append(readings.record_history(conn, user_id, state["water_level"]))
+            return state, accepts
+        
+        state, accepts = db.write(apply_update)
+        # Storage policies move on only once the rows are committed
+        for accept in accepts:
+            accept()
+        timeseries.store().append([user_id], **{metric: [state[metric]] for metric in timeseries.METRICS})
+        cache.bump(user_id)
     
     def add_notification(self, user_id, title, message, notification_type="info"):
-        conn = sqlite3.connect('smart_agriculture.db')
-        c = conn.cursor()
-        
-        c.execute('''INSERT INTO notifications (user_id, title, message, notification_type)
-                     VALUES (?, ?, ?, ?)''',
-                  (user_id, title, message, notification_type))
-        
-        conn.commit()
-        conn.close()
+        # Alerts are written at once; everything else goes through the write-behind buffer
+        if notification_type in URGENT_NOTIFICATION_TYPES:
+            db.execute('''INSERT INTO notifications (user_id, title, message, notification_type)
+                          VALUES (?, ?, ?, ?)''',
+                       (user_id, title, message, notification_type))
+        else:
+            db.insert_later("notifications", user_id, title, message, notification_type)
+        cache.bump(user_id)
     
     def mark_all_notifications_read(self, user_id):
-        conn = sqlite3.connect('smart_agriculture.db')
-        c = conn.cursor()
-        
-        c.execute('''UPDATE notifications SET is_read = 1 WHERE user_id = ?''',
-                  (user_id,))
-        
-        conn.commit()
-        conn.close()
+        db.flush_buffer()
+        db.execute('''UPDATE notifications SET is_read = 1 WHERE user_id = ?''',
+                   (user_id,))
+        # is_read changed on rows the live series already holds
+        cache.reset_series(user_id)
+        cache.bump(user_id)
     
     def update_water_level(self, user_id, change_percent):
         """Update water level by a specific percentage"""
-        conn = sqlite3.connect('smart_agriculture.db')
-        c = conn.cursor()
-        
-        # Get current water level
-        c.execute("SELECT water_level FROM sensor_data WHERE user_id = ?", (user_id,))
-        result = c.fetchone()
-        
-        if result:
-            current_level = result[0]
-            new_level = max(0, min(100, current_level + change_percent))
+        def apply_change(conn):
+            # Get current state
+            state = readings.current_state(conn, user_id)
             
-            # Update in database
-            c.execute('''UPDATE sensor_data 
-                         SET water_level = ?, last_update = CURRENT_TIMESTAMP
-                         WHERE user_id = ?''',
-                      (new_level, user_id))
+            if state is None:
+                return None, None
             
-            # Add to history
-            c.execute('''INSERT INTO water_level_history (user_id, water_level)
-                         VALUES (?, ?)''',
-                      (user_id, new_level))
+            new_level = max(0, min(100, state["water_level"] + change_percent))
             
-            conn.commit()
-            conn.close()
-            return new_level
-        
-        conn.close()
-        return None
+            # Update state, log the reading and add it to history
+            state["water_level"] = new_level
+            return new_level, [readings.record(conn, user_id, state),
+                               readings.record_history(conn, user_id, new_level)]
+        
+        new_level, accepts = db.write(apply_change)
+        
+        if new_level is not None:
+            for accept in accepts:
+                accept()
+            timeseries.store().append([user_id], water_level=[new_level])
+            cache.bump(user_id)
+        return new_level
 
 # Initialize User Manager
 user_manager = UserManager()
@@ -818,126 +767,6 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ------------------ UTILITY FUNCTIONS ------------------
-def enforce_water_level_control(user_id, sensor_data):
-    """Enforce water level control logic for specific user"""
-    water_level = sensor_data["water_level"]
-    drain_open = sensor_data["drain_status"]
-    
-    # CRITICAL: If water reaches 95%, automatically CLOSE drain
-    if water_level >= 95:
-        if drain_open:
-            sensor_data["drain_status"] = False
-            user_manager.add_notification(user_id, "🚨 EMERGENCY SHUTDOWN", 
-                                f"Water level CRITICAL at {water_level:.1f}%. Drainage CLOSED automatically!", 
-                                "emergency")
-            # Play emergency sound
-            st.markdown(generate_sound_alert("emergency", user_id), unsafe_allow_html=True)
-        
-        # Prevent any further increase in water level
-        sensor_data["water_level"] = min(95, water_level)
-    
-    # If water is between 90-95%, open drain to reduce level
-    elif water_level >= 90 and not drain_open:
-        sensor_data["drain_status"] = True
-        user_manager.add_notification(user_id, "⚠️ High Water Level", 
-                            f"Water level reached {water_level:.1f}%. Drainage automatically OPENED.", 
-                            "warning")
-        # Play warning sound
-        st.markdown(generate_sound_alert("warning", user_id), unsafe_allow_html=True)
-    
-    # If water drops below 30%, close drain to conserve water
-    elif water_level <= 30 and drain_open:
-        sensor_data["drain_status"] = False
-        user_manager.add_notification(user_id, "💧 Low Water Level", 
-                            f"Water level dropped to {water_level:.1f}%. Drainage CLOSED to conserve water.", 
-                            "info")
-        # Play info sound
-        st.markdown(generate_sound_alert("info", user_id), unsafe_allow_html=True)
-    
-    return sensor_data
-
-def simulate_sensor_data(user_id):
-    """Simulate sensor data changes for a user"""
-    conn = sqlite3.connect('smart_agriculture.db')
-    c = conn.cursor()
-    
-    # Get current sensor data
-    c.execute('''SELECT solar_input, battery_level, water_level, drain_status 
-                 FROM sensor_data WHERE user_id = ? ORDER BY last_update DESC LIMIT 1''',
-              (user_id,))
-    result = c.fetchone()
-    
-    if not result:
-        conn.close()
-        return
-    
-    solar_input, battery_level, water_level, drain_status = result
-    
-    # Simulate solar input (based on time of day)
-    current_hour = datetime.now().hour
-    if 6 <= current_hour <= 18:  # Daytime
-        solar_change = random.uniform(-50, 100)
-    else:  # Nighttime
-        solar_change = random.uniform(-100, 20)
-    
-    solar_input = max(0, min(1200, solar_input + solar_change))
-    
-    # Simulate battery level (charges from solar, discharges for operations)
-    battery_discharge = 0.1  # Base discharge rate
-    if solar_input > 500:
-        battery_charge = (solar_input - 500) / 100
-        battery_discharge = -battery_charge
-    
-    battery_level = max(0, min(100, battery_level - battery_discharge + random.uniform(-1, 1)))
-    
-    # Simulate water level changes based on drainage status
-    if drain_status:
-        change = -random.uniform(0.5, 2.0)
-    else:
-        if water_level >= 95:
-            change = 0  # Prevent increase at critical level
-        elif water_level >= 90:
-            change = random.uniform(0.1, 0.5)
-        else:
-            change = random.uniform(0.5, 2.0)
-    
-    water_level = max(0, min(100, water_level + change))
-    
-    # Create updated sensor data
-    updated_data = {
-        "solar_input": solar_input,
-        "battery_level": battery_level,
-        "water_level": water_level,
-        "drain_status": drain_status
-    }
-    
-    # Enforce control logic
-    updated_data = enforce_water_level_control(user_id, updated_data)
-    
-    # Update database
-    user_manager.update_sensor_data(user_id, updated_data)
-    
-    # Add occasional notifications for simulation
-    if random.random() < 0.1:  # 10% chance each update
-        if water_level > 90:
-            user_manager.add_notification(user_id, "High Water Level Warning", 
-                               f"Water level at {water_level:.1f}%.", 
-                               "warning")
-        elif battery_level < 30:
-            user_manager.add_notification(user_id, "Low Battery Warning", 
-                               f"Battery at {battery_level:.0f}%.", 
-                               "warning")
-        elif solar_input < 200:
-            user_manager.add_notification(user_id, "Low Solar Output", 
-                               f"Solar input at {solar_input:.0f}W.", 
-                               "info")
-        elif solar_input > 900:
-            user_manager.add_notification(user_id, "High Solar Output", 
-                               f"Excellent solar generation: {solar_input:.0f}W!", 
-                               "success")
-    
-    conn.close()
-
 def get_water_level_status(level):
     """Get status based on water level"""
     if level >= 95:
@@ -1031,29 +860,22 @@ def create_fallback_admin_viewer():
     """Create a fallback admin interface when log.py fails to load"""
     st.markdown("## 🔧 Fallback Admin Interface")
     
-    conn = sqlite3.connect('smart_agriculture.db')
-    
-    # Users table
-    st.subheader("👥 Users")
-    users_df = pd.read_sql_query("SELECT * FROM users", conn)
-    st.dataframe(users_df, use_container_width=True)
-    
-    # Sensor data
-    st.subheader("📊 Sensor Data")
-    sensor_df = pd.read_sql_query("SELECT * FROM sensor_data", conn)
-    st.dataframe(sensor_df, use_container_width=True)
-    
-    # Notifications
-    st.subheader("🔔 Notifications")
-    notifications_df = pd.read_sql_query("SELECT * FROM notifications", conn)
-    st.dataframe(notifications_df, use_container_width=True)
-    
-    # Water level history
-    st.subheader("💧 Water Level History")
-    water_df = pd.read_sql_query("SELECT * FROM water_level_history", conn)
-    st.dataframe(water_df, use_container_width=True)
-    
-    conn.close()
+    # One keyset page per table, newest first, with an estimated total
+    tables = [
+        ("👥 Users", "users",
+         "SELECT id, username, user_id, farm_name, location, created_at, is_admin FROM users"),
+        ("📊 Sensor Data", "sensor_data", "SELECT * FROM sensor_data"),
+        ("🔔 Notifications", "notifications", "SELECT * FROM notifications"),
+        ("💧 Water Level History", "water_level_history", "SELECT * FROM water_level_history"),
+    ]
+    with db.connection() as conn:
+        for title, table, query in tables:
+            st.subheader(title)
+            current = pagination.pager(f"fallback_{table}", [])
+            page_df, next_cursor = pagination.fetch_page(conn, query, [], [("id", "id")], after=current.after)
+            st.dataframe(page_df, use_container_width=True)
+            pagination.page_controls(current, next_cursor, len(page_df), pagination.estimate_rows(conn, table),
+                                     pagination.PAGE_SIZE, f"fallback_{table}")
     
     # Admin actions
     st.subheader("⚙️ Admin Actions")
@@ -1062,25 +884,16 @@ def create_fallback_admin_viewer():
     with col1:
         if st.button("🔄 Simulate All Sensor Data"):
             with st.spinner("Simulating sensor data for all users..."):
-                conn = sqlite3.connect('smart_agriculture.db')
-                users = conn.execute("SELECT user_id FROM users").fetchall()
-                for user in users:
-                    simulate_sensor_data(user[0])
-                conn.close()
+                simulation.simulate_fleet()
                 st.success("Sensor data simulated for all users!")
                 st.rerun()
     
     with col2:
         if st.button("🗑️ Clear Old Notifications"):
             with st.spinner("Clearing notifications older than 30 days..."):
-                conn = sqlite3.connect('smart_agriculture.db')
                 cutoff_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
-                deleted = conn.execute(
-                    "DELETE FROM notifications WHERE DATE(created_at) < ?", 
-                    (cutoff_date,)
-                ).rowcount
-                conn.commit()
-                conn.close()
+                deleted = db.purge_old_rows(cutoff_date, tables=("notifications",))["notifications"]
+                cache.invalidate_all()
                 st.success(f"Deleted {deleted} old notifications!")
                 st.rerun()
 
@@ -1104,229 +917,183 @@ def show_admin_dashboard():
     with tab1:
         st.markdown("## 📊 System Overview")
         
-        conn = sqlite3.connect('smart_agriculture.db')
-        
-        # Quick stats
+        # Quick stats, precomputed in system_stats
+        counts = stats.values()
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
-            total_users = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
-            st.metric("Total Users", total_users)
+            st.metric("Total Users", counts["users_rows"])
         
         with col2:
-            total_alerts = conn.execute("SELECT COUNT(*) FROM notifications").fetchone()[0]
-            st.metric("Total Alerts", total_alerts)
+            st.metric("Total Alerts", counts["notifications_rows"])
         
         with col3:
-            active_users = conn.execute("""
-                SELECT COUNT(DISTINCT user_id) 
-                FROM sensor_data 
-                WHERE datetime(last_update) > datetime('now', '-24 hours')
-            """).fetchone()[0]
-            st.metric("Active Users (24h)", active_users)
+            st.metric("Active Users (24h)", counts["active_farms_24h"])
         
         with col4:
-            emergencies = conn.execute("""
-                SELECT COUNT(*) 
-                FROM notifications 
-                WHERE notification_type = 'emergency'
-                AND datetime(created_at) > datetime('now', '-7 days')
-            """).fetchone()[0]
-            st.metric("Emergencies (7d)", emergencies)
-        
-        # Recent activity
-        st.markdown("### 🔄 Recent Activity")
-        
-        # Recent notifications
-        recent_notifs = pd.read_sql_query("""
-            SELECT n.*, u.username, u.farm_name
-            FROM notifications n
-            JOIN users u ON n.user_id = u.user_id
-            ORDER BY n.created_at DESC
-            LIMIT 10
-        """, conn)
-        
-        if not recent_notifs.empty:
-            st.dataframe(recent_notifs[['username', 'farm_name', 'title', 'notification_type', 'created_at']], 
-                        use_container_width=True, hide_index=True)
-        else:
-            st.info("No recent notifications")
+            st.metric("Emergencies (7d)", counts["emergencies_7d"])
+        
+        with db.connection() as conn:
+            # Recent activity
+            st.markdown("### 🔄 Recent Activity")
+        
+            # Recent notifications
+            recent_notifs = pd.read_sql_query("""
+                SELECT n.*, u.username, u.farm_name
+                FROM notifications n
+                JOIN users u ON n.user_id = u.user_id
+                ORDER BY n.created_at DESC
+                LIMIT 10
+            """, conn)
+        
+            if not recent_notifs.empty:
+                st.dataframe(recent_notifs[['username', 'farm_name', 'title', 'notification_type', 'created_at']], 
+                            use_container_width=True, hide_index=True)
+            else:
+                st.info("No recent notifications")
         
-        conn.close()
-    
     with tab2:
         st.markdown("## 👥 User Management")
         
-        conn = sqlite3.connect('smart_agriculture.db')
-        
-        # Users table with actions
-        users_df = pd.read_sql_query("""
-            SELECT username, user_id, farm_name, location, created_at, is_admin
-            FROM users
-            ORDER BY created_at DESC
-        """, conn)
+        with db.connection() as conn:
+            # Users table with actions
+            users_df = pd.read_sql_query("""
+                SELECT username, user_id, farm_name, location, created_at, is_admin
+                FROM users
+                ORDER BY created_at DESC
+            """, conn)
         
-        st.dataframe(users_df, use_container_width=True)
+            st.dataframe(users_df, use_container_width=True)
         
-        # User actions
-        st.markdown("### 👤 User Actions")
+            # User actions
+            st.markdown("### 👤 User Actions")
         
-        col_user1, col_user2, col_user3 = st.columns(3)
+            col_user1, col_user2, col_user3 = st.columns(3)
         
-        with col_user1:
-            st.markdown("#### Add New User")
-            with st.form("add_user_form"):
-                new_username = st.text_input("Username")
-                new_password = st.text_input("Password", type="password")
-                new_farm = st.text_input("Farm Name")
-                new_location = st.text_input("Location")
-                is_admin_user = st.checkbox("Admin User")
+            with col_user1:
+                st.markdown("#### Add New User")
+                with st.form("add_user_form"):
+                    new_username = st.text_input("Username")
+                    new_password = st.text_input("Password", type="password")
+                    new_farm = st.text_input("Farm Name")
+                    new_location = st.text_input("Location")
+                    is_admin_user = st.checkbox("Admin User")
                 
-                if st.form_submit_button("Create User"):
-                    if new_username and new_password and new_farm:
-                        success, message = user_manager.create_user(new_username, new_password, new_farm, new_location)
-                        if success:
-                            if is_admin_user:
-                                conn.execute("UPDATE users SET is_admin = 1 WHERE username = ?", (new_username,))
-                                conn.commit()
-                            st.success(f"User '{new_username}' created successfully!")
-                            st.rerun()
+                    if st.form_submit_button("Create User"):
+                        if new_username and new_password and new_farm:
+                            success, message = user_manager.create_user(new_username, new_password, new_farm, new_location)
+                            if success:
+                                if is_admin_user:
+                                    db.execute("UPDATE users SET is_admin = 1 WHERE username = ?", (new_username,))
+                                st.success(f"User '{new_username}' created successfully!")
+                                st.rerun()
+                            else:
+                                st.error(f"Error: {message}")
                         else:
-                            st.error(f"Error: {message}")
-                    else:
-                        st.error("Please fill required fields")
-        
-        with col_user2:
-            st.markdown("#### Send Notification")
-            with st.form("send_notification_form"):
-                target_user = st.selectbox("Select User", users_df['username'].tolist())
-                notif_title = st.text_input("Title")
-                notif_message = st.text_area("Message")
-                notif_type = st.selectbox("Type", ["info", "warning", "success", "emergency"])
+                            st.error("Please fill required fields")
+        
+            with col_user2:
+                st.markdown("#### Send Notification")
+                with st.form("send_notification_form"):
+                    target_user = st.selectbox("Select User", users_df['username'].tolist())
+                    notif_title = st.text_input("Title")
+                    notif_message = st.text_area("Message")
+                    notif_type = st.selectbox("Type", ["info", "warning", "success", "emergency"])
                 
-                if st.form_submit_button("Send Notification"):
-                    if target_user and notif_title:
-                        user_id = users_df[users_df['username'] == target_user]['user_id'].iloc[0]
-                        user_manager.add_notification(user_id, notif_title, notif_message, notif_type)
-                        st.success(f"Notification sent to {target_user}!")
-                        st.rerun()
-                    else:
-                        st.error("Please fill required fields")
+                    if st.form_submit_button("Send Notification"):
+                        if target_user and notif_title:
+                            user_id = users_df[users_df['username'] == target_user]['user_id'].iloc[0]
+                            user_manager.add_notification(user_id, notif_title, notif_message, notif_type)
+                            st.success(f"Notification sent to {target_user}!")
+                            st.rerun()
+                        else:
+                            st.error("Please fill required fields")
         
-        with col_user3:
-            st.markdown("#### System Actions")
+            with col_user3:
+                st.markdown("#### System Actions")
             
-            if st.button("🔄 Simulate All Users Data", use_container_width=True):
-                with st.spinner("Simulating..."):
-                    users = conn.execute("SELECT user_id FROM users").fetchall()
-                    for user in users:
-                        simulate_sensor_data(user[0])
-                    st.success(f"Simulated data for {len(users)} users!")
-                    st.rerun()
+                if st.button("🔄 Simulate All Users Data", use_container_width=True):
+                    with st.spinner("Simulating..."):
+                        summary = simulation.simulate_fleet()
+                        st.success(f"Simulated data for {summary['farms']} users!")
+                        st.rerun()
             
-            if st.button("🗑️ Clean Old Data", use_container_width=True):
-                with st.spinner("Cleaning..."):
-                    cutoff_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
-                    water_count = conn.execute(
-                        "DELETE FROM water_level_history WHERE DATE(created_at) < ?", 
-                        (cutoff_date,)
-                    ).rowcount
-                    notif_count = conn.execute(
-                        "DELETE FROM notifications WHERE DATE(created_at) < ?", 
-                        (cutoff_date,)
-                    ).rowcount
-                    conn.commit()
-                    st.success(f"Cleaned {water_count} water records and {notif_count} notifications!")
-                    st.rerun()
+                if st.button("🗑️ Clean Old Data", use_container_width=True):
+                    with st.spinner("Cleaning..."):
+                        cutoff_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+                        archived = archive.archive_old_rows(cutoff_date)
+                        deleted = db.purge_old_rows(cutoff_date, tables=("notifications",))
+                        cache.invalidate_all()
+                        water_count = archived["water_level_history"]
+                        notif_count = deleted["notifications"]
+                        st.success(f"Archived {water_count} water records and deleted {notif_count} notifications!")
+                        st.rerun()
         
-        conn.close()
-    
     with tab3:
         st.markdown("## 📈 System Analytics")
         
-        conn = sqlite3.connect('smart_agriculture.db')
-        
-        # Chart 1: Users by location
-        st.markdown("### 📍 Users by Location")
-        location_data = pd.read_sql_query("""
-            SELECT location, COUNT(*) as count
-            FROM users
-            GROUP BY location
-            ORDER BY count DESC
-        """, conn)
-        
-        if not location_data.empty:
-            st.bar_chart(location_data.set_index('location')['count'])
-        
-        # Chart 2: Notifications by type
-        st.markdown("### 🔔 Notifications by Type")
-        notif_data = pd.read_sql_query("""
-            SELECT notification_type, COUNT(*) as count
-            FROM notifications
-            WHERE datetime(created_at) > datetime('now', '-30 days')
-            GROUP BY notification_type
-        """, conn)
-        
-        if not notif_data.empty:
-            st.bar_chart(notif_data.set_index('notification_type')['count'])
-        
-        # Chart 3: Active times
-        st.markdown("### ⏰ Activity by Hour")
-        activity_data = pd.read_sql_query("""
-            SELECT strftime('%H', created_at) as hour, COUNT(*) as count
-            FROM notifications
-            WHERE datetime(created_at) > datetime('now', '-7 days')
-            GROUP BY strftime('%H', created_at)
-            ORDER BY hour
-        """, conn)
-        
-        if not activity_data.empty:
-            st.line_chart(activity_data.set_index('hour')['count'])
-        
-        # Data export
-        st.markdown("### 📤 Data Export")
-        
-        col_exp1, col_exp2 = st.columns(2)
-        
-        with col_exp1:
-            if st.button("Export Users Data"):
-                users_df = pd.read_sql_query("SELECT * FROM users", conn)
-                csv = users_df.to_csv(index=False)
-                st.download_button(
-                    label="📥 Download Users CSV",
-                    data=csv,
-                    file_name="users_export.csv",
-                    mime="text/csv"
-                )
-        
-        with col_exp2:
-            if st.button("Export Sensor Data"):
-                sensor_df = pd.read_sql_query("SELECT * FROM sensor_data", conn)
-                csv = sensor_df.to_csv(index=False)
-                st.download_button(
-                    label="📥 Download Sensor CSV",
-                    data=csv,
-                    file_name="sensor_export.csv",
-                    mime="text/csv"
-                )
-        
-        conn.close()
-    
+        with db.connection() as conn:
+            # Chart 1: Users by location
+            st.markdown("### 📍 Users by Location")
+            location_data = pd.read_sql_query("""
+                SELECT location, COUNT(*) as count
+                FROM users
+                GROUP BY location
+                ORDER BY count DESC
+            """, conn)
+        
+            if not location_data.empty:
+                st.bar_chart(location_data.set_index('location')['count'])
+        
+            # Chart 2: Notifications by type
+            st.markdown("### 🔔 Notifications by Type")
+            notif_data = pd.read_sql_query("""
+                SELECT notification_type, COUNT(*) as count
+                FROM notifications
+                WHERE created_at > datetime('now', '-30 days')
+                GROUP BY notification_type
+            """, conn)
+        
+            if not notif_data.empty:
+                st.bar_chart(notif_data.set_index('notification_type')['count'])
+        
+            # Chart 3: Active times
+            st.markdown("### ⏰ Activity by Hour")
+            activity_data = pd.read_sql_query("""
+                SELECT strftime('%H', created_at) as hour, COUNT(*) as count
+                FROM notifications
+                WHERE created_at > datetime('now', '-7 days')
+                GROUP BY strftime('%H', created_at)
+                ORDER BY hour
+            """, conn)
+        
+            if not activity_data.empty:
+                st.line_chart(activity_data.set_index('hour')['count'])
+        
+            # Data export
+            st.markdown("### 📤 Data Export")
+        
+            # Streamed to files chunk by chunk (see export.write_chunks)
+            export.export_controls("analytics_users_export", "users_export",
+                                   lambda: export.table_parts(['users']),
+                                   None, label="Export Users Data")
+            export.export_controls("analytics_sensor_export", "sensor_export",
+                                   lambda: export.table_parts(['sensor_data']),
+                                   None, label="Export Sensor Data")
+        
     with tab4:
         st.markdown("## ⚙️ System Settings")
         
         # Database info
-        conn = sqlite3.connect('smart_agriculture.db')
-        
-        db_size = os.path.getsize('smart_agriculture.db') / (1024 * 1024)  # MB
+        db_size = os.path.getsize(db.DB_PATH) / (1024 * 1024)  # MB
         
         st.metric("Database Size", f"{db_size:.2f} MB")
         
-        # Table sizes
+        # Table sizes, kept in system_stats as rows are written
+        counts = stats.values()
         tables = ['users', 'sensor_data', 'notifications', 'water_level_history']
         for table in tables:
-            count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
-            st.metric(f"{table.replace('_', ' ').title()}", f"{count:,}")
+            st.metric(f"{table.replace('_', ' ').title()}", f"{counts[f'{table}_rows']:,}")
         
         # System info
         st.markdown("### ℹ️ System Information")
@@ -1339,20 +1106,79 @@ def show_admin_dashboard():
             st.info(f"**Pandas Version:** {pd.__version__}")
         
         with info_col2:
-            st.info(f"**Database Path:** {os.path.abspath('smart_agriculture.db')}")
+            st.info(f"**Database Path:** {os.path.abspath(db.DB_PATH)}")
             st.info(f"**Current Directory:** {os.getcwd()}")
             st.info(f"**System Time:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        
-        conn.close()
-        
+
+        # Schema migrations
+        st.markdown("### 🗂️ Schema Migrations")
+        migration_df = pd.DataFrame(migrations.applied_migrations(), columns=['Version', 'Migration', 'Applied At'])
+        st.dataframe(migration_df, use_container_width=True, hide_index=True)
+        pending = migrations.pending_migrations()
+        if pending:
+            st.warning(f"{len(pending)} migration(s) pending: " + ", ".join(name for _, name, _ in pending))
+
+        # Background simulation
+        st.markdown("### ⏱️ Background Simulation")
+        sim_status = simulation.scheduler_status()
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Status", "Running" if sim_status["running"] else "Stopped")
+        with col2:
+            st.metric("Tick Interval", f"{sim_status['interval']:.0f}s")
+        with col3:
+            st.metric("Ticks", sim_status["ticks"])
+        with col4:
+            last_duration = sim_status["last_duration"]
+            st.metric("Last Tick", f"{last_duration * 1000:.0f} ms" if last_duration is not None else "N/A")
+        if sim_status["missed"]:
+            st.warning(f"{sim_status['missed']} tick(s) skipped because a tick overran the interval.")
+        if sim_status["last_error"]:
+            st.error(f"Last tick failed: {sim_status['last_error']}")
+
+        # Read cache
+        st.markdown("### 🧠 Read Cache")
+        cache_cols = st.columns(len(cache.stats()))
+        for col, (name, cache_stats) in zip(cache_cols, cache.stats().items()):
+            with col:
+                st.metric(f"{name.title()} Hit Rate", f"{cache_stats['hit_rate']:.0%}",
+                          help=f"{cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                               f"{cache_stats['entries']} cached users")
+
+        # Storage policy
+        st.markdown("### 🗜️ Reading Storage")
+        policy_cols = st.columns(len(readings.policy_stats()))
+        for col, (name, policy_stats) in zip(policy_cols, readings.policy_stats().items()):
+            with col:
+                st.metric(f"{name.title()} Rows Skipped", f"{policy_stats['reduction']:.0%}",
+                          help=f"{policy_stats['stored']} of {policy_stats['offered']} readings stored "
+                               f"(deadband, {readings.HEARTBEAT_SECONDS}s heartbeat)")
+
+        archive_stats = archive.stats()
+        if archive_stats:
+            archive_cols = st.columns(len(archive_stats))
+            for col, (table, table_stats) in zip(archive_cols, archive_stats.items()):
+                with col:
+                    st.metric(f"Archived {table}", f"{table_stats['rows']:,} rows",
+                              help=f"{table_stats['segments']} segments, "
+                                   f"{table_stats['bytes'] / 1024:.0f} KiB in {archive.archive_dir()}")
+
         # Danger zone
         st.markdown("### ⚠️ Danger Zone")
         
         with st.expander("Reset Database (⚠️ Irreversible)"):
             st.warning("This will delete ALL data and reset the database to initial state.")
             if st.button("🗑️ Reset Database", type="secondary"):
-                os.remove('smart_agriculture.db')
-                init_db()
+                simulation.stop_scheduler()
+                # Dropped through SQLite: removing the file would leave its -wal
+                # and -shm behind and pooled connections on the old inode
+                migrations.reset()
+                archive.clear()
+                cache.invalidate_all()
+                readings.reset_policies()
+                timeseries.store().clear()
+                timeseries.ensure_warm()
+                simulation.ensure_scheduler()
                 st.success("Database reset complete!")
                 st.rerun()
     
@@ -1450,6 +1276,10 @@ if user_info is None:
     st.stop()
 
 user_id = user_info["user_id"]
+
+# Recent readings for this farm from the in-memory store, oldest first
+recent_times, recent_readings = timeseries.store().window(user_id)
+recent_index = pd.to_datetime(recent_times, unit="s")
 farm_name = user_info["farm_name"]
 location = user_info["location"]
 is_admin = user_info.get("is_admin", False)
@@ -1705,30 +1535,19 @@ if is_admin:
     with tab1:
         st.markdown("## 📊 System Quick Statistics")
         
-        conn = sqlite3.connect('smart_agriculture.db')
-        
-        # Get system stats
-        total_users = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
-        total_sensor_records = conn.execute("SELECT COUNT(*) FROM sensor_data").fetchone()[0]
-        total_notifications = conn.execute("SELECT COUNT(*) FROM notifications").fetchone()[0]
-        total_water_readings = conn.execute("SELECT COUNT(*) FROM water_level_history").fetchone()[0]
+        # Get system stats, precomputed in system_stats; sensor records are
+        # the readings log, sensor_data only holds each farm's current state
+        counts = stats.values()
+        total_users = counts["users_rows"]
+        total_sensor_records = counts["sensor_readings_rows"]
+        total_notifications = counts["notifications_rows"]
+        total_water_readings = counts["water_level_history_rows"]
         
-        # Get active users (users with sensor data in last 24 hours)
-        active_users = conn.execute("""
-            SELECT COUNT(DISTINCT user_id) 
-            FROM sensor_data 
-            WHERE datetime(last_update) > datetime('now', '-1 day')
-        """).fetchone()[0]
+        # Active users (users with sensor data in last 24 hours)
+        active_users = counts["active_farms_24h"]
         
-        # Get emergency count
-        emergency_count = conn.execute("""
-            SELECT COUNT(*) 
-            FROM notifications 
-            WHERE notification_type = 'emergency' 
-            AND datetime(created_at) > datetime('now', '-7 days')
-        """).fetchone()[0]
-        
-        conn.close()
+        # Emergency count
+        emergency_count = counts["emergencies_7d"]
         
         # Display metrics
         col1, col2, col3 = st.columns(3)
@@ -1737,7 +1556,7 @@ if is_admin:
             st.metric("Active Users (24h)", active_users)
         with col2:
             st.metric("Sensor Records", total_sensor_records)
-            st.metric("Water Readings", total_water_readings)
+            st.metric("Stored Water Samples", total_water_readings)
         with col3:
             st.metric("Notifications", total_notifications)
             st.metric("Emergencies (7d)", emergency_count)
@@ -1745,26 +1564,23 @@ if is_admin:
         # Quick data preview
         st.markdown("### 🔍 Recent Activity")
         
-        conn = sqlite3.connect('smart_agriculture.db')
-        
-        # Recent users
-        recent_users = pd.read_sql_query("""
-            SELECT username, farm_name, location, created_at 
-            FROM users 
-            ORDER BY created_at DESC 
-            LIMIT 5
-        """, conn)
-        
-        # Recent notifications
-        recent_notifications = pd.read_sql_query("""
-            SELECT n.title, n.message, n.notification_type, u.username, n.created_at
-            FROM notifications n
-            LEFT JOIN users u ON n.user_id = u.user_id
-            ORDER BY n.created_at DESC 
-            LIMIT 5
-        """, conn)
+        with db.connection() as conn:
+            # Recent users
+            recent_users = pd.read_sql_query("""
+                SELECT username, farm_name, location, created_at 
+                FROM users 
+                ORDER BY created_at DESC 
+                LIMIT 5
+            """, conn)
         
-        conn.close()
+            # Recent notifications
+            recent_notifications = pd.read_sql_query("""
+                SELECT n.title, n.message, n.notification_type, u.username, n.created_at
+                FROM notifications n
+                LEFT JOIN users u ON n.user_id = u.user_id
+                ORDER BY n.created_at DESC 
+                LIMIT 5
+            """, conn)
         
         col1, col2 = st.columns(2)
         with col1:
@@ -1785,76 +1601,44 @@ if is_admin:
             
             if st.button("🔄 Refresh All Data", use_container_width=True):
                 with st.spinner("Refreshing all sensor data..."):
-                    conn = sqlite3.connect('smart_agriculture.db')
-                    users = conn.execute("SELECT user_id FROM users").fetchall()
-                    for user in users:
-                        simulate_sensor_data(user[0])
-                    conn.close()
+                    simulation.simulate_fleet()
                     st.success("All sensor data refreshed!")
                     st.rerun()
             
             if st.button("🗑️ Clean Old Data", use_container_width=True, type="secondary"):
                 with st.spinner("Cleaning up old data..."):
-                    conn = sqlite3.connect('smart_agriculture.db')
                     cutoff_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
                     
-                    # Count records to be deleted
-                    water_count = conn.execute(
-                        "SELECT COUNT(*) FROM water_level_history WHERE DATE(created_at) < ?", 
-                        (cutoff_date,)
-                    ).fetchone()[0]
-                    
-                    notification_count = conn.execute(
-                        "SELECT COUNT(*) FROM notifications WHERE DATE(created_at) < ?", 
-                        (cutoff_date,)
-                    ).fetchone()[0]
+                    # Sensor history moves to the archive; old notifications are dropped
+                    archived = archive.archive_old_rows(cutoff_date)
+                    deleted = db.purge_old_rows(cutoff_date, tables=("notifications",))
+                    cache.invalidate_all()
+                    water_count = archived["water_level_history"]
+                    notification_count = deleted["notifications"]
                     
-                    # Delete old data
-                    conn.execute("DELETE FROM water_level_history WHERE DATE(created_at) < ?", (cutoff_date,))
-                    conn.execute("DELETE FROM notifications WHERE DATE(created_at) < ?", (cutoff_date,))
-                    conn.commit()
-                    conn.close()
-                    
-                    st.success(f"Cleaned up {water_count} water history records and {notification_count} notifications older than 30 days.")
+                    st.success(f"Archived {water_count} water history records and deleted {notification_count} notifications older than 30 days.")
                     st.rerun()
             
-            if st.button("📊 Export All Data", use_container_width=True):
-                with st.spinner("Preparing data export..."):
-                    conn = sqlite3.connect('smart_agriculture.db')
-                    
-                    # Export all tables
-                    tables = ['users', 'sensor_data', 'notifications', 'water_level_history']
-                    export_data = {}
-                    
-                    for table in tables:
-                        df = pd.read_sql_query(f"SELECT * FROM {table}", conn)
-                        export_data[table] = df.to_dict('records')
-                    
-                    conn.close()
-                    
-                    # Create JSON export
-                    import json
-                    export_json = json.dumps(export_data, indent=2, default=str)
-                    
-                    st.download_button(
-                        label="📥 Download Full Export",
-                        data=export_json,
-                        file_name=f"agriculture_full_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                        mime="application/json",
-                        use_container_width=True
-                    )
+            # Every table streamed to its own file and bundled into one zip;
+            # archived history follows the live rows
+            export.export_controls("admin_full_export", "agriculture_full_export",
+                                   lambda: export.table_parts(['users', 'sensor_data', 'sensor_readings',
+                                                               'notifications', 'water_level_history']),
+                                   None, label="📊 Export All Data")
+            
+            # Only the rows changed since the warehouse last synced
+            export.change_controls("warehouse", "admin_change_export")
         
         with col2:
             st.markdown("### User Management")
             
             # View all users
-            conn = sqlite3.connect('smart_agriculture.db')
-            all_users = pd.read_sql_query("""
-                SELECT username, user_id, farm_name, location, created_at, is_admin
-                FROM users
-                ORDER BY created_at DESC
-            """, conn)
-            conn.close()
+            with db.connection() as conn:
+                all_users = pd.read_sql_query("""
+                    SELECT username, user_id, farm_name, location, created_at, is_admin
+                    FROM users
+                    ORDER BY created_at DESC
+                """, conn)
             
             st.dataframe(all_users, use_container_width=True, height=200)
             
@@ -1872,10 +1656,7 @@ if is_admin:
                             success, message = user_manager.create_user(new_username, new_password, new_farm, new_location)
                             if success:
                                 if make_admin:
-                                    conn = sqlite3.connect('smart_agriculture.db')
-                                    conn.execute("UPDATE users SET is_admin = 1 WHERE username = ?", (new_username,))
-                                    conn.commit()
-                                    conn.close()
+                                    db.execute("UPDATE users SET is_admin = 1 WHERE username = ?", (new_username,))
                                 st.success(f"User '{new_username}' created successfully!")
                                 st.rerun()
                             else:
@@ -1886,44 +1667,18 @@ if is_admin:
     with tab3:
         st.markdown("## 📈 System Health Monitor")
         
-        conn = sqlite3.connect('smart_agriculture.db')
-        
         # System health metrics
         # Database size
-        db_size = os.path.getsize('smart_agriculture.db') / (1024 * 1024)  # MB
-        
-        # Table sizes
-        table_sizes = {}
-        tables = ['users', 'sensor_data', 'notifications', 'water_level_history']
-        for table in tables:
-            count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
-            table_sizes[table] = count
-        
-        # Recent activity
-        recent_activity = pd.read_sql_query("""
-            SELECT 
-                'sensor_data' as table_name,
-                COUNT(*) as record_count,
-                MAX(last_update) as last_update
-            FROM sensor_data
-            WHERE datetime(last_update) > datetime('now', '-1 day')
-            UNION ALL
-            SELECT 
-                'notifications' as table_name,
-                COUNT(*) as record_count,
-                MAX(created_at) as last_update
-            FROM notifications
-            WHERE datetime(created_at) > datetime('now', '-1 day')
-            UNION ALL
-            SELECT 
-                'water_level_history' as table_name,
-                COUNT(*) as record_count,
-                MAX(created_at) as last_update
-            FROM water_level_history
-            WHERE datetime(created_at) > datetime('now', '-1 day')
-        """, conn)
-        
-        conn.close()
+        db_size = os.path.getsize(db.DB_PATH) / (1024 * 1024)  # MB
+        
+        # Table sizes and recent activity, precomputed in system_stats
+        counts = stats.values()
+        table_sizes = {table: counts[f"{table}_rows"] for table in stats.TABLES}
+        recent_activity = pd.DataFrame({
+            'table_name': ['sensor_data', 'notifications', 'water_level_history'],
+            'record_count': [counts["active_farms_24h"], counts["notifications_24h"],
+                             counts["water_readings_24h"]],
+        })
         
         # Display metrics
         col1, col2, col3 = st.columns(3)
@@ -1931,10 +1686,10 @@ if is_admin:
             st.metric("Database Size", f"{db_size:.2f} MB")
             st.metric("Users Table", f"{table_sizes['users']:,}")
         with col2:
-            st.metric("Sensor Records", f"{table_sizes['sensor_data']:,}")
+            st.metric("Sensor Records", f"{table_sizes['sensor_readings']:,}")
             st.metric("Notifications", f"{table_sizes['notifications']:,}")
         with col3:
-            st.metric("Water Readings", f"{table_sizes['water_level_history']:,}")
+            st.metric("Stored Water Samples", f"{table_sizes['water_level_history']:,}")
             st.metric("System Uptime", "99.8%")
         
         # Recent activity chart
@@ -2115,12 +1870,16 @@ else:
         safe_st_folium(m, height=300)
         
         # Water Level History Chart
-        st.markdown("### 📈 Water Level History (Last 24 hours)")
+        st.markdown("### 📈 Water Level History (Recent Readings)")
         
         history = user_data.get("water_level_history", [])
-        if history:
-            history_df = pd.DataFrame(history)
-            st.line_chart(history_df.set_index('time')['level'], height=250)
+        if len(recent_times) > 1 or history:
+            if len(recent_times) > 1:
+                st.line_chart(pd.Series(recent_readings["water_level"], index=recent_index,
+                                        name="level").dropna(), height=250)
+            else:
+                history_df = pd.DataFrame(history)
+                st.line_chart(history_df.set_index('time')['level'], height=250)
             
             st.markdown("""
             <div style="background: #f8f9fa; padding: 10px; border-radius: 10px; margin-top: 10px;">
@@ -2137,6 +1896,12 @@ else:
     with tab3:
         st.markdown("## 🔋 Power & Energy Management")
         
+        # Last 24 hours of stored readings in 5-minute buckets
+        with db.connection() as conn:
+            power_times, power_curves = readings.channel_curves(conn, user_id)
+        power_index = pd.to_datetime(power_times, unit="s")
+        solar_energy = readings.energy_kwh(power_times, power_curves["solar_input"])
+        
         col_power1, col_power2 = st.columns(2)
         
         with col_power1:
@@ -2168,7 +1933,7 @@ else:
                 <div style="margin-bottom: 8px;">
                     <div style="display: flex; justify-content: space-between;">
                         <span>Daily Production:</span>
-                        <span><b>{(sensor_data['solar_input'] * 12 / 1000):.1f} kWh</b></span>
+                        <span><b>{solar_energy:.1f} kWh</b></span>
                     </div>
                 </div>
                 <div>
@@ -2242,23 +2007,21 @@ else:
         # Power Visualization Charts
         st.markdown("### 📊 Power Visualization")
         
-        # Create solar power data visualization
-        solar_data = pd.DataFrame({
-            'Hour': list(range(24)),
-            'Power': [max(0, sensor_data["solar_input"] * (0.2 + 0.8 * (1 - abs(h - 12)/12))) + random.uniform(-50, 50) for h in range(24)]
-        })
-        
-        st.subheader("☀️ Solar Power Generation (24-hour simulation)")
-        st.line_chart(solar_data.set_index('Hour')['Power'], height=200)
+        # Recorded solar and battery readings; empty buckets are gaps
+        solar_series = pd.Series(power_curves["solar_input"], index=power_index, name="Power").dropna()
+        battery_series = pd.Series(power_curves["battery_level"], index=power_index, name="Level").dropna()
         
-        # Create battery level trend
-        battery_trend = pd.DataFrame({
-            'Time': [f"{h}:00" for h in range(24)],
-            'Level': [max(0, min(100, sensor_data["battery_level"] + random.uniform(-5, 5))) for _ in range(24)]
-        })
+        st.subheader("☀️ Solar Power Generation (Last 24 Hours)")
+        if len(solar_series) > 1:
+            st.line_chart(solar_series, height=200)
+        else:
+            st.info("Solar readings will appear after the next system updates.")
         
-        st.subheader("🔋 Battery Level Trend")
-        st.line_chart(battery_trend.set_index('Time')['Level'], height=200)
+        st.subheader("🔋 Battery Level Trend (Last 24 Hours)")
+        if len(battery_series) > 1:
+            st.line_chart(battery_series, height=200)
+        else:
+            st.info("Battery readings will appear after the next system updates.")
         
         # Power Consumption Analysis
         st.markdown("### ⚡ Power Consumption Analysis")
@@ -2289,8 +2052,7 @@ else:
             st.metric("System Efficiency", f"{system_efficiency}%", f"+{random.randint(1, 3)}%")
         
         with col_eff2:
-            energy_saved = random.randint(20, 40)
-            st.metric("Energy Saved", f"{energy_saved} kWh", "Today")
+            st.metric("Solar Energy", f"{solar_energy:.1f} kWh", "Last 24 hours")
         
         with col_eff3:
             co2_reduced = random.randint(15, 30)
@@ -2475,25 +2237,41 @@ with footer_col2:
 with footer_col3:
     st.markdown(f"<small>📍 <b>Farm:</b> {farm_name}, {location}</small>", unsafe_allow_html=True)
 
-# ------------------ AUTO SIMULATION ------------------
-# Simulate sensor data changes automatically
+# ------------------ AUTO REFRESH ------------------
+# The background scheduler advances the simulation; dashboards only re-read it,
+# and only once a table they show has changed since the last refresh
+dashboard_versions = db.table_versions(DASHBOARD_TABLES)
 if f"last_update_{user_id}" not in st.session_state:
     st.session_state[f"last_update_{user_id}"] = time.time()
+    st.session_state[f"seen_versions_{user_id}"] = dashboard_versions
+
+# Sound each alert the scheduler's control logic raises for this farm once;
+# alerts from before the session opened stay quiet
+latest_alert = simulation.latest_alert(user_id) or (None, None)
+if f"alert_tick_{user_id}" not in st.session_state:
+    st.session_state[f"alert_tick_{user_id}"] = latest_alert[0]
+elif latest_alert[0] != st.session_state[f"alert_tick_{user_id}"]:
+    st.session_state[f"alert_tick_{user_id}"] = latest_alert[0]
+    st.markdown(generate_sound_alert(latest_alert[1], user_id), unsafe_allow_html=True)
 
 current_time = time.time()
-if current_time - st.session_state[f"last_update_{user_id}"] > 5:  # Update every 5 seconds
-    simulate_sensor_data(user_id)
+if current_time - st.session_state[f"last_update_{user_id}"] > simulation.TICK_SECONDS:
     st.session_state[f"last_update_{user_id}"] = current_time
-    st.rerun()
+    if st.session_state.get(f"seen_versions_{user_id}") != dashboard_versions:
+        st.session_state[f"seen_versions_{user_id}"] = dashboard_versions
+        st.rerun()
 
 # Add manual refresh button
 if st.sidebar.button("🔄 Refresh Sensor Data", use_container_width=True):
-    simulate_sensor_data(user_id)
     st.rerun()
 
 # Display system status in sidebar
 st.sidebar.markdown("---")
-if sensor_data["water_level"] >= 95:
+# Newest reading from the in-memory store, falling back to the cached row
+latest_reading = timeseries.store().latest(user_id) or {}
+status_data = dict(sensor_data, **{metric: value for metric, value in latest_reading.items()
+                                   if metric in timeseries.METRICS and not np.isnan(value)})
+if status_data["water_level"] >= 95:
     status_bg = "#ffe6e6"
     status_border = "#ff0000"
 else:
@@ -2506,19 +2284,15 @@ st.sidebar.markdown(f"""
                 border-radius: 10px; 
                 border-left: 4px solid {status_border};">
     <small><b>System Status</b></small><br>
-    <small>Water: <b>{sensor_data['water_level']:.1f}%</b></small><br>
-    <small>Solar: <b>{sensor_data['solar_input']:.0f}W</b></small><br>
-    <small>Battery: <b>{sensor_data['battery_level']:.0f}%</b></small><br>
-    <small>Drain: <b>{'🔓 OPEN' if sensor_data['drain_status'] else '🔒 CLOSED'}</b></small>
+    <small>Water: <b>{status_data['water_level']:.1f}%</b></small><br>
+    <small>Solar: <b>{status_data['solar_input']:.0f}W</b></small><br>
+    <small>Battery: <b>{status_data['battery_level']:.0f}%</b></small><br>
+    <small>Drain: <b>{'🔓 OPEN' if status_data['drain_status'] else '🔒 CLOSED'}</b></small>
 </div>
 """, unsafe_allow_html=True)
 
 # Database info in sidebar
-conn = sqlite3.connect('smart_agriculture.db')
-c = conn.cursor()
-c.execute("SELECT COUNT(*) FROM users")
-user_count = c.fetchone()[0]
-conn.close()
+user_count = stats.values()["users_rows"]
 
 st.sidebar.markdown(f"""
 <div style="background: #f8f9fa; padding: 10px; border-radius: 10px; margin-top: 10px;">
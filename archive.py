@@ -0,0 +1,512 @@
+"""Columnar archive tier for cold sensor history.
+
+archive_old_rows() moves water_level_history and sensor_readings rows older
+than a cutoff out of SQLite into segments: one segment per table, month and
+farm, holding one .npy file per column sorted by time. A run that archives
+more rows of a farm and month rewrites its segment with the old and new rows
+together, so the segment count stays at one per farm and month however many
+runs there are. manifest.json lists every segment with its farm and time
+span, and is indexed by table and farm when loaded. Columns are compressed with the
+codecs in codec.py and decoded whole when a read overlaps the segment; with
+AGRIGURD_ARCHIVE_COMPRESS=0 they are stored as plain arrays, which reads open
+with np.load(mmap_mode="r") and binary-search on ts.
+
+    python archive.py          # list archived segments
+    python archive.py 30       # archive history older than 30 days
+
+Segments are written and listed in the manifest before the rows are deleted
+from the database. A run interrupted in between archives the same rows again
+next time, and merging them into the segment drops the duplicates. Files a
+rewritten segment replaces stay on disk, listed as retired, until the next
+run, so reads that loaded the manifest before the rewrite still find them.
+"""
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import changes
+import codec
+import database as db
+
+# Defaults to a directory next to the database file
+ARCHIVE_DIR = os.environ.get("AGRIGURD_ARCHIVE_DIR")
+
+# Compress new segments (segments already written keep their format)
+COMPRESS = os.environ.get("AGRIGURD_ARCHIVE_COMPRESS", "1") != "0"
+
+MANIFEST = "manifest.json"
+
+# Rows read from the database at a time while archiving
+CHUNK_ROWS = int(os.environ.get("AGRIGURD_ARCHIVE_CHUNK_ROWS", "200000"))
+
+# Decoded columns kept in memory, in bytes; the least recently read go first
+DECODED_CACHE_BYTES = int(os.environ.get("AGRIGURD_ARCHIVE_CACHE_MB", "128")) * 2 ** 20
+
+# Per table: the time of its oldest row, its rows in a [start, end) range of
+# dates and the delete that removes them, the archived columns with their
+# dtypes and codecs, the column that tells rows of a farm apart, and the
+# column whose maximum bounds the delete
+TABLES = {
+    "water_level_history": {
+        "oldest": "SELECT MIN(created_at) FROM water_level_history",
+        "select": '''SELECT user_id, id, CAST(strftime('%s', created_at) AS INTEGER) AS ts, water_level
+                     FROM water_level_history WHERE created_at >= ? AND created_at < ?
+                     ORDER BY user_id, created_at, id''',
+        "delete": "DELETE FROM water_level_history WHERE created_at >= ? AND created_at < ? AND id <= ?",
+        "columns": {"ts": "<i8", "id": "<i8", "water_level": "<f8"},
+        "codecs": {"ts": "dod", "id": "delta", "water_level": "xor"},
+        "key": "id",
+        "bound": "id",
+    },
+    "sensor_readings": {
+        # Fixed-point integers, as stored in the table (see readings.SCALES)
+        "oldest": "SELECT datetime(MIN(ts), 'unixepoch') FROM sensor_readings",
+        "select": '''SELECT user_id, ts, solar_input, battery_level, water_level, drain_status
+                     FROM sensor_readings
+                     WHERE ts >= CAST(strftime('%s', ?) AS INTEGER) AND ts < CAST(strftime('%s', ?) AS INTEGER)
+                     ORDER BY user_id, ts''',
+        "delete": '''DELETE FROM sensor_readings
+                     WHERE ts >= CAST(strftime('%s', ?) AS INTEGER) AND ts < CAST(strftime('%s', ?) AS INTEGER)''',
+        "columns": {"ts": "<i8", "solar_input": "<i4", "battery_level": "<i4",
+                    "water_level": "<i4", "drain_status": "<i1"},
+        "codecs": {"ts": "dod", "solar_input": "delta", "battery_level": "delta",
+                   "water_level": "delta", "drain_status": "delta"},
+        "key": "ts",
+        "bound": None,
+    },
+}
+
+_lock = threading.Lock()
+_manifest_cache = {}
+_decoded_lock = threading.Lock()
+_decoded_cache = OrderedDict()
+_decoded_bytes = 0
+
+
+def archive_dir():
+    return ARCHIVE_DIR or os.path.splitext(db.DB_PATH)[0] + "_archive"
+
+
+# ------------------ MANIFEST ------------------
+def _manifest_path():
+    return os.path.join(archive_dir(), MANIFEST)
+
+
+def _index(manifest):
+    # Segments by (table, farm) and by table, each sorted by start
+    by_farm, by_table = {}, {}
+    for segment in manifest["segments"]:
+        by_farm.setdefault((segment["table"], segment["user_id"]), []).append(segment)
+        by_table.setdefault(segment["table"], []).append(segment)
+    for group in list(by_farm.values()) + list(by_table.values()):
+        group.sort(key=lambda segment: segment["start"])
+    return by_farm, by_table
+
+
+def _load():
+    # (manifest, index), re-read only when the file changes
+    path = _manifest_path()
+    try:
+        stamp = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        manifest = {"segments": []}
+        return manifest, _index(manifest)
+    cached = _manifest_cache.get(path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    loaded = _manifest_cache[path] = (stamp, (manifest, _index(manifest)))
+    return loaded[1]
+
+
+def load_manifest():
+    """The manifest as {"segments": [...], "retired": [...]}"""
+    return _load()[0]
+
+
+def _save_manifest(manifest):
+    # Readers never see a half-written manifest
+    path = _manifest_path()
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, path)
+
+
+def segments(table=None, user_id=None):
+    """Manifest entries, optionally only those of one table and farm, oldest first"""
+    manifest, (by_farm, by_table) = _load()
+    if table is None:
+        return [s for s in manifest["segments"] if user_id is None or s["user_id"] == user_id]
+    if user_id is None:
+        return by_table.get(table, [])
+    return by_farm.get((table, user_id), [])
+
+
+# ------------------ WRITING ------------------
+def _month(text):
+    return datetime.strptime(text[:7], "%Y-%m")
+
+
+def _months(table, cutoff_date):
+    # [start, end) date ranges of one calendar month each, from the month of
+    # the table's oldest row up to the cutoff
+    with db.connection() as conn:
+        oldest = conn.execute(TABLES[table]["oldest"]).fetchone()[0]
+    if oldest is None or oldest >= cutoff_date:
+        return []
+    ranges, month = [], _month(oldest)
+    while month.strftime('%Y-%m-%d') < cutoff_date:
+        following = (month + timedelta(days=32)).replace(day=1)
+        ranges.append((month.strftime('%Y-%m-%d'), min(following.strftime('%Y-%m-%d'), cutoff_date)))
+        month = following
+    return ranges
+
+
+def _segment_frame(table, segment):
+    # Every row of a segment, decoded into memory
+    frame = pd.DataFrame({column: np.array(_column(table, segment, column))
+                          for column in TABLES[table]["columns"]})
+    frame.insert(0, "user_id", segment["user_id"])
+    return frame
+
+
+def _write_segment(table, user_id, month, group):
+    # New files for one farm and month; never over an existing segment's
+    spec = TABLES[table]
+    root = archive_dir()
+    folder = os.path.join(table, month)
+    os.makedirs(os.path.join(root, folder), exist_ok=True)
+    base = f"{re.sub(r'[^A-Za-z0-9_-]', '_', user_id)}-{uuid.uuid4().hex[:8]}"
+    files = {}
+    for column, dtype in spec["columns"].items():
+        files[column] = os.path.join(folder, f"{base}.{column}.npy")
+        values = group[column].fillna(0).to_numpy().astype(dtype)
+        if COMPRESS:
+            values = codec.encode(spec["codecs"][column], values)
+        np.save(os.path.join(root, files[column]), values)
+    segment = {
+        "table": table,
+        "user_id": user_id,
+        "month": month,
+        "rows": len(group),
+        "start": int(group["ts"].iat[0]),
+        "end": int(group["ts"].iat[-1]),
+        # Lets rows_by_key() skip segments that cannot hold a key
+        "keys": [int(group[spec["key"]].min()), int(group[spec["key"]].max())],
+        "files": files,
+    }
+    if COMPRESS:
+        segment["codecs"] = spec["codecs"]
+    return segment
+
+
+def _merge_segments(table, frame, current, retired):
+    """Fold ``frame`` into the one segment per farm and month in ``current``
+
+    ``current`` maps (user_id, month) to that farm's segments of the month
+    (more than one only in archives written before segments were merged).
+    A farm and month that already has segments is rewritten as one segment
+    holding the old and new rows; the files it replaces go to ``retired``.
+    """
+    spec = TABLES[table]
+    months = pd.to_datetime(frame["ts"], unit="s").dt.strftime("%Y-%m")
+    for (user_id, month), group in frame.groupby([frame["user_id"], months], sort=False):
+        old = current.get((user_id, month), [])
+        if old:
+            group = pd.concat([_segment_frame(table, segment) for segment in old] + [group],
+                              ignore_index=True)
+            # Rows an interrupted run archived already are kept once
+            group = group.drop_duplicates(["user_id", spec["key"]])
+        group = group.sort_values(["ts", spec["key"]], kind="stable", ignore_index=True)
+        current[(user_id, month)] = [_write_segment(table, user_id, month, group)]
+        retired.extend(path for segment in old for path in segment["files"].values())
+
+
+def _remove_retired(manifest):
+    # Files replaced by an earlier run; readers have long moved to the new ones
+    root = archive_dir()
+    for path in manifest.get("retired", []):
+        try:
+            os.remove(os.path.join(root, path))
+        except FileNotFoundError:
+            pass
+    return {"segments": manifest["segments"], "retired": []}
+
+
+def archive_old_rows(cutoff_date, tables=tuple(TABLES)):
+    """Move rows created before ``cutoff_date`` into the archive
+
+    Rows are read one calendar month and CHUNK_ROWS rows at a time, ordered
+    by farm, and each month's rows are deleted from the database once its
+    segments are listed in the manifest. Returns the number of rows archived
+    per table.
+    """
+    archived = {}
+    with _lock:
+        os.makedirs(archive_dir(), exist_ok=True)
+        manifest = _remove_retired(load_manifest())
+        _save_manifest(manifest)
+        for table in tables:
+            spec = TABLES[table]
+            archived[table] = 0
+            for start, end in _months(table, cutoff_date):
+                current, untouched, retired, rows, bound = {}, [], [], 0, None
+                for segment in manifest["segments"]:
+                    if segment["table"] == table and segment["month"] == start[:7]:
+                        current.setdefault((segment["user_id"], segment["month"]), []).append(segment)
+                    else:
+                        untouched.append(segment)
+                with db.connection() as conn:
+                    for frame in pd.read_sql_query(spec["select"], conn, params=(start, end),
+                                                   chunksize=CHUNK_ROWS):
+                        if frame.empty:
+                            # pandas yields one empty frame for a month with no rows
+                            continue
+                        _merge_segments(table, frame, current, retired)
+                        rows += len(frame)
+                        if spec["bound"]:
+                            bound = max(bound or 0, int(frame[spec["bound"]].max()))
+                if not rows:
+                    continue
+                manifest = {"segments": untouched + [s for group in current.values() for s in group],
+                            "retired": manifest["retired"] + retired}
+                _save_manifest(manifest)
+                archived[table] += rows
+
+                # Rows that arrived after the select are newer than anything archived
+                params = (start, end) + ((bound,) if spec["bound"] else ())
+
+                def delete(conn, table=table, params=params):
+                    # Change feed consumers see the rows as moved, not deleted
+                    seq = changes.last_seq(conn)
+                    conn.execute(TABLES[table]["delete"], params)
+                    changes.mark_archived(conn, table, seq)
+                db.write(delete)
+    return archived
+
+
+def clear():
+    """Delete every archived segment"""
+    with _lock:
+        shutil.rmtree(archive_dir(), ignore_errors=True)
+        _manifest_cache.clear()
+        _clear_decoded()
+
+
+# ------------------ READING ------------------
+def _open(path):
+    return np.load(os.path.join(archive_dir(), path), mmap_mode="r")
+
+
+def _decoded(path, kind, dtype):
+    # Segment files are never rewritten, so a path always decodes the same
+    global _decoded_bytes
+    key = (path, kind, dtype)
+    with _decoded_lock:
+        values = _decoded_cache.get(key)
+        if values is not None:
+            _decoded_cache.move_to_end(key)
+            return values
+    values = codec.decode(kind, np.load(path), dtype)
+    with _decoded_lock:
+        if key not in _decoded_cache:
+            _decoded_cache[key] = values
+            _decoded_bytes += values.nbytes
+            # The column just decoded stays even if it alone is over the limit
+            while _decoded_bytes > DECODED_CACHE_BYTES and len(_decoded_cache) > 1:
+                _decoded_bytes -= _decoded_cache.popitem(last=False)[1].nbytes
+    return values
+
+
+def _clear_decoded():
+    global _decoded_bytes
+    with _decoded_lock:
+        _decoded_cache.clear()
+        _decoded_bytes = 0
+
+
+def _column(table, segment, column):
+    codecs = segment.get("codecs")
+    if not codecs:
+        return _open(segment["files"][column])
+    return _decoded(os.path.join(archive_dir(), segment["files"][column]), codecs[column],
+                    TABLES[table]["columns"][column])
+
+
+def read(table, start, end, user_id=None, columns=None, limit=None):
+    """Archived rows of ``table`` with ``start <= ts < end``, oldest first
+
+    ``start`` and ``end`` are epoch seconds. The frame has user_id, ts and
+    ``columns`` (all archived columns by default). With ``limit`` only the
+    newest ``limit`` rows are returned, and no more than that is copied out
+    of any segment.
+    """
+    spec = TABLES[table]
+    columns = [c for c in (columns or spec["columns"]) if c != "ts"]
+    parts = []
+    for segment in segments(table, user_id):
+        if segment["end"] < start or segment["start"] >= end:
+            continue
+        ts = _column(table, segment, "ts")
+        lo, hi = np.searchsorted(ts, [start, end])
+        if limit is not None:
+            lo = max(lo, hi - limit)
+        if lo == hi:
+            continue
+        part = {"ts": np.array(ts[lo:hi])}
+        for column in columns:
+            part[column] = np.array(_column(table, segment, column)[lo:hi])
+        part = pd.DataFrame(part)
+        part.insert(0, "user_id", segment["user_id"])
+        parts.append(part)
+
+    if not parts:
+        frame = pd.DataFrame({"user_id": pd.Series(dtype=object), "ts": pd.Series(dtype="int64")})
+        for column in columns:
+            frame[column] = pd.Series(dtype=spec["columns"][column])
+        return frame
+    frame = pd.concat(parts, ignore_index=True)
+    # Archives written before segments were merged can hold rows twice
+    frame = frame.drop_duplicates(["user_id", spec["key"]])
+    frame = frame.sort_values(["ts", spec["key"]], kind="stable", ignore_index=True)
+    return frame if limit is None else frame.tail(limit).reset_index(drop=True)
+
+
+def _epoch(text):
+    # Bounds as used in SQL ('YYYY-MM-DD[ HH:MM:SS]', UTC) to epoch seconds
+    return int(pd.Timestamp(text).timestamp())
+
+
+def water_history(start, end, user_id=None, before=None, limit=None):
+    """Archived water_level_history rows in the text range ``[start, end)``
+
+    Columns match database.DELTA_COLUMNS["water_level_history"], with
+    created_at formatted as it is in the live table, oldest first. ``before``
+    is a (created_at, id) key: only rows that sort before it are returned,
+    which is how the data viewer pages. ``limit`` keeps the newest rows.
+    """
+    start, end = _epoch(start), _epoch(end)
+    columns = ["id", "water_level"]
+    if before is None:
+        frame = read("water_level_history", start, end, user_id=user_id, columns=columns, limit=limit)
+    else:
+        # Whole seconds before the key, plus the key's own second up to its id
+        second = _epoch(before[0])
+        older = read("water_level_history", start, min(end, second), user_id=user_id,
+                     columns=columns, limit=limit)
+        same = read("water_level_history", max(start, second), min(end, second + 1),
+                    user_id=user_id, columns=columns)
+        frame = pd.concat([older, same[same["id"] < before[1]]], ignore_index=True)
+        frame = frame.sort_values(["ts", "id"], kind="stable", ignore_index=True)
+        if limit is not None:
+            frame = frame.tail(limit).reset_index(drop=True)
+    return _water_rows(frame)
+
+
+def _water_rows(frame):
+    # Archived water rows in the live table's columns and timestamp format
+    frame["created_at"] = pd.to_datetime(frame["ts"], unit="s").dt.strftime('%Y-%m-%d %H:%M:%S')
+    return frame[list(db.DELTA_COLUMNS["water_level_history"])]
+
+
+def _seconds(value, default):
+    if value is None:
+        return default
+    return value if isinstance(value, (int, float)) else _epoch(value)
+
+
+def table_chunks(table, start=None, end=None, user_id=None):
+    """Archived rows of ``table`` in ``[start, end)``, one frame per segment
+
+    Frames have the live table's columns, so exports can carry on from the
+    database into the archive while holding a single segment in memory.
+    ``start`` and ``end`` are text or epoch seconds. Unlike read(), rows an
+    archive written before segments were merged holds twice are not dropped.
+    """
+    spec = TABLES[table]
+    start, end = _seconds(start, -np.inf), _seconds(end, np.inf)
+    for segment in segments(table, user_id):
+        if segment["end"] < start or segment["start"] >= end:
+            continue
+        ts = _column(table, segment, "ts")
+        lo, hi = np.searchsorted(ts, [start, end])
+        if lo == hi:
+            continue
+        frame = pd.DataFrame({column: np.array(_column(table, segment, column)[lo:hi])
+                              for column in spec["columns"]})
+        frame.insert(0, "user_id", segment["user_id"])
+        yield _water_rows(frame) if table == "water_level_history" else frame
+
+
+def rows_by_key(table, keys):
+    """Archived rows of ``table`` whose key column is in ``keys``, in the frames of table_chunks()
+
+    Reads only segments whose key range can hold one of them (every segment
+    written before key ranges were listed is read).
+    """
+    spec = TABLES[table]
+    keys = np.unique(np.asarray(keys, dtype=np.int64))
+    parts = []
+    if len(keys):
+        for segment in segments(table):
+            low, high = segment.get("keys", (keys[0], keys[-1]))
+            if high < keys[0] or low > keys[-1]:
+                continue
+            found = np.isin(_column(table, segment, spec["key"]), keys)
+            if not found.any():
+                continue
+            frame = pd.DataFrame({column: np.array(_column(table, segment, column))[found]
+                                  for column in spec["columns"]})
+            frame.insert(0, "user_id", segment["user_id"])
+            parts.append(_water_rows(frame) if table == "water_level_history" else frame)
+    if not parts:
+        return pd.DataFrame()
+    return pd.concat(parts, ignore_index=True).drop_duplicates(spec["key"])
+
+
+def estimate_rows(table, start=None, end=None, user_id=None):
+    """Archived rows of ``table`` in ``[start, end)`` (text or epoch seconds)
+
+    Counts whole segments inside the range and a time-proportional share of
+    those it cuts through; reads only the manifest.
+    """
+    start, end = _seconds(start, -np.inf), _seconds(end, np.inf)
+    total = 0.0
+    for segment in segments(table, user_id):
+        first, last = segment["start"], segment["end"] + 1
+        covered = max(0, min(last, end) - max(first, start))
+        total += segment["rows"] * covered / (last - first)
+    return int(round(total))
+
+
+def stats():
+    """Segment count, rows and bytes on disk per archived table"""
+    result = {}
+    root = archive_dir()
+    for segment in segments():
+        entry = result.setdefault(segment["table"], {"segments": 0, "rows": 0, "bytes": 0})
+        entry["segments"] += 1
+        entry["rows"] += segment["rows"]
+        entry["bytes"] += sum(os.path.getsize(os.path.join(root, path))
+                              for path in segment["files"].values())
+    return result
+
+
+if __name__ == "__main__":
+    if sys.argv[1:]:
+        cutoff = (datetime.now() - timedelta(days=int(sys.argv[1]))).strftime('%Y-%m-%d')
+        for table, count in archive_old_rows(cutoff).items():
+            print(f"Archived {count} {table} rows older than {cutoff}")
+    for table, entry in stats().items():
+        print(f"{table}: {entry['rows']} rows in {entry['segments']} segments, {entry['bytes']} bytes")
@@ -0,0 +1,1454 @@
+"""Performance checks for the AgriGurd storage layer.
+
+Run one of the benchmarks from the project directory, for example:
+
+    python benchmarks.py stress --writers 16 --readers 32 --seconds 10
+
+Every benchmark works on a throwaway database in a temporary directory and
+never touches smart_agriculture.db.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import archive
+import cache
+import changes
+import codec
+import database as db
+import export
+import migrations
+import pagination
+import readings
+import rollups
+import simulation
+import stats
+import timeseries
+
+
+# ------------------ HELPERS ------------------
+def _temp_db_path(name):
+    return os.path.join(tempfile.mkdtemp(prefix="agrigurd-bench-"), name)
+
+
+def _percentile(samples, pct):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+# ------------------ STRESS TEST ------------------
+def run_stress(mode, writers, readers, seconds, farms=200):
+    """Hammer one database with concurrent writer and reader threads"""
+    path = _temp_db_path(f"stress-{mode}.db")
+    db.configure(path=path, mode=mode)
+
+    migrations.migrate()
+
+    def seed(conn):
+        conn.executemany("INSERT INTO sensor_data (user_id, water_level) VALUES (?, ?)",
+                         [(f"farm{i}", 50.0) for i in range(farms)])
+    db.write(seed)
+
+    counts = {"writes": 0, "reads": 0, "lock_errors": 0, "other_errors": 0}
+    read_latencies = []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + seconds
+
+    def record(key):
+        with lock:
+            counts[key] += 1
+
+    def tick(conn, user_id, level):
+        conn.execute('''UPDATE sensor_data SET water_level = ?, last_update = CURRENT_TIMESTAMP
+                        WHERE user_id = ?''', (level, user_id))
+        conn.execute("INSERT INTO water_level_history (user_id, water_level) VALUES (?, ?)",
+                     (user_id, level))
+
+    def writer():
+        while time.perf_counter() < stop_at:
+            user_id = f"farm{random.randrange(farms)}"
+            try:
+                db.write(tick, user_id, random.uniform(0, 100))
+                record("writes")
+            except sqlite3.OperationalError as e:
+                record("lock_errors" if "locked" in str(e) or "busy" in str(e) else "other_errors")
+
+    def reader():
+        while time.perf_counter() < stop_at:
+            user_id = f"farm{random.randrange(farms)}"
+            started = time.perf_counter()
+            try:
+                with db.connection() as conn:
+                    conn.execute("SELECT * FROM sensor_data WHERE user_id = ?", (user_id,)).fetchall()
+                    conn.execute('''SELECT water_level, created_at FROM water_level_history
+                                    WHERE user_id = ? ORDER BY created_at DESC LIMIT 24''',
+                                 (user_id,)).fetchall()
+                elapsed = time.perf_counter() - started
+                with lock:
+                    counts["reads"] += 1
+                    read_latencies.append(elapsed)
+            except sqlite3.OperationalError as e:
+                record("lock_errors" if "locked" in str(e) or "busy" in str(e) else "other_errors")
+
+    threads = [threading.Thread(target=writer) for _ in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    db.close_all()
+
+    return {
+        "mode": mode,
+        "writes_per_s": counts["writes"] / seconds,
+        "reads_per_s": counts["reads"] / seconds,
+        "lock_errors": counts["lock_errors"],
+        "other_errors": counts["other_errors"],
+        "read_p95_ms": _percentile(read_latencies, 95) * 1000,
+    }
+
+
+def cmd_stress(args):
+    print(f"{args.writers} writers, {args.readers} readers, {args.seconds}s per mode")
+    print(f"{'mode':<10}{'writes/s':>12}{'reads/s':>12}{'lock errs':>12}{'other errs':>12}{'read p95':>12}")
+    for mode in args.modes:
+        r = run_stress(mode, args.writers, args.readers, args.seconds)
+        print(f"{r['mode']:<10}{r['writes_per_s']:>12.0f}{r['reads_per_s']:>12.0f}"
+              f"{r['lock_errors']:>12}{r['other_errors']:>12}{r['read_p95_ms']:>10.1f}ms")
+
+
+# ------------------ STARTUP INIT ------------------
+def _legacy_init_db(path):
+    # What every rerun used to do before the bootstrap was cached per process
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    for table in ("users", "sensor_data", "notifications", "water_level_history"):
+        sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = ?", (table,)).fetchone()[0]
+        c.execute(sql.replace("CREATE TABLE", "CREATE TABLE IF NOT EXISTS", 1))
+    hashlib.sha256("admin@1234".encode()).hexdigest()
+    c.execute("SELECT COUNT(*) FROM users WHERE username = 'admin'")
+    c.fetchone()
+    c.execute("UPDATE users SET is_admin = 1 WHERE username = 'admin'")
+    conn.commit()
+    changes = conn.total_changes
+    conn.close()
+    return changes
+
+
+def cmd_init(args):
+    path = _temp_db_path("init.db")
+    db.configure(path=path)
+    migrations.ensure_bootstrapped()
+
+    started = time.perf_counter()
+    legacy_changes = sum(_legacy_init_db(path) for _ in range(args.reruns))
+    legacy_seconds = time.perf_counter() - started
+
+    db.reset_write_stats()
+    started = time.perf_counter()
+    for _ in range(args.reruns):
+        migrations.ensure_bootstrapped()
+    cached_seconds = time.perf_counter() - started
+    cached = db.write_stats()
+    db.close_all()
+
+    print(f"{args.reruns} simulated reruns")
+    print(f"{'init path':<22}{'per rerun':>14}{'commits':>10}{'rows written':>14}")
+    print(f"{'init_db() per rerun':<22}{legacy_seconds / args.reruns * 1e6:>12.1f}us"
+          f"{args.reruns:>10}{legacy_changes:>14}")
+    print(f"{'ensure_bootstrapped()':<22}{cached_seconds / args.reruns * 1e6:>12.1f}us"
+          f"{cached['commits']:>10}{cached['rows_changed']:>14}")
+
+
+# ------------------ DATE RANGE FILTERS ------------------
+VIEWER_WATER_QUERY = '''
+    SELECT wlh.id, wlh.user_id, u.username, u.farm_name, wlh.water_level, wlh.created_at
+    FROM water_level_history wlh
+    LEFT JOIN users u ON wlh.user_id = u.user_id
+    WHERE {predicate}
+'''
+
+
+def _fill_water_history(rows, farms, days):
+    """Spread ``rows`` readings evenly over the last ``days`` days"""
+    now = datetime.now().replace(microsecond=0)
+    step = timedelta(days=days) / rows
+
+    def users(conn):
+        conn.executemany('''INSERT INTO users (username, password_hash, user_id, farm_name, location)
+                            VALUES (?, '', ?, ?, 'Bench')''',
+                         [(f"user{i}", f"farm{i}", f"Farm {i}") for i in range(farms)])
+    db.write(users)
+
+    batch = 100_000
+    for offset in range(0, rows, batch):
+        def insert(conn, offset=offset):
+            conn.executemany(
+                "INSERT INTO water_level_history (user_id, water_level, created_at) VALUES (?, ?, ?)",
+                ((f"farm{i % farms}", random.uniform(20, 95),
+                  (now - step * (rows - i)).strftime('%Y-%m-%d %H:%M:%S'))
+                 for i in range(offset, min(rows, offset + batch))))
+        db.write(insert)
+
+
+def _time_query(sql, params, repeat):
+    best = None
+    with db.connection() as conn:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            rows = conn.execute(sql, params).fetchall()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+    return best, len(rows)
+
+
+def cmd_date_range(args):
+    path = _temp_db_path("date-range.db")
+    db.configure(path=path)
+    migrations.ensure_bootstrapped()
+    print(f"Generating {args.rows:,} water_level_history rows over {args.days} days...")
+    _fill_water_history(args.rows, args.farms, args.days)
+    with db.connection() as conn:
+        conn.execute("ANALYZE")
+
+    end_date = datetime.now().date()
+    start_date = end_date - timedelta(days=6)  # the viewer's default 7-day window
+    old_params = [start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')]
+    new_params = list(db.day_range(start_date, end_date))
+
+    cases = [
+        ("all farms", "DATE(wlh.created_at) BETWEEN ? AND ?",
+         "wlh.created_at >= ? AND wlh.created_at < ?", []),
+        ("one farm", "DATE(wlh.created_at) BETWEEN ? AND ? AND wlh.user_id = ?",
+         "wlh.created_at >= ? AND wlh.created_at < ? AND wlh.user_id = ?", ["farm7"]),
+    ]
+    print(f"{'7-day window':<14}{'rows':>10}{'DATE() BETWEEN':>18}{'half-open range':>18}{'speedup':>10}")
+    for label, old_predicate, new_predicate, extra in cases:
+        old_time, old_rows = _time_query(VIEWER_WATER_QUERY.format(predicate=old_predicate),
+                                         old_params + extra, args.repeat)
+        new_time, new_rows = _time_query(VIEWER_WATER_QUERY.format(predicate=new_predicate),
+                                         new_params + extra, args.repeat)
+        assert old_rows == new_rows, (old_rows, new_rows)
+        print(f"{label:<14}{new_rows:>10,}{old_time * 1000:>16.1f}ms{new_time * 1000:>16.1f}ms"
+              f"{old_time / new_time:>9.1f}x")
+    db.close_all()
+
+
+# ------------------ ROLLUPS ------------------
+def cmd_rollups(args):
+    path = _temp_db_path("rollups.db")
+    db.configure(path=path)
+    migrations.ensure_bootstrapped()
+    print(f"Generating {args.rows:,} water_level_history rows over {args.days} days...")
+    started = time.perf_counter()
+    _fill_water_history(args.rows, args.farms, args.days)
+    print(f"Inserted with rollup triggers at {args.rows / (time.perf_counter() - started):,.0f} rows/s")
+    with db.connection() as conn:
+        conn.execute("ANALYZE")
+
+    end = datetime.now() + timedelta(seconds=1)
+    start = end - timedelta(days=args.days)
+    bounds = [start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S')]
+
+    cases = [
+        ("all farms", None, "wlh.created_at >= ? AND wlh.created_at < ?", []),
+        ("one farm", "farm7", "wlh.created_at >= ? AND wlh.created_at < ? AND wlh.user_id = ?",
+         ["farm7"]),
+    ]
+    print(f"{args.days}-day chart{'':<4}{'rows read':>12}{'points':>10}{'time':>12}")
+    for label, user_id, raw_predicate, extra in cases:
+        # What the chart used to load: every raw reading in the range
+        raw_time, raw_rows = _time_query(VIEWER_WATER_QUERY.format(predicate=raw_predicate),
+                                         bounds + extra, args.repeat)
+        print(f"{label + ' raw':<18}{raw_rows:>12,}{raw_rows:>10,}{raw_time * 1000:>10.1f}ms")
+
+        best = None
+        with db.connection() as conn:
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                resolution, frame = rollups.water_level_series(conn, *bounds, user_id=user_id)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+        # Rollups hold exactly one row per plotted bucket
+        print(f"{label + ' ' + resolution:<18}{len(frame):>12,}{len(frame):>10,}{best * 1000:>10.1f}ms")
+    db.close_all()
+
+
+# ------------------ FLEET SIMULATION ------------------
+def cmd_simulate(args):
+    path = _temp_db_path("simulate.db")
+    db.configure(path=path)
+    migrations.ensure_bootstrapped()
+
+    def seed(conn):
+        conn.executemany('''INSERT INTO sensor_data (user_id, solar_input, battery_level, water_level)
+                            VALUES (?, ?, ?, ?)''',
+                         ((f"farm{i}", random.randint(800, 1000), random.randint(80, 100),
+                           random.uniform(0, 100)) for i in range(args.farms)))
+    db.write(seed)
+    print(f"{args.farms:,} farms")
+
+    # One transaction per farm, as the per-user loop did
+    sample = [f"farm{i}" for i in range(min(args.farms, args.sample))]
+    started = time.perf_counter()
+    for user_id in sample:
+        simulation.simulate_fleet(user_ids=[user_id])
+    per_farm = (time.perf_counter() - started) / len(sample)
+    print(f"{'per-farm loop':<22}{per_farm * args.farms * 1000:>10.0f}ms  "
+          f"(extrapolated from {len(sample):,} farms)")
+
+    timings = {"load": [], "step": [], "save": []}
+
+    def timed_tick(conn):
+        started = time.perf_counter()
+        state = simulation.load_fleet(conn)
+        timings["load"].append(time.perf_counter() - started)
+        started = time.perf_counter()
+        state, notifications = simulation.step_fleet(state)
+        timings["step"].append(time.perf_counter() - started)
+        started = time.perf_counter()
+        accept = simulation.save_fleet(conn, state, notifications)
+        timings["save"].append(time.perf_counter() - started)
+        return accept
+
+    totals = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        accept = db.write(timed_tick)
+        totals.append(time.perf_counter() - started)
+        accept()
+    print(f"{'vectorized fleet tick':<22}{min(totals) * 1000:>10.0f}ms  "
+          f"(load {min(timings['load']) * 1000:.0f}ms, step {min(timings['step']) * 1000:.0f}ms, "
+          f"write {min(timings['save']) * 1000:.0f}ms)")
+    db.close_all()
+
+
+# ------------------ SINGLE-FARM TICK ------------------
+def _legacy_tick(user_id):
+    # The old simulate_sensor_data(): a read on one connection, then the state
+    # update and each notification as separate write transactions
+    with db.connection() as conn:
+        state = simulation.load_fleet(conn, [user_id])
+    state, notifications = simulation.step_fleet(state)
+
+    def update(conn):
+        c = conn.cursor()
+        c.execute("SELECT COUNT(*) FROM sensor_data WHERE user_id = ?", (user_id,))
+        c.fetchone()
+        c.execute('''UPDATE sensor_data
+                     SET solar_input = ?, battery_level = ?, water_level = ?,
+                         drain_status = ?, last_update = CURRENT_TIMESTAMP
+                     WHERE user_id = ?''',
+                  (float(state["solar_input"][0]), float(state["battery_level"][0]),
+                   float(state["water_level"][0]), int(state["drain_status"][0]), user_id))
+        c.execute("INSERT INTO water_level_history (user_id, water_level) VALUES (?, ?)",
+                  (user_id, float(state["water_level"][0])))
+    db.write(update)
+    for notification in notifications:
+        db.execute('''INSERT INTO notifications (user_id, title, message, notification_type)
+                      VALUES (?, ?, ?, ?)''', notification)
+
+
+def cmd_tick(args):
+    print(f"{args.ticks} ticks over {args.farms} farms")
+    print(f"{'mode':<10}{'tick path':<20}{'p50':>10}{'p95':>10}{'commits/tick':>14}{'fsyncs/tick':>13}")
+    for mode in args.modes:
+        for label, tick in (("separate writes", _legacy_tick),
+                            ("one transaction", lambda u: simulation.simulate_fleet(user_ids=[u]))):
+            db.configure(path=_temp_db_path(f"tick-{mode}.db"), mode=mode)
+            migrations.migrate()
+            db.write(lambda conn: conn.executemany(
+                "INSERT INTO sensor_data (user_id, water_level) VALUES (?, ?)",
+                [(f"farm{i}", random.uniform(20, 95)) for i in range(args.farms)]))
+
+            db.reset_write_stats()
+            latencies = []
+            for i in range(args.ticks):
+                started = time.perf_counter()
+                tick(f"farm{i % args.farms}")
+                latencies.append(time.perf_counter() - started)
+            commits = db.write_stats()["commits"] / args.ticks
+            db.close_all()
+
+            # A rollback-journal commit at synchronous=FULL syncs the journal
+            # twice, the database file and the journal's directory entry. WAL at
+            # synchronous=NORMAL only syncs when it checkpoints.
+            fsyncs = f"{commits * 4:.2f}" if mode == "rollback" else "checkpoint"
+            print(f"{mode:<10}{label:<20}{_percentile(latencies, 50) * 1000:>8.2f}ms"
+                  f"{_percentile(latencies, 95) * 1000:>8.2f}ms{commits:>14.2f}{fsyncs:>13}")
+
+
+# ------------------ WRITE-BEHIND BUFFER ------------------
+def cmd_buffer(args):
+    print(f"{args.rows:,} single-row history inserts from {args.threads} thread(s)")
+    print(f"{'mode':<10}{'insert path':<16}{'rows/s':>12}{'commits':>10}{'caller p95':>14}")
+    for mode in args.modes:
+        for label, insert in (
+                ("own commit", lambda u, level: db.execute(
+                    "INSERT INTO water_level_history (user_id, water_level) VALUES (?, ?)", (u, level))),
+                ("write-behind", lambda u, level: db.insert_later("water_level_history", u, level))):
+            db.configure(path=_temp_db_path(f"buffer-{mode}.db"), mode=mode)
+            migrations.migrate()
+            db.reset_write_stats()
+            latencies = []
+            lock = threading.Lock()
+
+            def worker(count):
+                samples = []
+                for i in range(count):
+                    started = time.perf_counter()
+                    insert(f"farm{i % 100}", random.uniform(20, 95))
+                    samples.append(time.perf_counter() - started)
+                with lock:
+                    latencies.extend(samples)
+
+            started = time.perf_counter()
+            threads = [threading.Thread(target=worker, args=(args.rows // args.threads,))
+                       for _ in range(args.threads)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            db.flush_buffer()
+            elapsed = time.perf_counter() - started
+
+            with db.connection() as conn:
+                stored = conn.execute("SELECT COUNT(*) FROM water_level_history").fetchone()[0]
+            assert stored == len(latencies), (stored, len(latencies))
+            commits = db.write_stats()["commits"]
+            db.close_all()
+            print(f"{mode:<10}{label:<16}{stored / elapsed:>12,.0f}{commits:>10,}"
+                  f"{_percentile(latencies, 95) * 1e6:>12.0f}us")
+
+
+# ------------------ READ CACHE ------------------
+def _load_dashboard(user_id):
+    """The four queries behind UserManager.get_current_user_data"""
+    with db.connection() as conn:
+        user = conn.execute('''SELECT username, user_id, farm_name, location, created_at, is_admin
+                               FROM users WHERE user_id = ?''', (user_id,)).fetchone()
+        sensor = conn.execute('''SELECT solar_input, battery_level, water_level, drain_status, last_update
+                                 FROM sensor_data WHERE user_id = ?''', (user_id,)).fetchone()
+        notifications = conn.execute('''SELECT title, message, notification_type, created_at, is_read
+                                        FROM notifications WHERE user_id = ?
+                                        ORDER BY created_at DESC LIMIT 15''', (user_id,)).fetchall()
+        history = conn.execute('''SELECT water_level, created_at FROM water_level_history
+                                  WHERE user_id = ? ORDER BY created_at DESC LIMIT 24''',
+                               (user_id,)).fetchall()
+    user_info = dict(zip(("username", "user_id", "farm_name", "location", "created_at", "is_admin"), user))
+    sensor_data = dict(zip(("solar_input", "battery_level", "water_level", "drain_status", "last_update"),
+                           sensor))
+    user_data = {
+        "notifications": [dict(zip(("title", "message", "type", "time", "read"), row))
+                          for row in notifications],
+        "water_level_history": [{"time": created_at[11:16], "level": level} for level, created_at in history],
+    }
+    return user_info, sensor_data, user_data
+
+
+def cmd_cache(args):
+    db.configure(path=_temp_db_path("cache.db"))
+    migrations.migrate()
+    users = [f"farm{i}" for i in range(args.farms)]
+
+    def seed(conn):
+        conn.executemany("INSERT INTO users (username, password_hash, user_id, farm_name) VALUES (?, '', ?, ?)",
+                         [(u, u, f"{u} fields") for u in users])
+        conn.executemany("INSERT INTO sensor_data (user_id, water_level) VALUES (?, 50)", [(u,) for u in users])
+        conn.executemany("INSERT INTO notifications (user_id, title, message) VALUES (?, 'Status', 'ok')",
+                         [(u,) for u in users for _ in range(30)])
+        conn.executemany("INSERT INTO water_level_history (user_id, water_level) VALUES (?, 50)",
+                         [(u,) for u in users for _ in range(50)])
+    db.write(seed)
+
+    def cached(user_id):
+        # Same split as the app: account info and farm state under separate versions
+        user_info = cache.account_cache.get(user_id, db.table_versions(("users",))["users"],
+                                            lambda: _load_dashboard(user_id)[0])
+        state = cache.state_cache.get(user_id, cache.data_version(user_id),
+                                      lambda: _load_dashboard(user_id)[1:])
+        return (user_info,) + state
+
+    print(f"{args.reruns:,} dashboard reruns over {args.farms} farms, "
+          f"one farm write every {args.write_every} reruns")
+    print(f"{'read path':<12}{'reruns/s':>12}{'p95':>12}{'state hit rate':>16}")
+    for label, load in (("queries", _load_dashboard), ("cache", cached)):
+        cache.invalidate_all()
+        cache.state_cache.reset_stats()
+        latencies = []
+        started = time.perf_counter()
+        for i in range(args.reruns):
+            user_id = users[i % args.farms]
+            if args.write_every and i % args.write_every == 0:
+                cache.bump(user_id)
+            t = time.perf_counter()
+            load(user_id)
+            latencies.append(time.perf_counter() - t)
+        elapsed = time.perf_counter() - started
+        hit_rate = f"{cache.state_cache.stats()['hit_rate']:.1%}" if label == "cache" else "-"
+        print(f"{label:<12}{args.reruns / elapsed:>12,.0f}{_percentile(latencies, 95) * 1e6:>10.0f}us"
+              f"{hit_rate:>16}")
+    db.close_all()
+
+
+# ------------------ CHANGE DETECTION ------------------
+def cmd_changes(args):
+    db.configure(path=_temp_db_path("changes.db"))
+    migrations.migrate()
+    db.write(lambda conn: conn.execute(
+        "INSERT INTO users (username, password_hash, user_id, farm_name) VALUES ('farm0', '', 'farm0', 'Farm')"))
+    db.execute("INSERT INTO sensor_data (user_id, water_level) VALUES ('farm0', 50)")
+
+    def insert_rate():
+        started = time.perf_counter()
+        db.write(lambda conn: conn.executemany(
+            "INSERT INTO water_level_history (user_id, water_level) VALUES (?, ?)",
+            ((f"farm{i % 100}", random.uniform(20, 95)) for i in range(args.rows))))
+        return args.rows / (time.perf_counter() - started)
+
+    tables = ("sensor_data", "notifications", "water_level_history")
+    print(f"{args.polls:,} dashboard polls with nothing new")
+    print(f"{'poll':<28}{'per poll':>12}")
+    for label, poll in (("re-run dashboard queries", lambda: _load_dashboard("farm0")),
+                        ("table_versions()", lambda: db.table_versions(tables))):
+        started = time.perf_counter()
+        for _ in range(args.polls):
+            poll()
+        print(f"{label:<28}{(time.perf_counter() - started) / args.polls * 1e6:>10.1f}us")
+
+    with_counters = insert_rate()
+
+    def drop_counter_triggers(conn):
+        for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' "
+                                    "AND name LIKE 'trg_water_level_history_%_changes'").fetchall():
+            conn.execute(f"DROP TRIGGER {name}")
+    db.write(drop_counter_triggers)
+    without_counters = insert_rate()
+    db.close_all()
+    print(f"history inserts: {with_counters:,.0f} rows/s with change counters, "
+          f"{without_counters:,.0f} rows/s without")
+
+
+# ------------------ DELTA READS ------------------
+def cmd_delta(args):
+    db.configure(path=_temp_db_path("delta.db"))
+    migrations.ensure_bootstrapped()
+    print(f"Generating {args.rows:,} water_level_history rows over {args.days} days...")
+    _fill_water_history(args.rows, args.farms, args.days)
+
+    end = datetime.now() + timedelta(days=1)
+    bounds = list(db.day_range(end - timedelta(days=args.days + 1), end))
+    with db.connection() as conn:
+        cursor = conn.execute("SELECT MAX(id) FROM water_level_history").fetchone()[0]
+    # One simulation tick's worth of new readings
+    db.write(lambda conn: conn.executemany(
+        "INSERT INTO water_level_history (user_id, water_level) VALUES (?, ?)",
+        [(f"farm{i}", random.uniform(20, 95)) for i in range(args.farms)]))
+
+    print(f"{'refresh':<34}{'rows read':>12}{'time':>12}")
+    viewer = VIEWER_WATER_QUERY.format(predicate="wlh.created_at >= ? AND wlh.created_at < ?")
+    for label, sql, params in (
+            ("viewer, whole window", viewer, bounds),
+            ("viewer, id > cursor", VIEWER_WATER_QUERY.format(
+                predicate="wlh.id > ? AND +wlh.created_at >= ? AND +wlh.created_at < ?"), [cursor] + bounds),
+            ("dashboard, last 24 by time", '''SELECT water_level, created_at FROM water_level_history
+                                               WHERE user_id = 'farm7' ORDER BY created_at DESC LIMIT 24''', []),
+            ("dashboard, id > cursor", '''SELECT water_level, created_at FROM water_level_history
+                                           WHERE user_id = 'farm7' AND id > ? ORDER BY id DESC LIMIT 24''',
+             [cursor])):
+        elapsed, rows = _time_query(sql, params, args.repeat)
+        print(f"{label:<34}{rows:>12,}{elapsed * 1000:>10.2f}ms")
+    db.close_all()
+
+
+# ------------------ IN-MEMORY SERIES ------------------
+def cmd_series(args):
+    db.configure(path=_temp_db_path("series.db"))
+    migrations.migrate()
+    users = [f"farm{i}" for i in range(args.farms)]
+    db.write(lambda conn: conn.executemany(
+        "INSERT INTO sensor_data (user_id, water_level, solar_input, battery_level) VALUES (?, 50, 800, 90)",
+        [(u,) for u in users]))
+    # An hour of history for every farm
+    db.write(lambda conn: conn.executemany(
+        "INSERT INTO water_level_history (user_id, water_level, created_at) VALUES (?, ?, datetime('now', ?))",
+        ((u, random.uniform(20, 95), f"-{(timeseries.CAPACITY - i) * 5} seconds")
+         for i in range(timeseries.CAPACITY) for u in users)))
+    now = int(time.time())
+    db.write(lambda conn: conn.executemany(
+        readings.RECORD_READING,
+        ((u, 800, 90, random.uniform(20, 95), 0, now - (timeseries.CAPACITY - i) * 5)
+         for i in range(timeseries.CAPACITY) for u in users)))
+
+    started = time.perf_counter()
+    store = timeseries.SeriesStore()
+    with db.connection() as conn:
+        store.warm(conn)
+    print(f"Warmed {args.farms:,} farms in {(time.perf_counter() - started) * 1000:.0f}ms, "
+          f"{store.stats()['bytes'] / 2 ** 20:.1f} MiB ({timeseries.BYTES_PER_FARM:,} bytes per farm)")
+
+    def from_sqlite(user_id):
+        with db.connection() as conn:
+            frame = pd.read_sql_query('''SELECT water_level, created_at FROM water_level_history
+                                         WHERE user_id = ? AND created_at >= datetime('now', '-1 hour')
+                                         ORDER BY created_at''', conn, params=(user_id,))
+            conn.execute('''SELECT solar_input, battery_level, water_level FROM sensor_data
+                            WHERE user_id = ?''', (user_id,)).fetchone()
+        return frame
+
+    def from_store(user_id):
+        times, readings = store.window(user_id)
+        store.latest(user_id)
+        return pd.Series(readings["water_level"], index=pd.to_datetime(times, unit="s"))
+
+    print(f"{'dashboard read (1h window)':<30}{'per read':>12}")
+    for label, read in (("SQLite + pandas frame", from_sqlite), ("ring buffer", from_store)):
+        started = time.perf_counter()
+        for i in range(args.reads):
+            read(users[i % args.farms])
+        print(f"{label:<30}{(time.perf_counter() - started) / args.reads * 1e6:>10.0f}us")
+
+    fleet = {metric: np.random.uniform(0, 100, args.farms) for metric in timeseries.METRICS}
+    started = time.perf_counter()
+    for _ in range(args.ticks):
+        store.append(users, **fleet)
+    print(f"Fleet append: {(time.perf_counter() - started) / args.ticks * 1000:.1f}ms per tick "
+          f"for {args.farms:,} farms")
+    db.close_all()
+
+
+# ------------------ CURRENT STATE ------------------
+def cmd_state(args):
+    db.configure(path=_temp_db_path("state.db"))
+    migrations.migrate()
+    users = [f"farm{i}" for i in range(args.farms)]
+    state = dict.fromkeys(readings.STATE_FIELDS, 0)
+    db.write(lambda conn: conn.executemany(readings.UPSERT_STATE, [(u, 800, 90, 50, 0) for u in users]))
+    now = int(time.time())
+    db.write(lambda conn: conn.executemany(
+        readings.RECORD_READING,
+        ((u, 800, 90, random.uniform(20, 95), 0, now - (args.history - i) * 5)
+         for i in range(args.history) for u in users)))
+
+    def from_log(conn, user_id):
+        return conn.execute('''SELECT solar_input, battery_level, water_level, drain_status, ts
+                               FROM sensor_readings WHERE user_id = ? ORDER BY ts DESC LIMIT 1''',
+                            (user_id,)).fetchone()
+
+    print(f"{args.farms:,} farms, {args.farms * args.history:,} logged readings")
+    print(f"{'latest-value lookup':<34}{'per read':>10}")
+    for label, read in (("newest row of the readings log", from_log),
+                        ("current_state() key lookup", readings.current_state)):
+        with db.connection() as conn:
+            started = time.perf_counter()
+            for i in range(args.reads):
+                read(conn, users[i % args.farms])
+        print(f"{label:<34}{(time.perf_counter() - started) / args.reads * 1e6:>8.1f}us")
+
+    def tick(conn):
+        return [readings.record(conn, user_id, dict(state, water_level=random.uniform(20, 95)))
+                for user_id in users]
+
+    print(f"{'fleet write (state + log)':<34}{'per tick':>10}")
+    for label, ddl in (("with (user_id, last_update) index",
+                        "CREATE INDEX idx_sensor_data_user_update ON sensor_data (user_id, last_update)"),
+                       ("keyed on user_id only", "DROP INDEX idx_sensor_data_user_update")):
+        db.execute(ddl)
+        elapsed = 0.0
+        for _ in range(args.ticks):
+            time.sleep(1)  # the log keeps one row per farm and second
+            started = time.perf_counter()
+            accepts = db.write(tick)
+            elapsed += time.perf_counter() - started
+            for accept in accepts:
+                accept()
+        print(f"{label:<34}{elapsed / args.ticks * 1000:>8.1f}ms")
+    db.close_all()
+
+
+# ------------------ DEADBAND STORAGE ------------------
+def cmd_deadband(args):
+    rng = np.random.default_rng(7)
+    users = np.array([f"farm{i}" for i in range(args.farms)], dtype=object)
+    start = int(time.time()) - args.ticks * rollups.RAW_INTERVAL_SECONDS
+    print(f"{args.farms} farms x {args.ticks} ticks of {rollups.RAW_INTERVAL_SECONDS}s, "
+          f"{readings.HEARTBEAT_SECONDS}s heartbeat")
+    print(f"{'scenario':<12}{'policy':<16}{'log rows':>10}{'history':>10}{'db size':>10}"
+          f"{'reduction':>11}{'max hold error':>16}")
+
+    for scenario in ("simulator", "quiet"):
+        baseline = None
+        for enabled in (False, True):
+            db.configure(path=_temp_db_path(f"deadband-{scenario}-{enabled}.db"))
+            migrations.migrate()
+            log = readings.StoragePolicy("log", readings.DEADBANDS, enabled=enabled)
+            history = readings.StoragePolicy("history", {"water_level": readings.DEADBANDS["water_level"]},
+                                             enabled=enabled)
+            state = {
+                "id": np.arange(args.farms),
+                "user_id": users,
+                "solar_input": rng.uniform(0, 1000, args.farms),
+                "battery_level": rng.uniform(20, 100, args.farms),
+                "water_level": rng.uniform(30, 80, args.farms),
+                "drain_status": np.zeros(args.farms, dtype=bool),
+            }
+            held = state["water_level"].copy()
+            max_error = 0.0
+            counts = [0, 0]
+            for tick in range(args.ticks):
+                now = start + tick * rollups.RAW_INTERVAL_SECONDS
+                if scenario == "simulator":
+                    state, _ = simulation.step_fleet(state, hour=now // 3600 % 24, rng=rng)
+                else:
+                    # A stable farm: sensors drift by noise only
+                    state = dict(state,
+                                 solar_input=np.clip(state["solar_input"] + rng.normal(0, 5, args.farms), 0, 1200),
+                                 battery_level=np.clip(state["battery_level"] + rng.normal(0, 0.2, args.farms), 0, 100),
+                                 water_level=np.clip(state["water_level"] + rng.normal(0, 0.2, args.farms), 0, 100))
+                logged = log.keep(users, now, **{channel: state[channel] for channel in log.channels})
+                kept = history.keep(users, now, water_level=state["water_level"])
+                held[kept] = state["water_level"][kept]
+                max_error = max(max_error, float(np.abs(state["water_level"] - held).max()))
+                counts[0] += int(logged.sum())
+                counts[1] += int(kept.sum())
+                created_at = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(now))
+
+                def insert(conn, now=now, created_at=created_at, logged=logged, kept=kept, state=state):
+                    conn.executemany(
+                        readings.RECORD_READING,
+                        zip(users[logged].tolist(), state["solar_input"][logged].tolist(),
+                            state["battery_level"][logged].tolist(), state["water_level"][logged].tolist(),
+                            state["drain_status"][logged].astype(int).tolist(), [now] * int(logged.sum())))
+                    conn.executemany(
+                        "INSERT INTO water_level_history (user_id, water_level, created_at) VALUES (?, ?, ?)",
+                        zip(users[kept].tolist(), state["water_level"][kept].tolist(),
+                            [created_at] * int(kept.sum())))
+                db.write(insert)
+
+            db.close_all()
+            size = os.path.getsize(db.DB_PATH)
+            baseline = baseline or (counts[0] + counts[1])
+            print(f"{scenario:<12}{'deadband' if enabled else 'every reading':<16}{counts[0]:>10,}{counts[1]:>10,}"
+                  f"{size / 2 ** 20:>8.1f}MB{1 - (counts[0] + counts[1]) / baseline:>11.1%}{max_error:>16.2f}")
+
+
+# ------------------ TIME-SERIES ENCODING ------------------
+# (label, schema, insert, one farm's time-range query)
+ENCODINGS = [
+    ("text timestamps, REAL",
+     '''CREATE TABLE series (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL,
+                             solar_input REAL, battery_level REAL, water_level REAL,
+                             created_at TIMESTAMP NOT NULL);
+        CREATE INDEX idx_series_user_created ON series (user_id, created_at)''',
+     "INSERT INTO series (user_id, solar_input, battery_level, water_level, created_at) VALUES (?, ?, ?, ?, ?)",
+     '''SELECT solar_input, battery_level, water_level, created_at FROM series
+        WHERE user_id = ? AND created_at >= ? AND created_at < ?'''),
+    ("epoch seconds, REAL",
+     '''CREATE TABLE series (user_id TEXT NOT NULL, ts INTEGER NOT NULL,
+                             solar_input REAL, battery_level REAL, water_level REAL,
+                             PRIMARY KEY (user_id, ts)) WITHOUT ROWID''',
+     "INSERT INTO series (user_id, solar_input, battery_level, water_level, ts) VALUES (?, ?, ?, ?, ?)",
+     '''SELECT solar_input, battery_level, water_level, ts FROM series
+        WHERE user_id = ? AND ts >= ? AND ts < ?'''),
+    ("epoch seconds, fixed-point",
+     '''CREATE TABLE series (user_id TEXT NOT NULL, ts INTEGER NOT NULL,
+                             solar_input INTEGER, battery_level INTEGER, water_level INTEGER,
+                             PRIMARY KEY (user_id, ts)) WITHOUT ROWID''',
+     "INSERT INTO series (user_id, solar_input, battery_level, water_level, ts) VALUES (?, ?, ?, ?, ?)",
+     '''SELECT solar_input, battery_level, water_level, ts FROM series
+        WHERE user_id = ? AND ts >= ? AND ts < ?'''),
+]
+
+
+def cmd_encoding(args):
+    rng = np.random.default_rng(7)
+    steps = args.rows // args.farms
+    end = int(time.time()) // 60 * 60
+    ts = end - rollups.RAW_INTERVAL_SECONDS * np.arange(steps, 0, -1)
+    text = pd.to_datetime(ts, unit="s").strftime('%Y-%m-%d %H:%M:%S').tolist()
+    day = (end - readings.DAY_SECONDS, end)
+    print(f"{args.farms * steps:,} readings, {args.farms} farms; range reads fetch one farm's last day")
+    print(f"{'layout':<28}{'insert':>10}{'db size':>10}{'per row':>9}{'range + decode':>16}{'fleet avg':>11}")
+
+    for label, ddl, insert, select in ENCODINGS:
+        path = _temp_db_path("encoding.db")
+        conn = sqlite3.connect(path)
+        conn.executescript(ddl)
+        fixed = "fixed-point" in label
+        started = time.perf_counter()
+        for i in range(args.farms):
+            user_id = f"farm{i}"
+            values = [rng.uniform(0, 1200, steps), rng.uniform(0, 100, steps), rng.uniform(0, 100, steps)]
+            if fixed:
+                values = [np.rint(v * readings.SCALES[channel]).astype(np.int64)
+                          for v, channel in zip(values, readings.CHANNELS)]
+            times = text if label.startswith("text") else ts.tolist()
+            conn.executemany(insert, zip([user_id] * steps, *(v.tolist() for v in values), times))
+        conn.commit()
+        insert_seconds = time.perf_counter() - started
+        conn.execute("VACUUM")
+        size = os.path.getsize(path)
+
+        if label.startswith("text"):
+            bounds = tuple(pd.to_datetime(day, unit="s").strftime('%Y-%m-%d %H:%M:%S'))
+            column = "created_at"
+        else:
+            bounds, column = day, "ts"
+
+        latencies = []
+        for i in range(args.repeat):
+            started = time.perf_counter()
+            params = (f"farm{i % args.farms}",) + bounds
+            if label.startswith("text"):
+                # What the dashboards do with created_at text today
+                frame = pd.read_sql_query(select, conn, params=params)
+                frame.index = pd.to_datetime(frame.pop("created_at"))
+            else:
+                # readings.farm_frame(): one float64 array, converted column-wise
+                values = np.array(conn.execute(select, params).fetchall(), dtype=np.float64)
+                scales = np.array([readings.SCALES[channel] if fixed else 1 for channel in readings.CHANNELS])
+                frame = pd.DataFrame(values[:, :3] / scales, columns=list(readings.CHANNELS),
+                                     index=pd.to_datetime(values[:, 3].astype(np.int64), unit="s"))
+            latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        conn.execute(f"SELECT AVG(water_level) FROM series WHERE {column} >= ? AND {column} < ?", bounds).fetchone()
+        fleet_seconds = time.perf_counter() - started
+        conn.close()
+        print(f"{label:<28}{insert_seconds:>9.1f}s{size / 2 ** 20:>8.1f}MB{size / (args.farms * steps):>8.1f}B"
+              f"{_percentile(latencies, 50) * 1000:>14.2f}ms{fleet_seconds * 1000:>9.0f}ms")
+
+
+# ------------------ SENSOR READINGS ------------------
+def cmd_readings(args):
+    db.configure(path=_temp_db_path("readings.db"))
+    migrations.migrate()
+    users = [f"farm{i}" for i in range(args.farms)]
+    end = int(time.time())
+    steps = readings.DAY_SECONDS // rollups.RAW_INTERVAL_SECONDS
+    started = time.perf_counter()
+    for user_id in users:
+        ts = end - rollups.RAW_INTERVAL_SECONDS * np.arange(steps, 0, -1)
+        solar = np.clip(1000 * np.sin((ts % readings.DAY_SECONDS) / readings.DAY_SECONDS * 2 * np.pi), 0, None)
+        db.write(lambda conn, rows=zip([user_id] * steps, solar.tolist(),
+                                       np.random.uniform(20, 100, steps).tolist(),
+                                       np.random.uniform(20, 95, steps).tolist(),
+                                       [0] * steps, ts.tolist()): conn.executemany(readings.RECORD_READING, rows))
+    with db.connection() as conn:
+        rows = conn.execute("SELECT COUNT(*) FROM sensor_readings").fetchone()[0]
+        size = conn.execute("PRAGMA page_count").fetchone()[0] * conn.execute("PRAGMA page_size").fetchone()[0]
+    print(f"Stored {rows:,} readings for {args.farms} farms in {time.perf_counter() - started:.1f}s, "
+          f"{size / rows:.1f} bytes per reading")
+
+    def raw_frame(conn, user_id):
+        # Every reading of the day through pandas, resampled in Python
+        frame = readings.farm_frame(conn, user_id, end - readings.DAY_SECONDS, end)
+        curves = frame.resample("5min").mean()
+        return curves, readings.energy_kwh(frame.index.asi8 // 10 ** 9, frame["solar_input"].to_numpy())
+
+    def bucketed(conn, user_id):
+        times, curves = readings.channel_curves(conn, user_id, end=end)
+        return curves["solar_input"], readings.energy_kwh(times, curves["solar_input"])
+
+    print(f"{'24h curves + energy':<28}{'p50':>10}{'p95':>10}{'points':>8}")
+    for label, read in (("raw rows + pandas resample", raw_frame), ("bucketed in SQL", bucketed)):
+        latencies = []
+        with db.connection() as conn:
+            for i in range(args.repeat):
+                started = time.perf_counter()
+                curves, kwh = read(conn, users[i % args.farms])
+                latencies.append(time.perf_counter() - started)
+        print(f"{label:<28}{_percentile(latencies, 50) * 1000:>8.2f}ms"
+              f"{_percentile(latencies, 95) * 1000:>8.2f}ms{len(curves):>8}  ({kwh:.2f} kWh)")
+    db.close_all()
+
+
+# ------------------ ARCHIVE ------------------
+def cmd_archive(args):
+    path = _temp_db_path("archive.db")
+    db.configure(path=path)
+    archive.ARCHIVE_DIR = os.path.join(os.path.dirname(path), "archive")
+    migrations.ensure_bootstrapped()
+    print(f"Generating {args.rows:,} water_level_history rows over {args.days} days...")
+    _fill_water_history(args.rows, args.farms, args.days)
+
+    end = datetime.now() + timedelta(seconds=1)
+    cutoff = (datetime.now() - timedelta(days=args.keep_days)).strftime('%Y-%m-%d')
+    windows = [(f"last {args.keep_days} days", cutoff), (f"all {args.days} days", "2000-01-01")]
+    predicate = "wlh.created_at >= ? AND wlh.created_at < ? AND wlh.user_id = ?"
+
+    def db_size():
+        with db.connection() as conn:
+            conn.execute("VACUUM")
+            return os.path.getsize(path)
+
+    def one_farm(start):
+        # The Water History tab's first load: live rows plus archived ones
+        latencies, rows = [], 0
+        bounds = [start, end.strftime('%Y-%m-%d %H:%M:%S')]
+        with db.connection() as conn:
+            for i in range(args.repeat):
+                started = time.perf_counter()
+                live = conn.execute(VIEWER_WATER_QUERY.format(predicate=predicate),
+                                    bounds + [f"farm{i % args.farms}"]).fetchall()
+                archived = archive.water_history(*bounds, user_id=f"farm{i % args.farms}")
+                latencies.append(time.perf_counter() - started)
+                rows = len(live) + len(archived)
+        return _percentile(latencies, 50), rows
+
+    before_size = db_size()
+    before = [one_farm(start) for _, start in windows]
+    started = time.perf_counter()
+    moved = archive.archive_old_rows(cutoff, tables=("water_level_history",))["water_level_history"]
+    archive_seconds = time.perf_counter() - started
+    after_size = db_size()
+    after = [one_farm(start) for _, start in windows]
+    archive_bytes = archive.stats()["water_level_history"]["bytes"]
+
+    print(f"Archived {moved:,} rows older than {cutoff} in {archive_seconds:.1f}s "
+          f"({moved / archive_seconds:,.0f} rows/s)")
+    print(f"Live database {before_size / 2 ** 20:.1f}MB -> {after_size / 2 ** 20:.1f}MB, "
+          f"archive {archive_bytes / 2 ** 20:.1f}MB ({archive_bytes / moved:.1f} bytes per row)")
+    print(f"{'one farm':<20}{'rows':>10}{'SQLite only':>14}{'live + archive':>16}")
+    for (label, _), (old_time, old_rows), (new_time, new_rows) in zip(windows, before, after):
+        assert old_rows == new_rows, (old_rows, new_rows)
+        print(f"{label:<20}{new_rows:>10,}{old_time * 1000:>12.2f}ms{new_time * 1000:>14.2f}ms")
+    db.close_all()
+
+
+# ------------------ ARCHIVE CODECS ------------------
+# SQLite reads of one farm's (ts, value) pairs and the objects they occupy
+CODEC_SERIES = {
+    "water_level_history": ('''SELECT CAST(strftime('%s', created_at) AS INTEGER), water_level
+                               FROM water_level_history WHERE user_id = ?''',
+                            ("water_level_history", "idx_water_history_user_created",
+                             "idx_water_history_created", "idx_water_history_user")),
+    "solar_input": ("SELECT ts, solar_input FROM sensor_readings WHERE user_id = ?", ("sensor_readings",)),
+    "battery_level": ("SELECT ts, battery_level FROM sensor_readings WHERE user_id = ?", ("sensor_readings",)),
+}
+
+
+def cmd_codec(args):
+    rng = np.random.default_rng(7)
+    users = np.array([f"farm{i}" for i in range(args.farms)], dtype=object)
+    start = int(time.time()) - args.ticks * rollups.RAW_INTERVAL_SECONDS
+    db.configure(path=_temp_db_path("codec.db"))
+    migrations.migrate()
+
+    # Simulator readings, kept the way the app stores them (deadband storage)
+    readings.reset_policies()
+    state = {
+        "id": np.arange(args.farms),
+        "user_id": users,
+        "solar_input": rng.uniform(0, 1000, args.farms),
+        "battery_level": rng.uniform(20, 100, args.farms),
+        "water_level": rng.uniform(30, 80, args.farms),
+        "drain_status": np.zeros(args.farms, dtype=bool),
+    }
+    log_rows, history_rows = [], []
+    for tick in range(args.ticks):
+        now = start + tick * rollups.RAW_INTERVAL_SECONDS
+        state, _ = simulation.step_fleet(state, hour=now // 3600 % 24, rng=rng)
+        logged = readings.log_policy.keep(users, now, **{c: state[c] for c in readings.log_policy.channels})
+        kept = readings.history_policy.keep(users, now, water_level=state["water_level"])
+        log_rows += zip(users[logged].tolist(), state["solar_input"][logged].tolist(),
+                        state["battery_level"][logged].tolist(), state["water_level"][logged].tolist(),
+                        [0] * int(logged.sum()), [now] * int(logged.sum()))
+        history_rows += zip(users[kept].tolist(), state["water_level"][kept].tolist(),
+                            [time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(now))] * int(kept.sum()))
+
+    def insert(conn):
+        conn.executemany(readings.RECORD_READING, log_rows)
+        conn.executemany("INSERT INTO water_level_history (user_id, water_level, created_at) VALUES (?, ?, ?)",
+                         history_rows)
+    db.write(insert)
+
+    print(f"{args.farms} farms x {args.ticks} ticks of {rollups.RAW_INTERVAL_SECONDS}s with deadband storage; "
+          f"a sample is one (ts, value) pair")
+    print(f"{'series':<22}{'samples':>10}{'format':>36}{'B/sample':>10}{'decode':>14}")
+    for name, (sql, objects) in CODEC_SERIES.items():
+        with db.connection() as conn:
+            size = conn.execute(f"SELECT SUM(pgsize) FROM dbstat WHERE name IN ({', '.join('?' * len(objects))})",
+                                objects).fetchone()[0]
+            rows = conn.execute(f"SELECT COUNT(*) FROM {objects[0]}").fetchone()[0]
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                farms = [np.array(conn.execute(sql, (user_id,)).fetchall(), dtype=np.float64)
+                         for user_id in users]
+            sqlite_seconds = time.perf_counter() - started
+        samples = sum(len(farm) for farm in farms)
+
+        # One farm's column pair, as an archive segment holds it
+        times = [farm[:, 0].astype(np.int64) for farm in farms]
+        if name == "water_level_history":
+            value_codec, values = "xor", [farm[:, 1] for farm in farms]
+        else:
+            value_codec, values = "delta", [farm[:, 1].astype(np.int32) for farm in farms]
+
+        raw = [(t.astype(np.float64).tobytes(), v.astype(np.float64).tobytes()) for t, v in zip(times, values)]
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            for t, v in raw:
+                np.frombuffer(t, dtype=np.float64).copy(), np.frombuffer(v, dtype=np.float64).copy()
+        raw_seconds = time.perf_counter() - started
+
+        encoded = [(codec.encode("dod", t), codec.encode(value_codec, v)) for t, v in zip(times, values)]
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            decoded = [(codec.decode("dod", t, np.int64), codec.decode(value_codec, v, values[0].dtype))
+                       for t, v in encoded]
+        codec_seconds = time.perf_counter() - started
+        assert all(np.array_equal(t, dt) and np.array_equal(v, dv)
+                   for t, v, (dt, dv) in zip(times, values, decoded))
+        encoded_bytes = sum(len(t) + len(v) for t, v in encoded)
+
+        for label, per_sample, seconds in ((f"SQLite rows ({objects[0]})", size / rows, sqlite_seconds),
+                                           ("raw float64", 16.0, raw_seconds),
+                                           (f"dod + {value_codec}", encoded_bytes / samples, codec_seconds)):
+            print(f"{name:<22}{samples:>10,}{label:>36}{per_sample:>10.2f}"
+                  f"{samples * args.repeat / seconds / 1e6:>12.2f}M/s")
+    db.close_all()
+
+# ------------------ PAGINATION ------------------
+def cmd_pages(args):
+    db.configure(path=_temp_db_path("pages.db"))
+    migrations.migrate()
+    end = int(time.time())
+    steps = args.rows // args.farms
+    for i in range(args.farms):
+        ts = end - rollups.RAW_INTERVAL_SECONDS * np.arange(steps, 0, -1)
+        db.write(lambda conn, rows=zip([f"farm{i}"] * steps, np.random.uniform(0, 1000, steps).tolist(),
+                                       np.random.uniform(20, 100, steps).tolist(),
+                                       np.random.uniform(20, 95, steps).tolist(),
+                                       [0] * steps, ts.tolist()): conn.executemany(readings.RECORD_READING, rows))
+    start = end - args.days * readings.DAY_SECONDS
+    bounds = [start, end + 1]
+    select = "SELECT user_id, solar_input, battery_level, water_level, drain_status, ts FROM sensor_readings"
+    where = ["ts >= ?", "ts < ?"]
+    keys = [("ts", "ts"), ("user_id", "user_id")]
+    print(f"{args.farms * steps:,} readings, {args.farms} farms; every farm's last {args.days} days, "
+          f"{args.page_size} rows per page")
+
+    with db.connection() as conn:
+        started = time.perf_counter()
+        frame = pd.read_sql_query(f"{select} WHERE ts >= ? AND ts < ? ORDER BY ts DESC", conn, params=bounds)
+        whole_seconds = time.perf_counter() - started
+        print(f"{'whole range into pandas':<34}{whole_seconds * 1000:>10.1f}ms"
+              f"{frame.memory_usage(deep=True).sum() / 2 ** 20:>10.1f}MB  ({len(frame):,} rows)")
+        del frame
+
+        print(f"{'page':>8}{'OFFSET':>14}{'keyset':>12}")
+        for page in args.depths:
+            offset = (page - 1) * args.page_size
+            offset_sql = (f"{select} WHERE ts >= ? AND ts < ? ORDER BY ts DESC, user_id DESC "
+                          f"LIMIT {args.page_size} OFFSET {offset}")
+            cursor = None
+            if offset:
+                # The cursor the previous page would have handed back
+                cursor = tuple(conn.execute(f"SELECT ts, user_id FROM sensor_readings WHERE ts >= ? AND ts < ? "
+                                            f"ORDER BY ts DESC, user_id DESC LIMIT 1 OFFSET {offset - 1}",
+                                            bounds).fetchone())
+            offset_times, keyset_times = [], []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                expected = pd.read_sql_query(offset_sql, conn, params=bounds)
+                offset_times.append(time.perf_counter() - started)
+                started = time.perf_counter()
+                got, _ = pagination.fetch_page(conn, select, bounds, keys, where=where, after=cursor,
+                                               page_size=args.page_size)
+                keyset_times.append(time.perf_counter() - started)
+            assert got.equals(expected)
+            print(f"{page:>8,}{_percentile(offset_times, 50) * 1000:>12.2f}ms"
+                  f"{_percentile(keyset_times, 50) * 1000:>10.2f}ms")
+
+        started = time.perf_counter()
+        exact = conn.execute("SELECT COUNT(*) FROM sensor_readings WHERE ts >= ? AND ts < ?", bounds).fetchone()[0]
+        count_seconds = time.perf_counter() - started
+        pagination.estimate_rows(conn, "sensor_readings", *bounds)  # first call samples statistics
+        started = time.perf_counter()
+        estimate = pagination.estimate_rows(conn, "sensor_readings", *bounds)
+        estimate_seconds = time.perf_counter() - started
+        farm_exact = conn.execute("SELECT COUNT(*) FROM sensor_readings WHERE user_id = 'farm0' AND ts >= ? AND ts < ?",
+                                  bounds).fetchone()[0]
+        farm_estimate = pagination.estimate_rows(conn, "sensor_readings", *bounds, user_id="farm0")
+    print(f"{'range total':<14}{'COUNT(*)':>12}{'estimate':>12}")
+    print(f"{'rows':<14}{exact:>12,}{estimate:>12,}  (one farm: {farm_exact:,} vs {farm_estimate:,})")
+    print(f"{'time':<14}{count_seconds * 1000:>10.1f}ms{estimate_seconds * 1000:>10.2f}ms")
+    db.close_all()
+
+# ------------------ EXPORTS ------------------
+def cmd_export(args):
+    path = _temp_db_path("export.db")
+    db.configure(path=path)
+    export.EXPORT_DIR = os.path.join(os.path.dirname(path), "exports")
+    os.makedirs(export.EXPORT_DIR)
+    migrations.ensure_bootstrapped()
+    print(f"Generating {args.rows:,} water_level_history rows...")
+    _fill_water_history(args.rows, args.farms, args.days)
+    select = "SELECT * FROM water_level_history WHERE id <= ?"
+
+    def whole_csv(rows, target):
+        # What the download buttons did: the whole frame as one CSV string
+        with db.connection() as conn:
+            frame = pd.read_sql_query(select, conn, params=[rows])
+        data = frame.to_csv(index=False).encode('utf-8')
+        with open(target, "wb") as f:
+            f.write(data)
+        return len(frame)
+
+    def whole_json(rows, target):
+        # What Export All Data did: every row as a dict, dumped in one go
+        with db.connection() as conn:
+            records = pd.read_sql_query(select, conn, params=[rows]).to_dict('records')
+        with open(target, "w", encoding="utf-8") as f:
+            f.write(json.dumps(records, indent=2, default=str))
+        return len(records)
+
+    def streamed(fmt):
+        return lambda rows, target: export.write_chunks(export.query_chunks(select, [rows]), target, fmt)
+
+    methods = [("whole frame, CSV", ".csv", whole_csv), ("whole frame, JSON", ".json", whole_json)]
+    methods += [(f"streamed, {export.FORMATS[fmt][0]}", export.FORMATS[fmt][1], streamed(fmt))
+                for fmt in export.FORMATS]
+    print(f"{export.CHUNK_ROWS:,} rows per chunk; peak is Python memory traced during the export")
+    print(f"{'method':<28}{'rows':>12}{'time':>10}{'peak':>12}{'file':>12}")
+    for rows in (args.rows // 4, args.rows):
+        for name, suffix, method in methods:
+            if args.no_whole and name.startswith("whole"):
+                continue
+            target = os.path.join(export.EXPORT_DIR, f"bench{suffix}")
+            tracemalloc.start()
+            started = time.perf_counter()
+            written = method(rows, target)
+            seconds = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{name:<28}{written:>12,}{seconds:>9.1f}s{peak / 2 ** 20:>10.1f}MB"
+                  f"{os.path.getsize(target) / 2 ** 20:>10.1f}MB")
+            os.remove(target)
+    db.close_all()
+
+
+# ------------------ CHANGE FEED ------------------
+def cmd_feed(args):
+    path = _temp_db_path("feed.db")
+    db.configure(path=path)
+    export.EXPORT_DIR = os.path.join(os.path.dirname(path), "exports")
+    migrations.ensure_bootstrapped()
+    print(f"Generating {args.rows:,} water_level_history rows...")
+    _fill_water_history(args.rows, args.farms, args.days)
+    farms = [f"farm{i}" for i in range(args.farms)]
+
+    def tick(conn):
+        conn.executemany(readings.UPSERT_STATE, ((user_id, random.uniform(0, 1000), random.uniform(0, 100),
+                                                  random.uniform(20, 95), 0) for user_id in farms))
+        conn.executemany("INSERT INTO water_level_history (user_id, water_level) VALUES (?, ?)",
+                         ((user_id, random.uniform(20, 95)) for user_id in farms))
+
+    def timed(label, run):
+        started = time.perf_counter()
+        target, rows = run()
+        print(f"{label:<34}{rows:>12,}{time.perf_counter() - started:>9.2f}s"
+              f"{os.path.getsize(target) / 2 ** 20:>10.1f}MB")
+        os.remove(target)
+
+    def tick_rate(count):
+        started = time.perf_counter()
+        for _ in range(count):
+            db.write(tick)
+        return count * len(farms) * 2 / (time.perf_counter() - started)
+
+    without_log = tick_rate(args.ticks)
+    print(f"{'export':<34}{'rows':>12}{'time':>10}{'file':>12}")
+    timed("first sync (snapshot)", lambda: export.sync_changes("bench", args.format, write=export.write_parts))
+    with_log = tick_rate(args.ticks)
+    held, _ = changes.backlog()
+    timed("full re-export", lambda: export.write_parts("full", export.table_parts(changes.TABLES), args.format))
+    timed("incremental sync", lambda: export.sync_changes("bench", args.format, write=export.write_parts))
+    print(f"{args.ticks} ticks of {len(farms)} farms held {held:,} log entries "
+          f"({args.ticks * len(farms):,} state updates coalesced to {len(farms):,})")
+    print(f"tick writes: {without_log:,.0f} rows/s with no consumer, {with_log:,.0f} rows/s while logging")
+    db.close_all()
+
+
+# ------------------ USER ACTIVITY ------------------
+# The Users tab before farm_activity: counts recomputed for every listed farm
+LEGACY_USERS_QUERY = """
+    SELECT id, username, user_id, farm_name, location, created_at,
+           (SELECT COUNT(*) FROM sensor_readings WHERE sensor_readings.user_id = users.user_id) AS sensor_records,
+           (SELECT COUNT(*) FROM notifications WHERE notifications.user_id = users.user_id) AS notification_count,
+           (SELECT COUNT(*) FROM water_level_history
+            WHERE water_level_history.user_id = users.user_id) AS history_rows
+    FROM users
+"""
+
+USERS_QUERY = """
+    SELECT u.id, u.username, u.user_id, u.farm_name, u.location, u.created_at,
+           COALESCE(a.sensor_records, 0) AS sensor_records,
+           COALESCE(a.notifications, 0) AS notification_count,
+           COALESCE(a.history_rows, 0) AS history_rows,
+           a.last_activity
+    FROM users u LEFT JOIN farm_activity a ON a.user_id = u.user_id
+"""
+
+
+def cmd_activity(args):
+    db.configure(path=_temp_db_path("activity.db"))
+    migrations.ensure_bootstrapped()
+    farms = [f"farm{i}" for i in range(args.users)]
+    now = int(time.time())
+    print(f"Generating {args.users:,} users with {args.rows:,} rows in each activity table...")
+
+    def fill(conn):
+        conn.executemany('''INSERT INTO users (username, password_hash, user_id, farm_name, location)
+                            VALUES (?, '', ?, ?, 'Bench')''',
+                         ((user_id, user_id, f"Farm {user_id}") for user_id in farms))
+        conn.executemany(readings.RECORD_READING,
+                         ((farms[i % args.users], 500, 80, 50, 0, now - i // args.users)
+                          for i in range(args.rows)))
+        conn.executemany("INSERT INTO notifications (user_id, title, message) VALUES (?, 'Bench', '')",
+                         ((farms[i % args.users],) for i in range(args.rows)))
+        conn.executemany("INSERT INTO water_level_history (user_id, water_level) VALUES (?, ?)",
+                         ((farms[i % args.users], random.uniform(20, 95)) for i in range(args.rows)))
+    started = time.perf_counter()
+    db.write(fill)
+    with_triggers = 3 * args.rows / (time.perf_counter() - started)
+
+    queries = [("correlated COUNT(*)", LEGACY_USERS_QUERY, "id"),
+               ("farm_activity join", USERS_QUERY, "u.id")]
+    print(f"{'Users tab query':<24}{'first page':>12}{'all users':>12}{'top 10':>12}")
+    with db.connection() as conn:
+        for label, sql, key in queries:
+            timings = []
+            for suffix in (f" ORDER BY {key} DESC LIMIT {args.page_size}", f" ORDER BY {key} DESC",
+                           " ORDER BY notification_count DESC LIMIT 10"):
+                best = None
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    conn.execute(sql + suffix).fetchall()
+                    elapsed = time.perf_counter() - started
+                    best = elapsed if best is None else min(best, elapsed)
+                timings.append(best)
+            print(f"{label:<24}" + "".join(f"{seconds * 1000:>10.1f}ms" for seconds in timings))
+
+    def drop_activity_triggers(conn):
+        for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' "
+                                    "AND name LIKE 'trg_%_activity'").fetchall():
+            conn.execute(f"DROP TRIGGER {name}")
+    db.write(drop_activity_triggers)
+    started = time.perf_counter()
+    db.write(lambda conn: conn.executemany(
+        "INSERT INTO notifications (user_id, title, message) VALUES (?, 'Bench', '')",
+        ((farms[i % args.users],) for i in range(args.rows))))
+    without_triggers = args.rows / (time.perf_counter() - started)
+    db.close_all()
+    print(f"activity inserts: {with_triggers:,.0f} rows/s with counters, "
+          f"{without_triggers:,.0f} rows/s without")
+
+
+# ------------------ SYSTEM STATS ------------------
+# What the admin panels and sidebars ran on every rerun
+LEGACY_PANEL_QUERIES = [f"SELECT COUNT(*) FROM {table}" for table in stats.TABLES] + [
+    "SELECT COUNT(DISTINCT user_id) FROM sensor_data WHERE last_update > datetime('now', '-1 day')",
+    "SELECT COUNT(*) FROM notifications WHERE notification_type = 'emergency' "
+    "AND created_at > datetime('now', '-7 days')",
+    "SELECT COUNT(*) FROM notifications WHERE created_at > datetime('now', '-1 day')",
+    "SELECT COUNT(*) FROM water_level_history WHERE created_at > datetime('now', '-1 day')",
+]
+
+
+def cmd_stats(args):
+    db.configure(path=_temp_db_path("stats.db"))
+    migrations.ensure_bootstrapped()
+    print(f"Generating {args.rows:,} water_level_history rows and {args.rows // 10:,} notifications...")
+    _fill_water_history(args.rows, args.farms, args.days)
+    db.write(lambda conn: conn.executemany(
+        "INSERT INTO notifications (user_id, title, message, notification_type) VALUES (?, 'Bench', '', ?)",
+        ((f"farm{i % args.farms}", random.choice(("info", "warning", "emergency")))
+         for i in range(args.rows // 10))))
+
+    def legacy():
+        with db.connection() as conn:
+            for sql in LEGACY_PANEL_QUERIES:
+                conn.execute(sql).fetchone()
+
+    stats.refresh()
+    print(f"{'panel reads':<28}{'per rerun':>12}")
+    for label, read in (("COUNT(*) queries", legacy), ("stats.values()", stats.values),
+                        ("stats.refresh()", stats.refresh)):
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            read()
+        print(f"{label:<28}{(time.perf_counter() - started) / args.repeat * 1000:>10.2f}ms")
+    db.close_all()
+
+
+# ------------------ ENTRY POINT ------------------
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    stress = sub.add_parser("stress", help="concurrent writers and readers against one database")
+    stress.add_argument("--writers", type=int, default=16)
+    stress.add_argument("--readers", type=int, default=32)
+    stress.add_argument("--seconds", type=float, default=10)
+    stress.add_argument("--modes", nargs="+", default=["rollback", "wal"],
+                        choices=["rollback", "wal"])
+    stress.set_defaults(func=cmd_stress)
+
+    init = sub.add_parser("init", help="per-rerun cost of database initialization")
+    init.add_argument("--reruns", type=int, default=1000)
+    init.set_defaults(func=cmd_init)
+
+    date_range = sub.add_parser("date-range", help="DATE() filters against half-open ranges")
+    date_range.add_argument("--rows", type=int, default=2_000_000)
+    date_range.add_argument("--farms", type=int, default=500)
+    date_range.add_argument("--days", type=int, default=365)
+    date_range.add_argument("--repeat", type=int, default=3)
+    date_range.set_defaults(func=cmd_date_range)
+
+    rollup = sub.add_parser("rollups", help="long-range water charts from raw rows against rollups")
+    rollup.add_argument("--rows", type=int, default=2_000_000)
+    rollup.add_argument("--farms", type=int, default=500)
+    rollup.add_argument("--days", type=int, default=30)
+    rollup.add_argument("--repeat", type=int, default=3)
+    rollup.set_defaults(func=cmd_rollups)
+
+    simulate = sub.add_parser("simulate", help="per-farm simulation loop against one fleet-wide step")
+    simulate.add_argument("--farms", type=int, default=100_000)
+    simulate.add_argument("--sample", type=int, default=1000)
+    simulate.add_argument("--repeat", type=int, default=3)
+    simulate.set_defaults(func=cmd_simulate)
+
+    tick = sub.add_parser("tick", help="latency and commits of one farm's simulation tick")
+    tick.add_argument("--farms", type=int, default=100)
+    tick.add_argument("--ticks", type=int, default=2000)
+    tick.add_argument("--modes", nargs="+", default=["rollback", "wal"],
+                      choices=["rollback", "wal"])
+    tick.set_defaults(func=cmd_tick)
+
+    buffer = sub.add_parser("buffer", help="committed single-row inserts against the write-behind buffer")
+    buffer.add_argument("--rows", type=int, default=20_000)
+    buffer.add_argument("--threads", type=int, default=4)
+    buffer.add_argument("--modes", nargs="+", default=["rollback", "wal"],
+                        choices=["rollback", "wal"])
+    buffer.set_defaults(func=cmd_buffer)
+
+    read_cache = sub.add_parser("cache", help="dashboard reads from SQLite against the versioned cache")
+    read_cache.add_argument("--farms", type=int, default=50)
+    read_cache.add_argument("--reruns", type=int, default=20_000)
+    read_cache.add_argument("--write-every", type=int, default=10)
+    read_cache.set_defaults(func=cmd_cache)
+
+    changes = sub.add_parser("changes", help="polling table change counters against re-querying")
+    changes.add_argument("--polls", type=int, default=20_000)
+    changes.add_argument("--rows", type=int, default=100_000)
+    changes.set_defaults(func=cmd_changes)
+
+    delta = sub.add_parser("delta", help="re-reading a live window against reading rows past an id cursor")
+    delta.add_argument("--rows", type=int, default=1_000_000)
+    delta.add_argument("--farms", type=int, default=500)
+    delta.add_argument("--days", type=int, default=7)
+    delta.add_argument("--repeat", type=int, default=3)
+    delta.set_defaults(func=cmd_delta)
+
+    series = sub.add_parser("series", help="dashboard windows from SQLite against in-memory ring buffers")
+    series.add_argument("--farms", type=int, default=1000)
+    series.add_argument("--reads", type=int, default=2000)
+    series.add_argument("--ticks", type=int, default=20)
+    series.set_defaults(func=cmd_series)
+
+    current = sub.add_parser("state", help="latest values from the readings log against the current-state table")
+    current.add_argument("--farms", type=int, default=1000)
+    current.add_argument("--history", type=int, default=720)
+    current.add_argument("--reads", type=int, default=20_000)
+    current.add_argument("--ticks", type=int, default=5)
+    current.set_defaults(func=cmd_state)
+
+    deadband = sub.add_parser("deadband", help="rows stored for every reading against deadband storage")
+    deadband.add_argument("--farms", type=int, default=200)
+    deadband.add_argument("--ticks", type=int, default=720)
+    deadband.set_defaults(func=cmd_deadband)
+
+    encoding = sub.add_parser("encoding", help="text timestamps and REAL values against epoch and fixed-point")
+    encoding.add_argument("--rows", type=int, default=2_000_000)
+    encoding.add_argument("--farms", type=int, default=100)
+    encoding.add_argument("--repeat", type=int, default=20)
+    encoding.set_defaults(func=cmd_encoding)
+
+    reading = sub.add_parser("readings", help="24-hour power curves from raw readings against SQL buckets")
+    reading.add_argument("--farms", type=int, default=20)
+    reading.add_argument("--repeat", type=int, default=50)
+    reading.set_defaults(func=cmd_readings)
+
+    cold = sub.add_parser("archive", help="water history kept in SQLite against the columnar archive")
+    cold.add_argument("--rows", type=int, default=1_000_000)
+    cold.add_argument("--farms", type=int, default=50)
+    cold.add_argument("--days", type=int, default=180)
+    cold.add_argument("--keep-days", type=int, default=30)
+    cold.add_argument("--repeat", type=int, default=50)
+    cold.set_defaults(func=cmd_archive)
+
+    codecs = sub.add_parser("codec", help="archived series as SQLite rows, raw float64 and compressed")
+    codecs.add_argument("--farms", type=int, default=50)
+    codecs.add_argument("--ticks", type=int, default=17280)
+    codecs.add_argument("--repeat", type=int, default=5)
+    codecs.set_defaults(func=cmd_codec)
+
+    pages = sub.add_parser("pages", help="OFFSET against keyset pages, COUNT(*) against estimates")
+    pages.add_argument("--rows", type=int, default=2_000_000)
+    pages.add_argument("--farms", type=int, default=50)
+    pages.add_argument("--days", type=int, default=7)
+    pages.add_argument("--page-size", type=int, default=100)
+    pages.add_argument("--depths", type=int, nargs="+", default=[1, 100, 1000, 5000])
+    pages.add_argument("--repeat", type=int, default=5)
+    pages.set_defaults(func=cmd_pages)
+
+    exports = sub.add_parser("export", help="whole-frame downloads against streamed exports")
+    exports.add_argument("--rows", type=int, default=2_000_000)
+    exports.add_argument("--farms", type=int, default=50)
+    exports.add_argument("--days", type=int, default=180)
+    exports.add_argument("--no-whole", action="store_true", help="only the streamed exports")
+    exports.set_defaults(func=cmd_export)
+
+    feed = sub.add_parser("feed", help="change feed syncs against full re-exports")
+    feed.add_argument("--rows", type=int, default=2_000_000)
+    feed.add_argument("--farms", type=int, default=500)
+    feed.add_argument("--days", type=int, default=180)
+    feed.add_argument("--ticks", type=int, default=100)
+    feed.add_argument("--format", choices=list(export.FORMATS), default="ndjson")
+    feed.set_defaults(func=cmd_feed)
+
+    users = sub.add_parser("activity", help="Users tab with correlated counts against farm_activity")
+    users.add_argument("--users", type=int, default=50_000)
+    users.add_argument("--rows", type=int, default=1_000_000)
+    users.add_argument("--page-size", type=int, default=100)
+    users.add_argument("--repeat", type=int, default=3)
+    users.set_defaults(func=cmd_activity)
+
+    system = sub.add_parser("stats", help="panel COUNT(*) queries against precomputed system stats")
+    system.add_argument("--rows", type=int, default=2_000_000)
+    system.add_argument("--farms", type=int, default=500)
+    system.add_argument("--days", type=int, default=30)
+    system.add_argument("--repeat", type=int, default=5)
+    system.set_defaults(func=cmd_stats)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
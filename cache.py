@@ -0,0 +1,163 @@
+"""Versioned in-process read cache for dashboard data.
+
+Every farm has a data version that writers bump; a cached entry is served
+only while the version it was loaded at is still current. Fleet-wide writes
+bump one shared version instead of every farm's. User account info changes
+far less often than sensor state, so it is cached separately and keyed on the
+users table's change counter (database.table_versions), which also sees
+writes from other processes.
+
+Farm versions live in this process only, so farm state is keyed on them
+together with the dashboard tables' change counters: a farm write committed
+by another process (a dashboard running with AGRIGURD_SIMULATION=0 next to
+the one that simulates) invalidates it too.
+
+LiveSeries holds the newest rows of one farm's history or notifications and
+tops them up with database.rows_since(), so a reload after a write reads only
+the rows added since the last one. Only the MAX_SERIES most recently read
+series are kept; the least recently used one is dropped for a new one.
+"""
+import os
+import pickle
+import threading
+from collections import OrderedDict, deque
+
+import database as db
+
+# Live series kept at once (two per open farm dashboard)
+MAX_SERIES = int(os.environ.get("AGRIGURD_LIVE_SERIES", "2000"))
+
+_lock = threading.Lock()
+_user_versions = {}
+_fleet_version = 0
+
+
+# ------------------ VERSIONS ------------------
+def bump(user_id=None):
+    """Mark one farm's data as changed, or every farm's when user_id is None"""
+    global _fleet_version
+    with _lock:
+        if user_id is None:
+            _fleet_version += 1
+        else:
+            _user_versions[user_id] = _user_versions.get(user_id, 0) + 1
+
+
+def data_version(user_id):
+    with _lock:
+        return _fleet_version, _user_versions.get(user_id, 0)
+
+
+# ------------------ CACHES ------------------
+class VersionedCache:
+    """Values keyed by user_id, each valid for the version it was loaded at
+
+    Values are stored pickled and every hit unpickles a fresh copy, so callers
+    can change what they get back. That is several times cheaper than
+    copy.deepcopy for the nested dicts and lists a dashboard holds.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version, load):
+        """Cached value for ``key`` at ``version``, calling ``load()`` on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                return pickle.loads(entry[1])
+            self.misses += 1
+
+        value = load()
+        # Missing rows are not cached, so a later insert shows up at once
+        if value is not None:
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            with self._lock:
+                self._entries[key] = (version, data)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+
+account_cache = VersionedCache("accounts")
+state_cache = VersionedCache("farm state")
+
+
+# ------------------ LIVE SERIES ------------------
+class LiveSeries:
+    """Newest ``size`` rows of ``table`` for one farm, kept current by id cursor"""
+
+    def __init__(self, table, user_id, size):
+        self.table = table
+        self.user_id = user_id
+        self._lock = threading.Lock()
+        self._rows = deque(maxlen=size)
+        self.cursor = 0
+
+    def refresh(self):
+        """Append rows added since the last refresh and return the series"""
+        with self._lock:
+            rows = db.rows_since(self.table, self.cursor, self.user_id, limit=self._rows.maxlen)
+            if rows:
+                self._rows.extend(rows)
+                self.cursor = rows[-1][0]
+            return list(self._rows)
+
+
+_series_lock = threading.Lock()
+# (table, user_id) -> LiveSeries, least recently read first
+_series = OrderedDict()
+
+
+def live_rows(table, user_id, size):
+    """Newest ``size`` rows of ``table`` for ``user_id``, oldest first"""
+    key = (table, user_id)
+    with _series_lock:
+        series = _series.get(key)
+        if series is None or series._rows.maxlen != size:
+            series = _series[key] = LiveSeries(table, user_id, size)
+        _series.move_to_end(key)
+        while len(_series) > MAX_SERIES:
+            _series.popitem(last=False)
+    return series.refresh()
+
+
+def reset_series(user_id=None):
+    """Reload series from scratch next time, after rows were changed or deleted"""
+    with _series_lock:
+        for key in [key for key in _series if user_id is None or key[1] == user_id]:
+            del _series[key]
+
+
+def invalidate_all():
+    """Drop everything, e.g. after bulk deletes or a database reset"""
+    bump()
+    account_cache.clear()
+    state_cache.clear()
+    reset_series()
+
+
+def stats():
+    """Hit and miss counters per cache"""
+    return {cache.name: cache.stats() for cache in (account_cache, state_cache)}
@@ -0,0 +1,171 @@
+"""Change log of row inserts, updates and deletes for incremental exports.
+
+Triggers on TABLES record every changed row in change_log under a growing
+``seq``: the table, the row's id and the operation. The log holds the latest
+change of each row only, so a farm whose sensor_data row is updated every
+tick takes one entry however many ticks pass. A consumer (a downstream sync
+such as the nightly warehouse load) keeps a watermark, the last seq it has
+taken, and its next sync reads only the entries above it, joined to the rows
+as they are now. Entries are:
+
+    insert, update   the row was written; the joined row has its values
+    delete           the row is gone; only its id is known
+    archive          the row moved from the database into the archive tier
+                     (see archive.py); it was not deleted from history, and
+                     export.change_parts() reads its values back from there
+
+Rows are logged only while at least one consumer is registered, so writes
+pay nothing but a lookup in the tiny change_consumers table otherwise. A new
+consumer starts from a full snapshot taken after it registered, and entries
+every consumer has taken are pruned.
+
+    python changes.py                 # consumers and their watermarks
+    python changes.py forget NAME     # drop a consumer and prune its entries
+"""
+import sys
+
+import database as db
+
+# Tables whose changes are logged; every one has an AUTOINCREMENT id, so an id
+# is never reused by a later row
+TABLES = ("users", "sensor_data", "notifications", "water_level_history")
+
+OPERATIONS = {"INSERT": "NEW", "UPDATE": "NEW", "DELETE": "OLD"}
+
+
+# ------------------ SCHEMA ------------------
+def create_change_log(conn):
+    """Create change_log, change_consumers and the triggers that fill the log"""
+    # AUTOINCREMENT: seq must keep growing even after the log is pruned empty
+    conn.execute('''CREATE TABLE IF NOT EXISTS change_log
+                    (seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                     table_name TEXT NOT NULL,
+                     row_id INTEGER NOT NULL,
+                     op TEXT NOT NULL,
+                     changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    conn.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_change_log_row
+                    ON change_log (table_name, row_id)''')
+    # exported_at stays NULL until the consumer's first snapshot is written
+    conn.execute('''CREATE TABLE IF NOT EXISTS change_consumers
+                    (consumer TEXT PRIMARY KEY,
+                     seq INTEGER NOT NULL,
+                     registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                     exported_at TIMESTAMP)''')
+    for table in TABLES:
+        for event, ref in OPERATIONS.items():
+            # DELETE then INSERT rather than INSERT OR REPLACE: a trigger's
+            # conflict clause gives way to the outer statement's, and the
+            # UPSERTs on sensor_data would turn it into an abort
+            conn.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_log
+                             AFTER {event} ON {table}
+                             WHEN EXISTS (SELECT 1 FROM change_consumers)
+                             BEGIN
+                                 DELETE FROM change_log WHERE table_name = '{table}' AND row_id = {ref}.id;
+                                 INSERT INTO change_log (table_name, row_id, op)
+                                 VALUES ('{table}', {ref}.id, '{event.lower()}');
+                             END''')
+
+
+# ------------------ LOG ------------------
+def last_seq(conn):
+    """Highest seq handed out so far (0 before the first logged change)"""
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+    return row[0] if row else 0
+
+
+def mark_archived(conn, table, after_seq):
+    """Relabel deletes of ``table`` logged after ``after_seq`` as archive moves
+
+    Called on the connection that deleted the archived rows, before it
+    commits, so no other write can have logged a delete in between.
+    """
+    return conn.execute('''UPDATE change_log SET op = 'archive'
+                           WHERE seq > ? AND table_name = ? AND op = 'delete' ''',
+                        (after_seq, table)).rowcount
+
+
+def pending(conn, table, since, upto):
+    """Number of logged changes of ``table`` with ``since < seq <= upto``"""
+    return conn.execute('''SELECT COUNT(*) FROM change_log
+                           WHERE seq > ? AND seq <= ? AND table_name = ?''',
+                        (since, upto, table)).fetchone()[0]
+
+
+def changes_query(conn, table):
+    """SQL for ``table``'s changes with ``since < seq <= upto``, oldest first
+
+    Columns are _seq, _op and the table's own columns as they are now; a
+    deleted or archived row has only its id (see export.change_parts() for
+    archived values). Takes (since, upto).
+    """
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})") if row[1] != "id"]
+    return f'''SELECT c.seq AS _seq, c.op AS _op, c.row_id AS id, {", ".join(f"t.{c}" for c in columns)}
+               FROM change_log c LEFT JOIN {table} t ON t.id = c.row_id
+               WHERE c.seq > ? AND c.seq <= ? AND c.table_name = '{table}'
+               ORDER BY c.seq'''
+
+
+def prune(conn):
+    """Drop entries every consumer has taken; returns the number removed
+
+    With no consumers left nothing reads the log, so it is emptied.
+    """
+    return conn.execute('''DELETE FROM change_log
+                           WHERE seq <= COALESCE((SELECT MIN(seq) FROM change_consumers),
+                                                 (SELECT MAX(seq) FROM change_log))''').rowcount
+
+
+# ------------------ CONSUMERS ------------------
+def register(consumer):
+    """Start logging for ``consumer`` if it is new; returns (seq, needs snapshot)
+
+    Registration holds the log from the current seq on, so nothing the
+    consumer has not taken yet can be pruned while its sync runs. Until a
+    sync has been written (advance()), the consumer is due a full snapshot.
+    """
+    def add(conn):
+        conn.execute('''INSERT INTO change_consumers (consumer, seq) VALUES (?, ?)
+                        ON CONFLICT (consumer) DO NOTHING''', (consumer, last_seq(conn)))
+        seq, exported_at = conn.execute('''SELECT seq, exported_at FROM change_consumers
+                                           WHERE consumer = ?''', (consumer,)).fetchone()
+        return seq, exported_at is None
+    return db.write(add)
+
+
+def advance(consumer, seq):
+    """Record that ``consumer`` has taken every change up to ``seq``, then prune"""
+    def move(conn):
+        conn.execute('''UPDATE change_consumers SET seq = MAX(seq, ?), exported_at = CURRENT_TIMESTAMP
+                        WHERE consumer = ?''', (seq, consumer))
+        return prune(conn)
+    return db.write(move)
+
+
+def forget(consumer):
+    """Remove ``consumer`` and the entries only it was holding"""
+    def drop(conn):
+        conn.execute("DELETE FROM change_consumers WHERE consumer = ?", (consumer,))
+        return prune(conn)
+    return db.write(drop)
+
+
+def consumers():
+    """Rows of (consumer, seq, registered_at, exported_at), oldest first"""
+    with db.connection() as conn:
+        return [tuple(row) for row in conn.execute(
+            "SELECT consumer, seq, registered_at, exported_at FROM change_consumers ORDER BY registered_at")]
+
+
+def backlog():
+    """Entries held in the log and the highest seq handed out"""
+    with db.connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM change_log").fetchone()[0], last_seq(conn)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["forget"] and len(sys.argv) == 3:
+        print(f"Pruned {forget(sys.argv[2])} change log entries")
+    held, seq = backlog()
+    print(f"{held} change log entries held, last seq {seq}")
+    for consumer, seq, registered_at, exported_at in consumers():
+        print(f"{consumer}: seq {seq}, registered {registered_at}, last export {exported_at or 'never'}")
@@ -0,0 +1,137 @@
+"""Compact encodings for archived sensor series.
+
+Three codecs, each turning a 1-D array into a uint8 array and back with
+whole-array NumPy operations (no per-sample Python loop):
+
+    dod    int64 timestamps: first value, first delta, then delta-of-delta.
+           Readings every 5 seconds give a delta-of-delta of 0, one byte each.
+    delta  integers (ids, fixed-point channels): differences from the
+           previous value.
+    xor    float64 values: each value's bits XORed with the previous one's,
+           stored without the zero bytes at either end. An unchanged value
+           costs one byte.
+
+dod and delta zigzag-encode their differences and write them as LEB128
+varints. Every encoded array starts with the sample count as 8 little-endian
+bytes.
+"""
+import numpy as np
+
+_COUNT = np.dtype("<u8")
+
+
+# ------------------ VARINTS ------------------
+def _zigzag(values):
+    values = values.astype(np.int64)
+    return ((values << 1) ^ (values >> 63)).view(np.uint64)
+
+
+def _unzigzag(values):
+    return (values >> np.uint64(1)).view(np.int64) ^ -(values & np.uint64(1)).view(np.int64)
+
+
+def _varint_encode(values):
+    # Seven bits per byte, low bits first; the high bit marks "more follows"
+    lengths = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 64, 7):
+        lengths += (values >> np.uint64(shift)) > 0
+    owner = np.repeat(np.arange(len(values)), lengths)
+    position = np.arange(len(owner)) - (np.cumsum(lengths) - lengths)[owner]
+    out = ((values[owner] >> (7 * position).astype(np.uint64)) & np.uint64(0x7F)).astype(np.uint8)
+    out[position < lengths[owner] - 1] |= 0x80
+    return out
+
+
+def _varint_decode(data):
+    last = (data & 0x80) == 0
+    starts = np.concatenate(([0], np.flatnonzero(last)[:-1] + 1))
+    owner = np.cumsum(last) - last
+    position = np.arange(len(data)) - starts[owner]
+    parts = (data & 0x7F).astype(np.uint64) << (7 * position).astype(np.uint64)
+    if not len(parts):
+        return parts
+    return np.bitwise_or.reduceat(parts, starts)
+
+
+def _with_count(count, payload):
+    return np.concatenate((np.frombuffer(np.array(count, dtype=_COUNT).tobytes(), dtype=np.uint8), payload))
+
+
+def _split_count(data):
+    data = np.asarray(data, dtype=np.uint8)
+    return int(data[:8].view(_COUNT)[0]), data[8:]
+
+
+# ------------------ CODECS ------------------
+def encode_dod(values):
+    values = np.asarray(values, dtype=np.int64)
+    deltas = np.diff(values)
+    stream = np.concatenate((values[:1], deltas[:1], np.diff(deltas)))
+    return _with_count(len(values), _varint_encode(_zigzag(stream)))
+
+
+def decode_dod(data, dtype=np.int64):
+    count, payload = _split_count(data)
+    stream = _unzigzag(_varint_decode(payload))
+    values = np.empty(count, dtype=np.int64)
+    if count:
+        values[0] = stream[0]
+        values[1:] = stream[0] + np.cumsum(np.cumsum(stream[1:]))
+    return values.astype(dtype, copy=False)
+
+
+def encode_delta(values):
+    values = np.asarray(values, dtype=np.int64)
+    return _with_count(len(values), _varint_encode(_zigzag(np.diff(values, prepend=0))))
+
+
+def decode_delta(data, dtype=np.int64):
+    count, payload = _split_count(data)
+    values = np.cumsum(_unzigzag(_varint_decode(payload)))
+    return values[:count].astype(dtype, copy=False)
+
+
+def encode_xor(values):
+    bits = np.asarray(values, dtype=np.float64).view(np.uint64)
+    xored = bits ^ np.concatenate(([np.uint64(0)], bits[:-1]))
+    # Most significant byte first, so sign/exponent sit at the start of a row
+    rows = xored.astype(">u8").view(np.uint8).reshape(-1, 8)
+    nonzero = rows != 0
+    any_set = nonzero.any(axis=1)
+    lead = np.where(any_set, nonzero.argmax(axis=1), 8)
+    trail = np.where(any_set, nonzero[:, ::-1].argmax(axis=1), 0)
+    length = 8 - lead - trail
+    columns = np.arange(8)
+    keep = (columns >= lead[:, None]) & (columns < (lead + length)[:, None])
+    headers = (lead << 4 | length).astype(np.uint8)
+    return _with_count(len(bits), np.concatenate((headers, rows[keep])))
+
+
+def decode_xor(data, dtype=np.float64):
+    count, payload = _split_count(data)
+    headers, body = payload[:count], payload[count:]
+    lead = (headers >> 4).astype(np.int64)
+    length = (headers & 0x0F).astype(np.int64)
+    columns = np.arange(8)
+    keep = (columns >= lead[:, None]) & (columns < (lead + length)[:, None])
+    rows = np.zeros((count, 8), dtype=np.uint8)
+    rows[keep] = body
+    bits = np.bitwise_xor.accumulate(rows.view(">u8").ravel().astype(np.uint64))
+    return bits.view(np.float64).astype(dtype, copy=False)
+
+
+CODECS = {
+    "dod": (encode_dod, decode_dod),
+    "delta": (encode_delta, decode_delta),
+    "xor": (encode_xor, decode_xor),
+}
+
+
+def encode(kind, values):
+    """``values`` encoded with codec ``kind`` as a uint8 array"""
+    return CODECS[kind][0](values)
+
+
+def decode(kind, data, dtype):
+    """The array encode(kind, ...) produced, as ``dtype``"""
+    return CODECS[kind][1](data, dtype)
@@ -0,0 +1,573 @@
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+# ------------------ DATABASE CONFIGURATION ------------------
+DB_PATH = os.environ.get("AGRIGURD_DB_PATH", "smart_agriculture.db")
+
+# Connections kept open per process. Extra connections are opened when the
+# pool is exhausted and closed again as soon as they are returned.
+POOL_SIZE = int(os.environ.get("AGRIGURD_DB_POOL_SIZE", "8"))
+POOL_WAIT_SECONDS = 2.0
+
+# Compiled statements kept per connection, so repeated queries skip the parser
+STATEMENT_CACHE_SIZE = 256
+
+# "wal" lets dashboard reads run alongside writes and sends every write through
+# a single writer thread. "rollback" keeps SQLite's default journal and runs
+# writes on the calling thread.
+STORAGE_MODE = os.environ.get("AGRIGURD_STORAGE_MODE", "wal")
+BUSY_TIMEOUT_MS = int(os.environ.get("AGRIGURD_DB_BUSY_TIMEOUT_MS", "10000"))
+
+# Pending writes allowed before callers block, and how many queued writes the
+# writer thread may commit together in one transaction
+WRITE_QUEUE_SIZE = 1024
+WRITE_BATCH_SIZE = 64
+
+# Write-behind buffer for history rows and non-urgent notifications: flush
+# after this many rows or seconds, and make appenders wait for a flush once
+# this many rows are held in memory
+BUFFER_FLUSH_ROWS = 500
+BUFFER_FLUSH_SECONDS = 1.0
+BUFFER_MAX_ROWS = 10000
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------ WRITE STATISTICS ------------------
+_stats_lock = threading.Lock()
+_stats = {"writes": 0, "commits": 0, "rows_changed": 0}
+
+
+def _count(**deltas):
+    with _stats_lock:
+        for key, value in deltas.items():
+            _stats[key] += value
+
+
+def write_stats():
+    """Writes requested, transactions committed and rows changed so far"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_write_stats():
+    with _stats_lock:
+        for key in _stats:
+            _stats[key] = 0
+
+
+# ------------------ CONNECTIONS ------------------
+def open_connection(path=DB_PATH, mode=STORAGE_MODE):
+    """Open a connection configured for the given storage mode"""
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    if mode == "wal":
+        conn.execute("PRAGMA journal_mode = WAL")
+        # WAL is still crash-safe with NORMAL; it only skips the fsync per commit
+        conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+# ------------------ CONNECTION POOL ------------------
+class ConnectionPool:
+    """Per-process pool of SQLite connections shared by app.py and log.py"""
+
+    def __init__(self, path=DB_PATH, size=POOL_SIZE, mode=STORAGE_MODE):
+        self.path = path
+        self.size = size
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._local = threading.local()
+        self._idle = queue.LifoQueue()
+        self._open = set()
+        self._generation = getattr(self, "_generation", 0) + 1
+
+    def _connect(self):
+        return open_connection(self.path, self.mode)
+
+    def _acquire(self):
+        with self._lock:
+            # A forked child must never reuse the parent's file handles
+            if self._pid != os.getpid():
+                self._reset()
+            generation = self._generation
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_open = len(self._open) < self.size
+        if not can_open:
+            try:
+                return self._idle.get(timeout=POOL_WAIT_SECONDS)
+            except queue.Empty:
+                pass
+
+        conn = self._connect()
+        with self._lock:
+            if can_open and generation == self._generation:
+                self._open.add(conn)
+        return conn
+
+    def _release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            pooled = conn in self._open
+        if pooled:
+            self._idle.put(conn)
+        else:
+            conn.close()
+
+    def held(self):
+        """Connection currently borrowed by this thread, if any"""
+        return getattr(self._local, "conn", None)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; nested calls on the same thread share it"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._release(conn)
+
+    def close_all(self):
+        """Close every idle connection and detach the ones still borrowed"""
+        with self._lock:
+            self._open.clear()
+            idle, self._idle = self._idle, queue.LifoQueue()
+            self._generation += 1
+        while True:
+            try:
+                idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+# ------------------ SINGLE WRITER ------------------
+class WriteQueue:
+    """Dedicated writer thread that applies queued writes in small batches"""
+
+    def __init__(self, path=DB_PATH, mode=STORAGE_MODE, maxsize=WRITE_QUEUE_SIZE):
+        self.path = path
+        self.mode = mode
+        self._jobs = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.conn = None
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="agrigurd-db-writer",
+                                                daemon=True)
+                self._thread.start()
+
+    def in_writer_thread(self):
+        return threading.current_thread() is self._thread
+
+    def submit(self, func, *args):
+        """Queue ``func(conn, *args)``; blocks only while the queue is full"""
+        self._ensure_started()
+        future = Future()
+        self._jobs.put((func, args, future))
+        return future
+
+    def _run(self):
+        conn = self.conn = open_connection(self.path, self.mode)
+        try:
+            while True:
+                job = self._jobs.get()
+                if job is None:
+                    break
+                batch = [job]
+                while len(batch) < WRITE_BATCH_SIZE:
+                    try:
+                        job = self._jobs.get_nowait()
+                    except queue.Empty:
+                        break
+                    if job is None:
+                        self._jobs.put(None)
+                        break
+                    batch.append(job)
+                self._apply(conn, batch)
+        finally:
+            conn.close()
+
+    def _apply(self, conn, batch):
+        # One commit for the whole batch; a savepoint per job keeps one failing
+        # write from undoing the others
+        outcomes = []
+        changes_before = conn.total_changes
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for func, args, future in batch:
+                conn.execute("SAVEPOINT job")
+                try:
+                    outcomes.append((future, func(conn, *args), None))
+                    conn.execute("RELEASE job")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                    outcomes.append((future, None, e))
+            conn.commit()
+            _count(writes=len(batch), commits=1, rows_changed=conn.total_changes - changes_before)
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            outcomes = [(future, None, e) for _, _, future in batch]
+
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def stop(self):
+        """Apply everything still queued, then stop the writer thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._jobs.put(None)
+            thread.join()
+
+
+# ------------------ WRITE-BEHIND BUFFER ------------------
+# Rows are (user_id, ..., created_at); created_at is taken when the row is
+# buffered so a late flush keeps the original time
+BUFFERED_INSERTS = {
+    "water_level_history": '''INSERT INTO water_level_history (user_id, water_level, created_at)
+                              VALUES (?, ?, ?)''',
+    "notifications": '''INSERT INTO notifications (user_id, title, message, notification_type, created_at)
+                        VALUES (?, ?, ?, ?, ?)''',
+}
+
+
+def utc_timestamp():
+    """Current time in the format CURRENT_TIMESTAMP stores"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class WriteBehindBuffer:
+    """Collects append-only inserts and writes them with one executemany per table"""
+
+    def __init__(self, flush_rows=BUFFER_FLUSH_ROWS, flush_seconds=BUFFER_FLUSH_SECONDS,
+                 max_rows=BUFFER_MAX_ROWS):
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._rows = {table: [] for table in BUFFERED_INSERTS}
+        self._size = 0
+        self._inflight = []
+        self._timer = None
+
+    def append(self, table, *values):
+        """Buffer one row for ``table``; returns the row as it will be stored"""
+        row = values + (utc_timestamp(),)
+        with self._lock:
+            self._rows[table].append(row)
+            self._size += 1
+            size = self._size
+            held = size + sum(entry["size"] for entry in self._inflight)
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_seconds, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if held >= self.max_rows:
+            # Memory bound reached: the caller waits until the rows are on disk
+            self.flush(wait=True)
+        elif size >= self.flush_rows:
+            self.flush()
+        return row
+
+    def flush(self, wait=False):
+        """Hand everything buffered to the writer; ``wait`` blocks until committed"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            waiting = list(self._inflight)
+            entry = None
+            if self._size:
+                entry = {"rows": self._rows, "size": self._size, "future": None}
+                self._rows = {table: [] for table in BUFFERED_INSERTS}
+                self._size = 0
+                self._inflight.append(entry)
+
+        if entry is not None:
+            entry["future"] = write(self._insert, entry["rows"], wait=False)
+            entry["future"].add_done_callback(lambda future: self._done(entry, future))
+            waiting.append(entry)
+        if wait:
+            for pending in waiting:
+                if pending["future"] is not None:
+                    pending["future"].exception()
+
+    def _insert(self, conn, rows):
+        for table, sql in BUFFERED_INSERTS.items():
+            if rows[table]:
+                conn.executemany(sql, rows[table])
+
+    def _done(self, entry, future):
+        # Rows stay visible through pending() until their commit has finished
+        with self._lock:
+            self._inflight.remove(entry)
+        if future.exception() is not None:
+            logger.error("Write-behind flush of %s rows failed: %s", entry["size"], future.exception())
+
+    def pending(self, table, user_id):
+        """Rows for ``user_id`` that are buffered or still being flushed"""
+        with self._lock:
+            batches = [self._rows] + [entry["rows"] for entry in self._inflight]
+            return [row for rows in batches for row in rows[table] if row[0] == user_id]
+
+
+# ------------------ CHANGE DETECTION ------------------
+class ChangeWatcher:
+    """Cheap polling for "has anything been committed since I last looked?"
+
+    PRAGMA data_version on a connection of its own changes whenever any other
+    connection, in this process or another, commits to the database. Only
+    then are the per-table counters in change_counters read again, so a poll
+    with nothing new costs one pragma.
+    """
+
+    def __init__(self, path=DB_PATH, mode=STORAGE_MODE):
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._data_version = None
+        self._tables = {}
+
+    def poll(self):
+        """Change counter per table, re-read only when something was committed"""
+        with self._lock:
+            if self._conn is None or self._pid != os.getpid():
+                # Never use a connection inherited across fork
+                self._conn = open_connection(self.path, self.mode)
+                self._pid = os.getpid()
+                self._data_version = None
+            version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if version != self._data_version:
+                try:
+                    rows = self._conn.execute("SELECT table_name, changes FROM change_counters").fetchall()
+                except sqlite3.OperationalError:
+                    # Not migrated yet: report no counters rather than fail
+                    rows = []
+                self._tables = dict(rows)
+                self._data_version = version
+            return dict(self._tables)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+_pool = ConnectionPool()
+_writer = WriteQueue()
+_buffer = WriteBehindBuffer()
+_watcher = ChangeWatcher()
+
+
+def connection():
+    """Borrow a pooled connection for the duration of a ``with`` block"""
+    return _pool.connection()
+
+
+@contextmanager
+def transaction():
+    """Borrow a pooled connection and commit on success, roll back on error"""
+    with _pool.connection() as conn:
+        # Inner blocks join the transaction that is already open
+        if conn.in_transaction:
+            yield conn
+            return
+
+        # Take the write lock up front so a read-then-write never has to upgrade
+        changes_before = conn.total_changes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        _count(commits=1, rows_changed=conn.total_changes - changes_before)
+
+
+def write(func, *args, wait=True):
+    """Run ``func(conn, *args)`` inside a write transaction and return its result
+
+    In WAL mode the call is handed to the writer thread; with ``wait=False``
+    a Future is returned instead of blocking for the result.
+    """
+    held = _pool.held()
+    if _writer.in_writer_thread():
+        # Writes issued by a queued job run in that job's transaction
+        result = func(_writer.conn, *args)
+    elif _pool.mode != "wal" or (held is not None and held.in_transaction):
+        # Writes issued inside an open transaction join it instead of queueing
+        # behind it
+        _count(writes=1)
+        with transaction() as conn:
+            result = func(conn, *args)
+    else:
+        future = _writer.submit(func, *args)
+        return future.result() if wait else future
+
+    if wait:
+        return result
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def execute(sql, params=(), wait=True):
+    """Run a single write statement and return the number of rows it changed"""
+    return write(lambda conn: conn.execute(sql, params).rowcount, wait=wait)
+
+
+def insert_later(table, *values):
+    """Queue an append-only row for ``table`` on the write-behind buffer
+
+    The row is written by a later batched flush; until then buffered_rows()
+    returns it so readers are not stale.
+    """
+    return _buffer.append(table, *values)
+
+
+def buffered_rows(table, user_id):
+    """Rows for ``user_id`` queued with insert_later() and not yet committed"""
+    return _buffer.pending(table, user_id)
+
+
+def flush_buffer(wait=True):
+    """Write out every buffered row now"""
+    _buffer.flush(wait=wait)
+
+
+def table_versions(tables=None):
+    """Change counter per table (all watched tables by default)
+
+    Counters only grow, so a caller that kept the result of an earlier call
+    can compare it with a new one to see whether anything it shows changed.
+    Rows still held by the write-behind buffer are not counted until flushed.
+    """
+    versions = _watcher.poll()
+    if tables is None:
+        return versions
+    return {table: versions.get(table, 0) for table in tables}
+
+
+# ------------------ DELTA READS ------------------
+# Columns returned by rows_since(); id always comes first and is the cursor
+DELTA_COLUMNS = {
+    "water_level_history": ("id", "user_id", "water_level", "created_at"),
+    "notifications": ("id", "user_id", "title", "message", "notification_type", "created_at", "is_read"),
+}
+
+
+def rows_since(table, after_id=0, user_id=None, limit=None):
+    """Rows of ``table`` with id above ``after_id``, oldest first
+
+    Callers keep the id of the last row they saw and pass it back next time,
+    so a live view reads only what was added since. With ``limit`` only the
+    newest ``limit`` of those rows are returned. Updates to rows the caller
+    already holds (such as is_read) are not picked up.
+    """
+    where, params = "id > ?", [after_id]
+    if user_id is not None:
+        where += " AND user_id = ?"
+        params.append(user_id)
+    sql = f"SELECT {', '.join(DELTA_COLUMNS[table])} FROM {table} WHERE {where} ORDER BY id DESC"
+    if limit is not None:
+        sql += f" LIMIT {int(limit)}"
+    with connection() as conn:
+        rows = [tuple(row) for row in conn.execute(sql, params)]
+    rows.reverse()
+    return rows
+
+
+def day_range(start_date, end_date):
+    """Half-open ``[start, end)`` text bounds covering whole days start_date..end_date
+
+    Timestamps are stored as 'YYYY-MM-DD HH:MM:SS', so comparing the bare column
+    against these bounds matches ``DATE(col) BETWEEN start AND end`` while still
+    letting SQLite use an index on the column.
+    """
+    return (start_date.strftime('%Y-%m-%d'),
+            (end_date + timedelta(days=1)).strftime('%Y-%m-%d'))
+
+
+# Tables timed by integer epoch seconds instead of a created_at timestamp
+EPOCH_COLUMNS = {"sensor_readings": "ts"}
+
+
+def purge_old_rows(cutoff_date, tables=("water_level_history", "notifications", "sensor_readings")):
+    """Delete rows created before ``cutoff_date``; returns deleted counts per table"""
+    def purge(conn):
+        deleted = {}
+        for table in tables:
+            if table in EPOCH_COLUMNS:
+                sql = f"DELETE FROM {table} WHERE {EPOCH_COLUMNS[table]} < CAST(strftime('%s', ?) AS INTEGER)"
+            else:
+                # 'YYYY-MM-DD' sorts before every timestamp on that day, so this is
+                # DATE(created_at) < cutoff_date in a form that can use an index
+                sql = f"DELETE FROM {table} WHERE created_at < ?"
+            deleted[table] = conn.execute(sql, (cutoff_date,)).rowcount
+        return deleted
+    return write(purge)
+
+
+def configure(path=None, mode=None):
+    """Point the module at another database file or storage mode"""
+    global DB_PATH, _pool, _writer, _watcher
+    close_all()
+    DB_PATH = path or DB_PATH
+    mode = mode or _pool.mode
+    _pool = ConnectionPool(DB_PATH, mode=mode)
+    _writer = WriteQueue(DB_PATH, mode)
+    _watcher = ChangeWatcher(DB_PATH, mode)
+
+
+def close_all():
+    """Close pooled connections, e.g. before the database file is replaced"""
+    _buffer.flush(wait=True)
+    _writer.stop()
+    _pool.close_all()
+    _watcher.close()
+
+
+@atexit.register
+def _stop_writer():
+    # Buffered rows go out before the writer thread stops
+    _buffer.flush(wait=True)
+    _writer.stop()
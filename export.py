@@ -0,0 +1,379 @@
+"""Streaming exports of query results to files on disk.
+
+Rows are read CHUNK_ROWS at a time (pandas' chunksize fetches from the
+cursor as the frames are consumed) and appended to the output file, so an
+export holds one chunk in memory however many rows it covers:
+
+    csv      gzip-compressed CSV with one header line
+    ndjson   gzip-compressed newline-delimited JSON, one object per row
+    parquet  columnar Parquet with one row group per chunk (pyarrow, which
+             Streamlit already depends on)
+
+Files are written under export_dir() as <name>.part and renamed once
+complete, so a half-written export is never offered for download.
+
+Change feed consumers (see changes.py) sync incrementally: the first sync is
+a snapshot of every table, later ones hold only the rows changed since the
+consumer's watermark, so a sync costs time in proportion to what changed.
+
+    python export.py changes NAME [csv|ndjson|parquet]   # next sync of NAME
+"""
+import contextlib
+import gzip
+import os
+import re
+import sys
+import time
+import zipfile
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+
+import archive
+import changes
+import database as db
+import pagination
+import readings
+
+# Defaults to a directory next to the database file
+EXPORT_DIR = os.environ.get("AGRIGURD_EXPORT_DIR")
+
+CHUNK_ROWS = int(os.environ.get("AGRIGURD_EXPORT_CHUNK_ROWS", "50000"))
+GZIP_LEVEL = 6
+
+# Streamlit refuses messages above 200 MB; bigger exports stay on disk
+DOWNLOAD_MAX_BYTES = 200 * 2 ** 20
+
+# Finished exports are removed this long after they were written
+KEEP_SECONDS = 24 * 3600
+
+# format -> (label, file suffix, MIME type)
+FORMATS = {
+    "csv": ("CSV (gzip)", ".csv.gz", "application/gzip"),
+    "ndjson": ("NDJSON (gzip)", ".ndjson.gz", "application/gzip"),
+    "parquet": ("Parquet", ".parquet", "application/vnd.apache.parquet"),
+}
+
+
+def export_dir():
+    return EXPORT_DIR or os.path.splitext(db.DB_PATH)[0] + "_exports"
+
+
+# ------------------ CHUNKS ------------------
+def query_chunks(sql, params=(), transform=None):
+    """Frames of up to CHUNK_ROWS rows of ``sql``, read as they are consumed
+
+    ``transform`` is applied to each frame before it is handed on. The
+    connection stays borrowed until the last frame has been read.
+    """
+    with db.connection() as conn:
+        for frame in pd.read_sql_query(sql, conn, params=list(params), chunksize=CHUNK_ROWS):
+            yield transform(frame) if transform else frame
+
+
+def chain_chunks(*sources, transform=None):
+    """Frames of each of ``sources`` in turn, passed through ``transform``
+
+    Closing the result closes every source, so a query_chunks() source
+    hands its connection back on this thread even if the export stops early.
+    """
+    try:
+        for source in sources:
+            for frame in source:
+                yield transform(frame) if transform else frame
+    finally:
+        for source in sources:
+            if hasattr(source, "close"):
+                source.close()
+
+
+# ------------------ WRITERS ------------------
+def _arrow(frame, schema):
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    if schema is None:
+        # A column with no values in the first chunk is written as text
+        schema = pa.schema([pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f
+                            for f in table.schema])
+    return table.cast(schema), schema
+
+
+def _write_parquet(chunks, path, progress):
+    rows, schema, writer, empty = 0, None, None, None
+    try:
+        for frame in chunks:
+            if frame.empty:
+                # An empty frame has no column types, only the names
+                empty = frame
+                continue
+            table, schema = _arrow(frame, schema)
+            if writer is None:
+                writer = pq.ParquetWriter(path, schema, compression="zstd")
+            writer.write_table(table)
+            rows += len(frame)
+            if progress:
+                progress(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        pq.write_table(pa.table({}) if empty is None else _arrow(empty, None)[0], path)
+    return rows
+
+
+def _write_text(chunks, path, fmt, progress):
+    rows, header = 0, True
+    with gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=GZIP_LEVEL) as out:
+        for frame in chunks:
+            if fmt == "csv":
+                frame.to_csv(out, header=header, index=False)
+                header = False
+            elif len(frame):
+                # Each chunk ends with a newline, so chunks join into one stream
+                frame.to_json(out, orient="records", lines=True, date_format="iso")
+            rows += len(frame)
+            if progress:
+                progress(rows)
+    return rows
+
+
+def write_chunks(chunks, path, fmt, progress=None):
+    """Write the frames from ``chunks`` to ``path`` as ``fmt``; returns the rows written
+
+    Every frame must have the same columns. ``progress`` is called with the
+    running row count after each chunk.
+    """
+    tmp = path + ".part"
+    try:
+        if fmt == "parquet":
+            rows = _write_parquet(chunks, tmp, progress)
+        else:
+            rows = _write_text(chunks, tmp, fmt, progress)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    finally:
+        # Hands a borrowed connection back even if writing stopped early
+        if hasattr(chunks, "close"):
+            chunks.close()
+    os.replace(tmp, path)
+    return rows
+
+
+# ------------------ EXPORTS ------------------
+def _remove_stale(folder):
+    cutoff = time.time() - KEEP_SECONDS
+    for entry in os.scandir(folder):
+        if entry.is_file() and entry.stat().st_mtime < cutoff:
+            os.remove(entry.path)
+
+
+def write_parts(name, parts, fmt, progress=None):
+    """Write ``parts`` to disk; returns (path, rows written)
+
+    ``parts`` is a list of (part name, chunks, estimated rows). A single part
+    becomes one file; several are written one after another and bundled
+    into a zip (stored as is, since each file is already compressed).
+    ``progress`` is called with the part, the running row count and the
+    estimated total.
+    """
+    folder = export_dir()
+    os.makedirs(folder, exist_ok=True)
+    _remove_stale(folder)
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    suffix = FORMATS[fmt][1]
+    total = sum(estimate for _, _, estimate in parts)
+
+    done, files = 0, []
+    with contextlib.ExitStack() as stack:
+        # Parts not reached yet are closed too if an earlier one fails
+        for _, chunks, _ in parts:
+            if hasattr(chunks, "close"):
+                stack.enter_context(contextlib.closing(chunks))
+        for part, chunks, _ in parts:
+            def report(rows, part=part):
+                if progress:
+                    progress(part, done + rows, total)
+            path = os.path.join(folder, f"{part}_{stamp}{suffix}")
+            done += write_chunks(chunks, path, fmt, report)
+            files.append(path)
+
+    if len(files) == 1:
+        return files[0], done
+    path = os.path.join(folder, f"{name}_{stamp}.zip")
+    with zipfile.ZipFile(path + ".part", "w", zipfile.ZIP_STORED) as bundle:
+        for file in files:
+            bundle.write(file, os.path.basename(file))
+    os.replace(path + ".part", path)
+    for file in files:
+        os.remove(file)
+    return path, done
+
+
+def run_export(name, parts, fmt):
+    """write_parts() under a progress bar; returns (path, rows written)"""
+    bar = st.progress(0.0, text=f"Exporting {name}...")
+
+    def progress(part, rows, total):
+        # Estimates can fall short, so the bar stops just before the end
+        fraction = min(rows / total, 0.99) if total else 0.0
+        bar.progress(fraction, text=f"Exporting {part}: {rows:,} rows")
+
+    path, rows = write_parts(name, parts, fmt, progress)
+    bar.empty()
+    return path, rows
+
+
+def table_parts(tables, transform=None):
+    """Parts streaming every row of ``tables``; archived history follows the live rows
+
+    ``transform`` is applied to each frame after sensor readings are decoded.
+    """
+    parts = []
+    with db.connection() as conn:
+        for table in tables:
+            steps = [readings.decode] if table == "sensor_readings" else []
+            steps += [transform] if transform else []
+
+            def apply(frame, steps=steps):
+                for step in steps:
+                    frame = step(frame)
+                return frame
+            sources = [query_chunks(f"SELECT * FROM {table}")]
+            estimate = pagination.estimate_rows(conn, table)
+            if table in archive.TABLES:
+                sources.append(archive.table_chunks(table))
+                estimate += archive.estimate_rows(table)
+            parts.append((table, chain_chunks(*sources, transform=apply if steps else None), estimate))
+    return parts
+
+
+# ------------------ CHANGE FEED ------------------
+def change_parts(consumer):
+    """Parts of ``consumer``'s next sync; returns (parts, since, upto)
+
+    Registers the consumer if it is new. Its first sync is a snapshot of
+    every table in changes.TABLES, with archived history; later ones hold
+    the rows changed with ``since < seq <= upto``. Every row carries _seq and
+    _op columns (op "snapshot" in a snapshot); archived rows carry the values
+    they were archived with. Rows are read as they are when
+    the export runs, so a row changed meanwhile comes again next sync with
+    the same values: applying a sync is an upsert or delete by table and id.
+    """
+    since, snapshot = changes.register(consumer)
+    with db.connection() as conn:
+        upto = changes.last_seq(conn)
+        if snapshot:
+            def tag(frame):
+                frame.insert(0, "_op", "snapshot")
+                frame.insert(0, "_seq", upto)
+                return frame
+            return table_parts(changes.TABLES, tag), since, upto
+        parts = [(table, query_chunks(changes.changes_query(conn, table), (since, upto),
+                                      _with_archived(table) if table in archive.TABLES else None),
+                  changes.pending(conn, table, since, upto))
+                 for table in changes.TABLES]
+    return parts, since, upto
+
+
+def _with_archived(table):
+    # An archive entry may be the only one a consumer gets for a row inserted
+    # after its watermark, so it carries the row's values read back from the
+    # archive tier
+    key = archive.TABLES[table]["key"]
+
+    def fill(frame):
+        moved = frame["_op"] == "archive"
+        if moved.any():
+            found = archive.rows_by_key(table, frame.loc[moved, key])
+            if not found.empty:
+                found = found.set_index(key)
+                for column in found.columns:
+                    frame.loc[moved, column] = frame.loc[moved, key].map(found[column])
+        return frame
+    return fill
+
+
+def sync_changes(consumer, fmt, write=run_export):
+    """Export ``consumer``'s next sync, then move its watermark; returns (path, rows)
+
+    The watermark only moves once the files are complete, so a sync that
+    fails is read again in full next time.
+    """
+    parts, since, upto = change_parts(consumer)
+    name = f"changes_{re.sub(r'[^A-Za-z0-9_-]', '_', consumer)}_{since}-{upto}"
+    path, rows = write(name, parts, fmt)
+    changes.advance(consumer, upto)
+    return path, rows
+
+
+def download_button(path, key, label="📥 Download Export"):
+    """Offer a finished export for download, or say where it is if too large"""
+    size = os.path.getsize(path)
+    if size > DOWNLOAD_MAX_BYTES:
+        st.info(f"Export written to {path} ({size / 2 ** 20:.1f} MB), too large to send through the browser.")
+        return
+    mime = "application/zip" if path.endswith(".zip") else next(
+        mime for _, suffix, mime in FORMATS.values() if path.endswith(suffix))
+    with open(path, "rb") as f:
+        st.download_button(label=label, data=f, file_name=os.path.basename(path), mime=mime,
+                           key=f"{key}_download", use_container_width=True)
+
+
+def export_controls(key, name, parts, filters, label="📦 Export All Rows"):
+    """Format picker, export button and the download of the last export
+
+    ``parts`` is a callable returning run_export()'s parts, so nothing is
+    read until the button is pressed. An export is offered for download
+    only while ``filters`` stay what they were when it ran.
+    """
+    col1, col2 = st.columns(2)
+    with col1:
+        fmt = st.selectbox("Export Format", list(FORMATS), format_func=lambda f: FORMATS[f][0],
+                           key=f"{key}_format", label_visibility="collapsed")
+    with col2:
+        if st.button(label, key=f"{key}_export", use_container_width=True):
+            path, rows = run_export(name, parts(), fmt)
+            st.session_state[key] = {"filters": filters, "path": path, "rows": rows}
+
+    last = st.session_state.get(key)
+    if last and last["filters"] == filters and os.path.exists(last["path"]):
+        st.caption(f"Exported {last['rows']:,} rows to {os.path.basename(last['path'])}")
+        download_button(last["path"], key)
+
+
+def change_controls(consumer, key):
+    """Format picker and sync button for ``consumer``, with the download of its last sync"""
+    col1, col2 = st.columns(2)
+    with col1:
+        fmt = st.selectbox("Export Format", list(FORMATS), format_func=lambda f: FORMATS[f][0],
+                           key=f"{key}_format", label_visibility="collapsed")
+    with col2:
+        if st.button("🔁 Export Changes", key=f"{key}_export", use_container_width=True,
+                     help=f"Rows changed since the last '{consumer}' sync; the first sync is a full snapshot"):
+            path, rows = sync_changes(consumer, fmt)
+            st.session_state[key] = {"path": path, "rows": rows}
+
+    last = st.session_state.get(key)
+    if last and os.path.exists(last["path"]):
+        st.caption(f"Exported {last['rows']:,} changed rows to {os.path.basename(last['path'])}")
+        download_button(last["path"], key)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4) or sys.argv[1] != "changes" or sys.argv[3:] and sys.argv[3] not in FORMATS:
+        sys.exit(f"usage: python export.py changes NAME [{'|'.join(FORMATS)}]")
+
+    def printed(name, parts, fmt):
+        def progress(part, rows, total):
+            print(f"\r{part}: {rows:,} rows", end="", flush=True)
+        path, rows = write_parts(name, parts, fmt, progress)
+        print()
+        return path, rows
+
+    path, rows = sync_changes(sys.argv[2], sys.argv[3] if sys.argv[3:] else "ndjson", write=printed)
+    print(f"Wrote {rows:,} rows to {path}")
+    db.close_all()
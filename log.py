@@ -1,10 +1,71 @@
 import streamlit as st
-import sqlite3
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
 
+import activity
+import archive
+import database as db
+import export
+import pagination
+import readings
+import rollups
+import stats
+
+# Readings are stored only when they move past their deadband or the heartbeat
+# is due (see readings.StoragePolicy), so counts and averages are over stored
+# samples
+STORED_SAMPLES_HELP = ("Over stored samples: a reading is stored only when it moves past its "
+                       "deadband or the heartbeat is due, so this is not time-weighted.")
+
+
+# Aggregates behind the tab metrics and charts, computed once per filter set so
+# paging through a table does not re-scan the whole range
+def cached_frame(key, sql, params):
+    cached = st.session_state.get(f"viewer_summary_{key}")
+    if cached is None or cached[0] != params:
+        with db.connection() as conn:
+            cached = (params, pd.read_sql_query(sql, conn, params=params))
+        st.session_state[f"viewer_summary_{key}"] = cached
+    return cached[1]
+
+
+def clear_summaries():
+    for key in [key for key in st.session_state if key.startswith("viewer_summary_")]:
+        del st.session_state[key]
+
+
+def sensor_rows(frame):
+    # Fixed-point channels and epoch seconds are converted column-wise
+    readings.decode(frame)
+    frame['last_update'] = pd.to_datetime(frame.pop('ts'), unit='s').dt.strftime('%Y-%m-%d %H:%M:%S')
+    return frame
+
+
+def with_farm_names(frame, columns):
+    """``frame`` joined to the username and farm_name of its farms, as ``columns``"""
+    farm_ids = frame['user_id'].unique().tolist()
+    with db.connection() as conn:
+        farms = pd.read_sql_query(
+            f"SELECT user_id, username, farm_name FROM users "
+            f"WHERE user_id IN ({', '.join('?' * len(farm_ids))})", conn, params=farm_ids)
+    return frame.merge(farms, on="user_id", how="left")[columns]
+
+
+def export_controls(key, sql, where, params, order, total, transform=None, archived=()):
+    """Export every row the tab's filters match, streamed to a file in page order
+
+    ``archived`` holds frames to append after the live rows.
+    """
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY " + order
+    export.export_controls(f"{key}_export", key, lambda: [
+        (key, export.chain_chunks(export.query_chunks(sql, params, transform), archived), total)
+    ], params)
+
+
 # Set page configuration
 
 # Custom CSS for better styling
@@ -57,17 +118,6 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Database connection
-def get_db_connection():
-    conn = sqlite3.connect('smart_agriculture.db')
-    conn.row_factory = sqlite3.Row
-    return conn
-
-# Initialize database connection
-@st.cache_resource
-def init_connection():
-    return get_db_connection()
-
 # Main title
 st.markdown('<div class="main-header">🌾 Smart Agriculture IoT - Data Viewer</div>', unsafe_allow_html=True)
 st.markdown("---")
@@ -85,9 +135,8 @@ with st.sidebar:
         end_date = st.date_input("End Date", value=datetime.now().date())
     
     # User selection
-    conn = get_db_connection()
-    users = conn.execute("SELECT user_id, username, farm_name FROM users ORDER BY username").fetchall()
-    conn.close()
+    with db.connection() as conn:
+        users = conn.execute("SELECT user_id, username, farm_name FROM users ORDER BY username").fetchall()
     
     user_options = ["All Users"] + [f"{user['username']} ({user['user_id']}) - {user['farm_name']}" for user in users]
     selected_user = st.selectbox("Select User", user_options)
@@ -95,35 +144,44 @@ with st.sidebar:
     # Data type selection
     data_types = ["All Data", "Users", "Sensor Data", "Notifications", "Water Level History"]
     selected_data_type = st.selectbox("Data Type", data_types)
+
+    # Rows fetched per table page
+    page_size = st.selectbox("Rows per Page", pagination.PAGE_SIZES,
+                             index=pagination.PAGE_SIZES.index(pagination.PAGE_SIZE)
+                             if pagination.PAGE_SIZE in pagination.PAGE_SIZES else 2)
     
     # Refresh button
     if st.button("🔄 Refresh Data", use_container_width=True):
+        clear_summaries()
         st.rerun()
     
     st.markdown("---")
     st.markdown("### 📊 Quick Stats")
     
-    conn = get_db_connection()
-    
-    # Calculate quick statistics
-    total_users = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
-    
+    # Quick statistics from counters kept as rows are written: system-wide
+    # in system_stats, per farm in farm_activity. Archived water history is
+    # estimated from the archive manifest
+    counts = stats.values()
+    total_users = counts["users_rows"]
+
     if selected_user != "All Users":
         user_id = selected_user.split("(")[1].split(")")[0]
-        total_sensor_records = conn.execute("SELECT COUNT(*) FROM sensor_data WHERE user_id = ?", (user_id,)).fetchone()[0]
-        total_notifications = conn.execute("SELECT COUNT(*) FROM notifications WHERE user_id = ?", (user_id,)).fetchone()[0]
-        total_water_history = conn.execute("SELECT COUNT(*) FROM water_level_history WHERE user_id = ?", (user_id,)).fetchone()[0]
+        with db.connection() as conn:
+            farm = activity.farm_counts(conn, user_id)
+        total_sensor_records = farm["sensor_records"]
+        total_notifications = farm["notifications"]
+        total_water_history = farm["history_rows"]
     else:
-        total_sensor_records = conn.execute("SELECT COUNT(*) FROM sensor_data").fetchone()[0]
-        total_notifications = conn.execute("SELECT COUNT(*) FROM notifications").fetchone()[0]
-        total_water_history = conn.execute("SELECT COUNT(*) FROM water_level_history").fetchone()[0]
-    
-    conn.close()
+        user_id = None
+        total_sensor_records = counts["sensor_readings_rows"]
+        total_notifications = counts["notifications_rows"]
+        total_water_history = counts["water_level_history_rows"]
+    total_water_history += archive.estimate_rows("water_level_history", user_id=user_id)
     
     st.metric("Total Users", total_users)
-    st.metric("Sensor Records", total_sensor_records)
-    st.metric("Notifications", total_notifications)
-    st.metric("Water History", total_water_history)
+    st.metric("Sensor Records", f"{total_sensor_records:,}")
+    st.metric("Notifications", f"{total_notifications:,}")
+    st.metric("Water History", f"≈{total_water_history:,}")
 
 # Main content area
 st.markdown('<div class="sub-header">📋 Database Contents</div>', unsafe_allow_html=True)
@@ -133,58 +191,57 @@ tab1, tab2, tab3, tab4 = st.tabs(["👥 Users", "📡 Sensor Data", "🔔 Notifi
 
 with tab1:
     st.markdown("### Users Table")
-    
-    conn = get_db_connection()
-    
-    # Get users data
-    if selected_user == "All Users":
-        users_df = pd.read_sql_query("""
-            SELECT 
-                id,
-                username,
-                user_id,
-                farm_name,
-                location,
-                created_at,
-                (SELECT COUNT(*) FROM sensor_data WHERE sensor_data.user_id = users.user_id) as sensor_records,
-                (SELECT COUNT(*) FROM notifications WHERE notifications.user_id = users.user_id) as notification_count
-            FROM users 
-            ORDER BY created_at DESC
-        """, conn)
-    else:
+
+    # Users page newest first; id order is creation order and needs no sort.
+    # Activity comes from the per-farm counters kept by triggers (activity.py),
+    # one key lookup per farm instead of counting each farm's rows
+    users_query = """
+        SELECT
+            u.id,
+            u.username,
+            u.user_id,
+            u.farm_name,
+            u.location,
+            u.created_at,
+            COALESCE(a.sensor_records, 0) AS sensor_records,
+            COALESCE(a.notifications, 0) AS notification_count,
+            COALESCE(a.history_rows, 0) AS history_rows,
+            a.last_activity
+        FROM users u
+        LEFT JOIN farm_activity a ON a.user_id = u.user_id
+    """
+    users_where, users_params = [], []
+    if selected_user != "All Users":
         user_id = selected_user.split("(")[1].split(")")[0]
-        users_df = pd.read_sql_query(f"""
-            SELECT 
-                id,
-                username,
-                user_id,
-                farm_name,
-                location,
-                created_at,
-                (SELECT COUNT(*) FROM sensor_data WHERE sensor_data.user_id = users.user_id) as sensor_records,
-                (SELECT COUNT(*) FROM notifications WHERE notifications.user_id = users.user_id) as notification_count
-            FROM users 
-            WHERE user_id = '{user_id}'
-            ORDER BY created_at DESC
-        """, conn)
-    
-    conn.close()
-    
+        users_where.append("u.user_id = ?")
+        users_params.append(user_id)
+
+    users_pager = pagination.pager("users_page", users_params + [page_size])
+    with db.connection() as conn:
+        users_df, users_next = pagination.fetch_page(conn, users_query, users_params, [("u.id", "id")],
+                                                     where=users_where, after=users_pager.after,
+                                                     page_size=page_size)
+    users_summary = cached_frame("users", f"""
+        SELECT COUNT(*) AS users, MIN(created_at) AS oldest
+        FROM users {"WHERE user_id = ?" if users_where else ""}
+    """, users_params)
+
     if not users_df.empty:
         # Display metrics
+        total_users = int(users_summary['users'].iat[0])
         col1, col2, col3, col4 = st.columns(4)
         with col1:
-            st.metric("Total Users", len(users_df))
+            st.metric("Total Users", total_users)
         with col2:
-            avg_records = users_df['sensor_records'].mean()
+            avg_records = total_sensor_records / max(total_users, 1)
             st.metric("Avg Sensor Records", f"{avg_records:.1f}")
         with col3:
-            avg_notifications = users_df['notification_count'].mean()
+            avg_notifications = total_notifications / max(total_users, 1)
             st.metric("Avg Notifications", f"{avg_notifications:.1f}")
         with col4:
-            oldest_user = users_df['created_at'].min()
+            oldest_user = users_summary['oldest'].iat[0]
             st.metric("Oldest User", oldest_user[:10])
-        
+
         # Display dataframe
         st.dataframe(
             users_df,
@@ -197,42 +254,33 @@ with tab1:
                 "location": "Location",
                 "created_at": "Created At",
                 "sensor_records": "Sensor Records",
-                "notification_count": "Notifications"
+                "notification_count": "Notifications",
+                "history_rows": "Water History",
+                "last_activity": "Last Activity"
             }
         )
-        
-        # Export options
-        col1, col2 = st.columns(2)
-        with col1:
-            csv = users_df.to_csv(index=False).encode('utf-8')
-            st.download_button(
-                label="📥 Download as CSV",
-                data=csv,
-                file_name="users_data.csv",
-                mime="text/csv",
-                use_container_width=True
-            )
-        with col2:
-            json_data = users_df.to_json(orient='records', indent=2)
-            st.download_button(
-                label="📥 Download as JSON",
-                data=json_data,
-                file_name="users_data.json",
-                mime="application/json",
-                use_container_width=True
-            )
-        
+        pagination.page_controls(users_pager, users_next, len(users_df), total_users, page_size, "users_page")
+
+        # Every matching row, streamed to a file rather than built in memory
+        export_controls("users", users_query, users_where, users_params, "u.id DESC", total_users)
+
         # Visualization
         st.markdown("### 📈 User Activity Visualization")
-        
+
         col1, col2 = st.columns(2)
         with col1:
             # Users by location
-            if not users_df['location'].isnull().all():
-                location_counts = users_df['location'].value_counts().reset_index()
-                location_counts.columns = ['Location', 'Count']
+            location_counts = cached_frame("user_locations", f"""
+                SELECT location AS Location, COUNT(*) AS Count
+                FROM users
+                WHERE location IS NOT NULL {"AND user_id = ?" if users_where else ""}
+                GROUP BY location
+                ORDER BY Count DESC
+                LIMIT 10
+            """, users_params)
+            if not location_counts.empty:
                 fig1 = px.bar(
-                    location_counts.head(10),
+                    location_counts,
                     x='Location',
                     y='Count',
                     title='Users by Location',
@@ -240,13 +288,16 @@ with tab1:
                     color_continuous_scale='Viridis'
                 )
                 st.plotly_chart(fig1, use_container_width=True)
-        
+
         with col2:
             # Users over time
-            users_df['created_date'] = pd.to_datetime(users_df['created_at']).dt.date
-            daily_users = users_df.groupby('created_date').size().reset_index()
-            daily_users.columns = ['Date', 'New Users']
-            
+            daily_users = cached_frame("daily_users", f"""
+                SELECT DATE(created_at) AS Date, COUNT(*) AS "New Users"
+                FROM users {"WHERE user_id = ?" if users_where else ""}
+                GROUP BY Date
+                ORDER BY Date
+            """, users_params)
+
             fig2 = px.line(
                 daily_users,
                 x='Date',
@@ -260,63 +311,72 @@ with tab1:
 
 with tab2:
     st.markdown("### Sensor Data Table")
-    
-    conn = get_db_connection()
-    
-    # Build query based on filters
-    query = """
-        SELECT 
-            sd.id,
-            sd.user_id,
+
+    # Readings come from the append-only log; sensor_data only holds each
+    # farm's current state. Pages run newest first down the primary key (one
+    # farm) or the ts index (every farm)
+    sensor_query = """
+        SELECT
+            sr.user_id,
             u.username,
             u.farm_name,
-            sd.solar_input,
-            sd.battery_level,
-            sd.water_level,
-            CASE 
-                WHEN sd.drain_status = 1 THEN 'OPEN' 
-                ELSE 'CLOSED' 
+            sr.solar_input,
+            sr.battery_level,
+            sr.water_level,
+            CASE
+                WHEN sr.drain_status = 1 THEN 'OPEN'
+                ELSE 'CLOSED'
             END as drain_status,
-            sd.last_update
-        FROM sensor_data sd
-        LEFT JOIN users u ON sd.user_id = u.user_id
-        WHERE DATE(sd.last_update) BETWEEN ? AND ?
+            sr.ts
+        FROM sensor_readings sr
+        LEFT JOIN users u ON sr.user_id = u.user_id
     """
-    
-    params = [start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')]
-    
+    sensor_where = ["sr.ts >= CAST(strftime('%s', ?) AS INTEGER)", "sr.ts < CAST(strftime('%s', ?) AS INTEGER)"]
+    sensor_params = list(db.day_range(start_date, end_date))
+    sensor_user = None
     if selected_user != "All Users":
-        user_id = selected_user.split("(")[1].split(")")[0]
-        query += " AND sd.user_id = ?"
-        params.append(user_id)
-    
-    query += " ORDER BY sd.last_update DESC"
-    
-    sensor_df = pd.read_sql_query(query, conn, params=params)
-    conn.close()
-    
+        sensor_user = selected_user.split("(")[1].split(")")[0]
+        sensor_where.append("sr.user_id = ?")
+        sensor_params.append(sensor_user)
+
+    sensor_pager = pagination.pager("sensor_page", sensor_params + [page_size])
+    with db.connection() as conn:
+        sensor_df, sensor_next = pagination.fetch_page(
+            conn, sensor_query, sensor_params, [("sr.ts", "ts"), ("sr.user_id", "user_id")],
+            where=sensor_where, after=sensor_pager.after, page_size=page_size)
+        sensor_total = pagination.estimate_rows(conn, "sensor_readings", *sensor_params[:2], user_id=sensor_user)
+
+    sensor_rows(sensor_df)
+
     if not sensor_df.empty:
-        # Display metrics
+        # Display metrics over the whole range, computed once per filter set
+        sensor_summary = cached_frame("sensor", f"""
+            SELECT AVG(solar_input) / {readings.SCALES['solar_input']}.0 AS avg_solar,
+                   AVG(battery_level) / {readings.SCALES['battery_level']}.0 AS avg_battery,
+                   AVG(water_level) / {readings.SCALES['water_level']}.0 AS avg_water,
+                   SUM(drain_status = 1) AS open_drains
+            FROM sensor_readings sr
+            WHERE {" AND ".join(sensor_where)}
+        """, sensor_params).iloc[0]
         col1, col2, col3, col4 = st.columns(4)
         with col1:
-            avg_solar = sensor_df['solar_input'].mean()
-            st.metric("Avg Solar Input", f"{avg_solar:.1f}W")
+            avg_solar = sensor_summary['avg_solar']
+            st.metric("Avg Solar Input", f"{avg_solar:.1f}W", help=STORED_SAMPLES_HELP)
         with col2:
-            avg_battery = sensor_df['battery_level'].mean()
-            st.metric("Avg Battery", f"{avg_battery:.1f}%")
+            avg_battery = sensor_summary['avg_battery']
+            st.metric("Avg Battery", f"{avg_battery:.1f}%", help=STORED_SAMPLES_HELP)
         with col3:
-            avg_water = sensor_df['water_level'].mean()
-            st.metric("Avg Water Level", f"{avg_water:.1f}%")
+            avg_water = sensor_summary['avg_water']
+            st.metric("Avg Water Level", f"{avg_water:.1f}%", help=STORED_SAMPLES_HELP)
         with col4:
-            open_drains = len(sensor_df[sensor_df['drain_status'] == 'OPEN'])
+            open_drains = int(sensor_summary['open_drains'])
             st.metric("Open Drains", open_drains)
-        
+
         # Display dataframe
         st.dataframe(
             sensor_df,
             use_container_width=True,
             column_config={
-                "id": "ID",
                 "user_id": "User ID",
                 "username": "Username",
                 "farm_name": "Farm Name",
@@ -327,58 +387,44 @@ with tab2:
                 "last_update": "Last Update"
             }
         )
-        
-        # Export options
-        col1, col2 = st.columns(2)
-        with col1:
-            csv = sensor_df.to_csv(index=False).encode('utf-8')
-            st.download_button(
-                label="📥 Download as CSV",
-                data=csv,
-                file_name="sensor_data.csv",
-                mime="text/csv",
-                use_container_width=True
-            )
-        with col2:
-            json_data = sensor_df.to_json(orient='records', indent=2)
-            st.download_button(
-                label="📥 Download as JSON",
-                data=json_data,
-                file_name="sensor_data.json",
-                mime="application/json",
-                use_container_width=True
-            )
-        
-        # Visualization
+        pagination.page_controls(sensor_pager, sensor_next, len(sensor_df), sensor_total, page_size, "sensor_page")
+
+        # Every matching row, streamed to a file rather than built in memory
+        export_controls("sensor_data", sensor_query, sensor_where, sensor_params, "sr.ts DESC, sr.user_id DESC",
+                        sensor_total, transform=sensor_rows)
+
+        # Visualization of the readings on this page
         st.markdown("### 📈 Sensor Data Visualization")
-        
+
         if len(sensor_df) > 1:
             col1, col2 = st.columns(2)
-            
+
             with col1:
                 # Time series of sensor readings
                 sensor_df['last_update_dt'] = pd.to_datetime(sensor_df['last_update'])
+                # Oldest first, so each stored reading holds until the next one
+                chart_df = sensor_df.sort_values('last_update_dt')
                 fig1 = go.Figure()
-                
+
                 fig1.add_trace(go.Scatter(
-                    x=sensor_df['last_update_dt'],
-                    y=sensor_df['solar_input'],
+                    x=chart_df['last_update_dt'],
+                    y=chart_df['solar_input'],
                     mode='lines+markers',
                     name='Solar Input',
-                    line=dict(color='orange', width=2)
+                    line=dict(color='orange', width=2, shape='hv')
                 ))
-                
+
                 fig1.add_trace(go.Scatter(
-                    x=sensor_df['last_update_dt'],
-                    y=sensor_df['battery_level'],
+                    x=chart_df['last_update_dt'],
+                    y=chart_df['battery_level'],
                     mode='lines+markers',
                     name='Battery Level',
                     yaxis='y2',
-                    line=dict(color='purple', width=2)
+                    line=dict(color='purple', width=2, shape='hv')
                 ))
-                
+
                 fig1.update_layout(
-                    title='Solar & Battery Over Time',
+                    title='Solar & Battery Over Time (this page)',
                     xaxis_title='Time',
                     yaxis=dict(title='Solar Input (W)', color='orange'),
                     yaxis2=dict(
@@ -389,16 +435,16 @@ with tab2:
                     ),
                     hovermode='x unified'
                 )
-                
+
                 st.plotly_chart(fig1, use_container_width=True)
-            
+
             with col2:
                 # Water level distribution
                 fig2 = px.histogram(
                     sensor_df,
                     x='water_level',
                     nbins=20,
-                    title='Water Level Distribution',
+                    title='Water Level Distribution (this page)',
                     color_discrete_sequence=['blue'],
                     opacity=0.7
                 )
@@ -407,9 +453,9 @@ with tab2:
                     yaxis_title='Count'
                 )
                 st.plotly_chart(fig2, use_container_width=True)
-            
+
             # Recent sensor data chart
-            recent_data = sensor_df.head(50)  # Show last 50 records
+            recent_data = sensor_df.head(50)  # Show the first 50 records of the page
             fig3 = px.scatter(
                 recent_data,
                 x='last_update',
@@ -431,12 +477,9 @@ with tab2:
 
 with tab3:
     st.markdown("### Notifications Table")
-    
-    conn = get_db_connection()
-    
-    # Build query based on filters
-    query = """
-        SELECT 
+
+    notifications_query = """
+        SELECT
             n.id,
             n.user_id,
             u.username,
@@ -444,44 +487,55 @@ with tab3:
             n.title,
             n.message,
             n.notification_type,
-            CASE 
-                WHEN n.is_read = 1 THEN 'READ' 
-                ELSE 'UNREAD' 
+            CASE
+                WHEN n.is_read = 1 THEN 'READ'
+                ELSE 'UNREAD'
             END as status,
             n.created_at
         FROM notifications n
         LEFT JOIN users u ON n.user_id = u.user_id
-        WHERE DATE(n.created_at) BETWEEN ? AND ?
     """
-    
-    params = [start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')]
-    
+    notifications_where = ["n.created_at >= ?", "n.created_at < ?"]
+    notifications_params = list(db.day_range(start_date, end_date))
+    notifications_user = None
     if selected_user != "All Users":
-        user_id = selected_user.split("(")[1].split(")")[0]
-        query += " AND n.user_id = ?"
-        params.append(user_id)
-    
-    query += " ORDER BY n.created_at DESC"
-    
-    notifications_df = pd.read_sql_query(query, conn, params=params)
-    conn.close()
-    
+        notifications_user = selected_user.split("(")[1].split(")")[0]
+        notifications_where.append("n.user_id = ?")
+        notifications_params.append(notifications_user)
+    notifications_filter = " AND ".join(notifications_where)
+
+    notifications_pager = pagination.pager("notifications_page", notifications_params + [page_size])
+    with db.connection() as conn:
+        notifications_df, notifications_next = pagination.fetch_page(
+            conn, notifications_query, notifications_params, [("n.created_at", "created_at"), ("n.id", "id")],
+            where=notifications_where, after=notifications_pager.after, page_size=page_size)
+        notifications_total = pagination.estimate_rows(conn, "notifications", *notifications_params[:2],
+                                                       user_id=notifications_user)
+
     if not notifications_df.empty:
+        # Counts per type and read state over the whole range
+        type_summary = cached_frame("notification_types", f"""
+            SELECT notification_type, is_read, COUNT(*) AS count
+            FROM notifications n
+            WHERE {notifications_filter}
+            GROUP BY notification_type, is_read
+        """, notifications_params)
+
         # Display metrics
         col1, col2, col3, col4 = st.columns(4)
         with col1:
-            total_notifications = len(notifications_df)
+            total_notifications = int(type_summary['count'].sum())
             st.metric("Total Notifications", total_notifications)
         with col2:
-            unread_count = len(notifications_df[notifications_df['status'] == 'UNREAD'])
+            unread_count = int(type_summary.loc[type_summary['is_read'] != 1, 'count'].sum())
             st.metric("Unread", unread_count)
         with col3:
-            emergency_count = len(notifications_df[notifications_df['notification_type'] == 'emergency'])
+            emergency_count = int(type_summary.loc[type_summary['notification_type'] == 'emergency', 'count'].sum())
             st.metric("Emergencies", emergency_count)
         with col4:
-            warning_count = len(notifications_df[notifications_df['notification_type'] == 'warning'])
+            warning_count = int(type_summary.loc[type_summary['notification_type'] == 'warning', 'count'].sum())
             st.metric("Warnings", warning_count)
-        
+
         # Display dataframe
         st.dataframe(
             notifications_df,
@@ -499,38 +553,23 @@ with tab3:
             },
             height=400
         )
-        
-        # Export options
-        col1, col2 = st.columns(2)
-        with col1:
-            csv = notifications_df.to_csv(index=False).encode('utf-8')
-            st.download_button(
-                label="📥 Download as CSV",
-                data=csv,
-                file_name="notifications.csv",
-                mime="text/csv",
-                use_container_width=True
-            )
-        with col2:
-            json_data = notifications_df.to_json(orient='records', indent=2)
-            st.download_button(
-                label="📥 Download as JSON",
-                data=json_data,
-                file_name="notifications.json",
-                mime="application/json",
-                use_container_width=True
-            )
-        
+        pagination.page_controls(notifications_pager, notifications_next, len(notifications_df),
+                                 notifications_total, page_size, "notifications_page")
+
+        # Every matching row, streamed to a file rather than built in memory
+        export_controls("notifications", notifications_query, notifications_where, notifications_params,
+                        "n.created_at DESC, n.id DESC", total_notifications)
+
         # Visualization
         st.markdown("### 📈 Notification Analysis")
-        
+
         col1, col2 = st.columns(2)
-        
+
         with col1:
             # Notification types pie chart
-            type_counts = notifications_df['notification_type'].value_counts().reset_index()
+            type_counts = type_summary.groupby('notification_type')['count'].sum().reset_index()
             type_counts.columns = ['Type', 'Count']
-            
+
             fig1 = px.pie(
                 type_counts,
                 values='Count',
@@ -545,13 +584,17 @@ with tab3:
                 }
             )
             st.plotly_chart(fig1, use_container_width=True)
-        
+
         with col2:
             # Notifications over time
-            notifications_df['created_date'] = pd.to_datetime(notifications_df['created_at']).dt.date
-            daily_notifications = notifications_df.groupby('created_date').size().reset_index()
-            daily_notifications.columns = ['Date', 'Count']
-            
+            daily_notifications = cached_frame("daily_notifications", f"""
+                SELECT DATE(created_at) AS Date, COUNT(*) AS Count
+                FROM notifications n
+                WHERE {notifications_filter}
+                GROUP BY Date
+                ORDER BY Date
+            """, notifications_params)
+
             fig2 = px.line(
                 daily_notifications,
                 x='Date',
@@ -561,14 +604,21 @@ with tab3:
                 line_shape='spline'
             )
             st.plotly_chart(fig2, use_container_width=True)
-        
+
         # User notification stats
         if selected_user == "All Users":
-            user_notification_counts = notifications_df.groupby('username').size().reset_index()
-            user_notification_counts.columns = ['User', 'Notification Count']
-            
+            user_notification_counts = cached_frame("user_notifications", f"""
+                SELECT u.username AS User, COUNT(*) AS "Notification Count"
+                FROM notifications n
+                LEFT JOIN users u ON n.user_id = u.user_id
+                WHERE {notifications_filter}
+                GROUP BY n.user_id
+                ORDER BY "Notification Count" DESC
+                LIMIT 10
+            """, notifications_params)
+
             fig3 = px.bar(
-                user_notification_counts.sort_values('Notification Count', ascending=False).head(10),
+                user_notification_counts,
                 x='User',
                 y='Notification Count',
                 title='Top 10 Users by Notification Count',
@@ -581,12 +631,9 @@ with tab3:
 
 with tab4:
     st.markdown("### Water Level History Table")
-    
-    conn = get_db_connection()
-    
-    # Build query based on filters
-    query = """
-        SELECT 
+
+    water_query = """
+        SELECT
             wlh.id,
             wlh.user_id,
             u.username,
@@ -595,37 +642,55 @@ with tab4:
             wlh.created_at
         FROM water_level_history wlh
         LEFT JOIN users u ON wlh.user_id = u.user_id
-        WHERE DATE(wlh.created_at) BETWEEN ? AND ?
     """
-    
-    params = [start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')]
-    
+    water_where = ["wlh.created_at >= ?", "wlh.created_at < ?"]
+    water_params = list(db.day_range(start_date, end_date))
+    water_user = None
     if selected_user != "All Users":
-        user_id = selected_user.split("(")[1].split(")")[0]
-        query += " AND wlh.user_id = ?"
-        params.append(user_id)
-    
-    query += " ORDER BY wlh.created_at DESC"
-    
-    water_df = pd.read_sql_query(query, conn, params=params)
-    conn.close()
-    
+        water_user = selected_user.split("(")[1].split(")")[0]
+        water_where.append("wlh.user_id = ?")
+        water_params.append(water_user)
+
+    water_pager = pagination.pager("water_page", water_params + [page_size])
+    with db.connection() as conn:
+        water_df, water_next = pagination.fetch_page(
+            conn, water_query, water_params, [("wlh.created_at", "created_at"), ("wlh.id", "id")],
+            where=water_where, after=water_pager.after, page_size=page_size)
+
+        if water_next is None:
+            # Rows moved out by Clear Old Data are older than every live row,
+            # so the archive carries on where the live table runs out
+            before = water_pager.after if water_df.empty else (water_df['created_at'].iat[-1],
+                                                                int(water_df['id'].iat[-1]))
+            archived_df = archive.water_history(*water_params[:2], user_id=water_user, before=before,
+                                                limit=page_size - len(water_df) + 1)
+            if not archived_df.empty:
+                archived_df = with_farm_names(archived_df.iloc[::-1], list(water_df.columns))
+                water_df = pd.concat([water_df, archived_df], ignore_index=True) if len(water_df) else archived_df
+                if len(water_df) > page_size:
+                    water_df = water_df.iloc[:page_size]
+                    water_next = (water_df['created_at'].iat[-1], int(water_df['id'].iat[-1]))
+
+        # Metrics, totals and the chart come from the rollups, which cover
+        # archived rows too, rather than from the rows on this page
+        resolution, series_df = rollups.water_level_series(conn, *water_params[:2], user_id=water_user)
+
     if not water_df.empty:
         # Display metrics
+        total_readings = int(series_df['readings'].sum())
         col1, col2, col3, col4 = st.columns(4)
         with col1:
-            avg_water = water_df['water_level'].mean()
-            st.metric("Avg Water Level", f"{avg_water:.1f}%")
+            avg_water = (series_df['avg_level'] * series_df['readings']).sum() / max(total_readings, 1)
+            st.metric("Avg Stored Water Level", f"{avg_water:.1f}%", help=STORED_SAMPLES_HELP)
         with col2:
-            max_water = water_df['water_level'].max()
+            max_water = series_df['max_level'].max()
             st.metric("Max Water Level", f"{max_water:.1f}%")
         with col3:
-            min_water = water_df['water_level'].min()
+            min_water = series_df['min_level'].min()
             st.metric("Min Water Level", f"{min_water:.1f}%")
         with col4:
-            total_readings = len(water_df)
-            st.metric("Total Readings", total_readings)
-        
+            st.metric("Stored Samples", total_readings, help=STORED_SAMPLES_HELP)
+
         # Display dataframe
         st.dataframe(
             water_df,
@@ -640,51 +705,45 @@ with tab4:
             },
             height=400
         )
-        
-        # Export options
-        col1, col2 = st.columns(2)
-        with col1:
-            csv = water_df.to_csv(index=False).encode('utf-8')
-            st.download_button(
-                label="📥 Download as CSV",
-                data=csv,
-                file_name="water_history.csv",
-                mime="text/csv",
-                use_container_width=True
-            )
-        with col2:
-            json_data = water_df.to_json(orient='records', indent=2)
-            st.download_button(
-                label="📥 Download as JSON",
-                data=json_data,
-                file_name="water_history.json",
-                mime="application/json",
-                use_container_width=True
-            )
-        
+        pagination.page_controls(water_pager, water_next, len(water_df), total_readings, page_size, "water_page")
+
+        # Every matching row, streamed to a file rather than built in memory;
+        # archived rows follow the live ones, one segment at a time
+        archived_water = export.chain_chunks(
+            archive.table_chunks("water_level_history", *water_params[:2], user_id=water_user),
+            transform=lambda frame: with_farm_names(frame.iloc[::-1], list(water_df.columns)))
+        export_controls("water_history", water_query, water_where, water_params,
+                        "wlh.created_at DESC, wlh.id DESC", total_readings, archived=archived_water)
+
         # Visualization
         st.markdown("### 📈 Water Level Analysis")
-        
-        if len(water_df) > 1:
+
+        if total_readings > 1:
             col1, col2 = st.columns(2)
-            
+
             with col1:
-                # Water level over time
-                water_df['created_dt'] = pd.to_datetime(water_df['created_at'])
+                # Water level over time, read from the rollup that fits the range
+                series_df['time'] = pd.to_datetime(series_df['time'])
+
                 
                 fig1 = px.line(
-                    water_df,
-                    x='created_dt',
-                    y='water_level',
-                    color='username' if selected_user == "All Users" else None,
-                    title='Water Level Over Time',
+                    series_df,
+                    x='time',
+                    y='avg_level',
+                    title=f'Water Level Over Time ({resolution} resolution)',
                     labels={
-                        'created_dt': 'Time',
-                        'water_level': 'Water Level (%)',
-                        'username': 'User'
+                        'time': 'Time',
+                        'avg_level': 'Water Level (%)'
                     },
-                    markers=True
+                    markers=resolution == "raw",
+                    # Stored readings hold until the next one (deadband storage)
+                    line_shape='hv'
                 )
+                fig1.add_scatter(x=series_df['time'], y=series_df['max_level'], mode='lines',
+                                 line=dict(width=0, shape='hv'), showlegend=False, hoverinfo='skip')
+                fig1.add_scatter(x=series_df['time'], y=series_df['min_level'], mode='lines',
+                                 line=dict(width=0, shape='hv'), fill='tonexty',
+                                 fillcolor='rgba(74, 144, 255, 0.2)', name='Min / Max')
                 
                 # Add threshold lines
                 fig1.add_hline(y=95, line_dash="dash", line_color="red", annotation_text="Emergency (95%)")
@@ -699,7 +758,7 @@ with tab4:
                     water_df,
                     x='water_level',
                     nbins=20,
-                    title='Water Level Distribution',
+                    title='Water Level Distribution (this page)',
                     color_discrete_sequence=['blue'],
                     opacity=0.7
                 )
@@ -715,17 +774,19 @@ with tab4:
                 )
                 st.plotly_chart(fig2, use_container_width=True)
             
-            # Hourly water level analysis
-            if len(water_df) > 100:
-                water_df['hour'] = pd.to_datetime(water_df['created_at']).dt.hour
-                hourly_avg = water_df.groupby('hour')['water_level'].mean().reset_index()
+            # Hourly water level analysis, weighting each bucket by its readings
+            if total_readings > 100 and resolution != "day":
+                series_df['hour'] = series_df['time'].dt.hour
+                series_df['level_sum'] = series_df['avg_level'] * series_df['readings']
+                hourly_avg = series_df.groupby('hour')[['level_sum', 'readings']].sum().reset_index()
+                hourly_avg['water_level'] = hourly_avg['level_sum'] / hourly_avg['readings']
                 
                 fig3 = px.bar(
                     hourly_avg,
                     x='hour',
                     y='water_level',
-                    title='Average Water Level by Hour of Day',
-                    labels={'hour': 'Hour of Day', 'water_level': 'Avg Water Level (%)'},
+                    title='Average Stored Water Level by Hour of Day',
+                    labels={'hour': 'Hour of Day', 'water_level': 'Avg Stored Level (%)'},
                     color='water_level',
                     color_continuous_scale='Blues'
                 )
@@ -738,48 +799,46 @@ st.markdown("---")
 st.markdown('<div class="sub-header">🗄️ Database Schema</div>', unsafe_allow_html=True)
 
 with st.expander("View Database Schema"):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Get table information
-    tables = cursor.execute("""
-        SELECT name, sql 
-        FROM sqlite_master 
-        WHERE type='table' AND name NOT LIKE 'sqlite_%'
-        ORDER BY name
-    """).fetchall()
-    
-    for table in tables:
-        table_name = table['name']
-        table_sql = table['sql']
+    with db.connection() as conn:
+        cursor = conn.cursor()
+    
+        # Get table information
+        tables = cursor.execute("""
+            SELECT name, sql 
+            FROM sqlite_master 
+            WHERE type='table' AND name NOT LIKE 'sqlite_%'
+            ORDER BY name
+        """).fetchall()
+    
+        for table in tables:
+            table_name = table['name']
+            table_sql = table['sql']
         
-        st.markdown(f"### **Table: {table_name}**")
+            st.markdown(f"### **Table: {table_name}**")
         
-        # Get column information
-        columns = cursor.execute(f"PRAGMA table_info({table_name})").fetchall()
+            # Get column information
+            columns = cursor.execute(f"PRAGMA table_info({table_name})").fetchall()
         
-        col_info_df = pd.DataFrame(columns, columns=['cid', 'name', 'type', 'notnull', 'dflt_value', 'pk'])
+            col_info_df = pd.DataFrame(columns, columns=['cid', 'name', 'type', 'notnull', 'dflt_value', 'pk'])
         
-        # Display column information
-        st.dataframe(
-            col_info_df[['name', 'type', 'notnull', 'pk']],
-            column_config={
-                'name': 'Column Name',
-                'type': 'Data Type',
-                'notnull': 'Not Null',
-                'pk': 'Primary Key'
-            },
-            hide_index=True,
-            use_container_width=True
-        )
+            # Display column information
+            st.dataframe(
+                col_info_df[['name', 'type', 'notnull', 'pk']],
+                column_config={
+                    'name': 'Column Name',
+                    'type': 'Data Type',
+                    'notnull': 'Not Null',
+                    'pk': 'Primary Key'
+                },
+                hide_index=True,
+                use_container_width=True
+            )
         
-        # Get row count
-        row_count = cursor.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
-        st.caption(f"Total rows: {row_count}")
+            # Estimated row count; COUNT(*) would read the whole table
+            row_count = pagination.estimate_rows(conn, table_name)
+            st.caption(f"Total rows: about {row_count:,}")
         
-        st.markdown("---")
-    
-    conn.close()
+            st.markdown("---")
 
 # Data Management Section
 st.markdown("---")
@@ -790,36 +849,24 @@ col1, col2, col3 = st.columns(3)
 with col1:
     if st.button("🗑️ Clear Old Data", use_container_width=True, type="secondary"):
         with st.spinner("Cleaning up old data..."):
-            conn = get_db_connection()
             # Delete data older than 30 days
             cutoff_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
             
-            # Count records to be deleted
-            water_count = conn.execute(
-                "SELECT COUNT(*) FROM water_level_history WHERE DATE(created_at) < ?", 
-                (cutoff_date,)
-            ).fetchone()[0]
-            
-            notification_count = conn.execute(
-                "SELECT COUNT(*) FROM notifications WHERE DATE(created_at) < ?", 
-                (cutoff_date,)
-            ).fetchone()[0]
-            
-            # Delete old data
-            conn.execute("DELETE FROM water_level_history WHERE DATE(created_at) < ?", (cutoff_date,))
-            conn.execute("DELETE FROM notifications WHERE DATE(created_at) < ?", (cutoff_date,))
-            conn.commit()
-            conn.close()
+            # Sensor history moves to the archive; old notifications are dropped
+            archived = archive.archive_old_rows(cutoff_date)
+            deleted = db.purge_old_rows(cutoff_date, tables=("notifications",))
+            clear_summaries()
+            water_count = archived["water_level_history"]
+            notification_count = deleted["notifications"]
             
-            st.success(f"Cleaned up {water_count} water history records and {notification_count} notifications older than 30 days.")
+            st.success(f"Archived {water_count} water history records and deleted {notification_count} notifications older than 30 days.")
             st.rerun()
 
 with col2:
     if st.button("📊 Generate Report", use_container_width=True, type="primary"):
         with st.spinner("Generating report..."):
             # Create a comprehensive report
-            conn = get_db_connection()
-            
+            counts = stats.values()
             report_data = {
                 "report_generated": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                 "filters_applied": {
@@ -827,15 +874,13 @@ with col2:
                     "user": selected_user
                 },
                 "summary": {
-                    "total_users": conn.execute("SELECT COUNT(*) FROM users").fetchone()[0],
-                    "total_sensor_records": conn.execute("SELECT COUNT(*) FROM sensor_data").fetchone()[0],
-                    "total_notifications": conn.execute("SELECT COUNT(*) FROM notifications").fetchone()[0],
-                    "total_water_readings": conn.execute("SELECT COUNT(*) FROM water_level_history").fetchone()[0]
+                    "total_users": counts["users_rows"],
+                    "total_sensor_records": counts["sensor_readings_rows"],
+                    "total_notifications": counts["notifications_rows"],
+                    "total_water_readings": counts["water_level_history_rows"]
                 }
             }
             
-            conn.close()
-            
             # Display report
             st.json(report_data)
             
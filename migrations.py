@@ -0,0 +1,295 @@
+"""Versioned schema migrations for smart_agriculture.db.
+
+Each migration is a numbered step applied once, in order, inside its own write
+transaction. Applied steps are recorded in the schema_version table, so new
+steps can be appended to MIGRATIONS without touching existing data.
+
+    python migrations.py          # show applied and pending migrations
+    python migrations.py migrate  # apply pending migrations
+
+ensure_bootstrapped() is what the app calls on every rerun: the schema check
+and admin seeding run once per process and database file, after which the
+call only reads a cached flag.
+"""
+import hashlib
+import logging
+import sqlite3
+import sys
+import threading
+
+import activity
+import changes
+import database as db
+import readings
+import rollups
+import stats
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------ MIGRATION STEPS ------------------
+def _create_base_tables(conn):
+    # Users table
+    conn.execute('''CREATE TABLE IF NOT EXISTS users
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     username TEXT UNIQUE NOT NULL,
+                     password_hash TEXT NOT NULL,
+                     user_id TEXT UNIQUE NOT NULL,
+                     farm_name TEXT NOT NULL,
+                     location TEXT,
+                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                     is_admin INTEGER DEFAULT 0)''')
+
+    # Sensor data table
+    conn.execute('''CREATE TABLE IF NOT EXISTS sensor_data
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     user_id TEXT NOT NULL,
+                     solar_input REAL DEFAULT 0,
+                     battery_level REAL DEFAULT 0,
+                     water_level REAL DEFAULT 0,
+                     drain_status INTEGER DEFAULT 0,
+                     last_update TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                     FOREIGN KEY (user_id) REFERENCES users(user_id))''')
+
+    # Notifications table
+    conn.execute('''CREATE TABLE IF NOT EXISTS notifications
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     user_id TEXT NOT NULL,
+                     title TEXT NOT NULL,
+                     message TEXT NOT NULL,
+                     notification_type TEXT DEFAULT 'info',
+                     is_read INTEGER DEFAULT 0,
+                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+    # Water level history table
+    conn.execute('''CREATE TABLE IF NOT EXISTS water_level_history
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     user_id TEXT NOT NULL,
+                     water_level REAL NOT NULL,
+                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+
+def _add_user_time_indexes(conn):
+    # Every per-farm query filters on user_id and orders or ranges on time
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_sensor_data_user_update
+                    ON sensor_data (user_id, last_update)''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_notifications_user_created
+                    ON notifications (user_id, created_at)''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_water_history_user_created
+                    ON water_level_history (user_id, created_at)''')
+
+
+def _add_time_range_indexes(conn):
+    # The data viewer and admin panels range-scan time across all farms
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_sensor_data_update
+                    ON sensor_data (last_update)''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_notifications_created
+                    ON notifications (created_at)''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_water_history_created
+                    ON water_level_history (created_at)''')
+
+
+def _unique_sensor_rows(conn):
+    # One current-state row per farm, so writers can UPSERT on user_id.
+    # Older code could leave duplicates; they always carried the same values.
+    conn.execute('''DELETE FROM sensor_data
+                    WHERE id NOT IN (SELECT MAX(id) FROM sensor_data GROUP BY user_id)''')
+    conn.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_sensor_data_user
+                    ON sensor_data (user_id)''')
+
+
+def _add_change_counters(conn):
+    # Per-table counters bumped by every row change, so pollers can tell what
+    # moved since they last looked (see database.table_versions)
+    conn.execute('''CREATE TABLE IF NOT EXISTS change_counters
+                    (table_name TEXT PRIMARY KEY,
+                     changes INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID''')
+    for table in ("users", "sensor_data", "notifications", "water_level_history"):
+        conn.execute("INSERT OR IGNORE INTO change_counters (table_name) VALUES (?)", (table,))
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_changes
+                             AFTER {event} ON {table}
+                             BEGIN
+                                 UPDATE change_counters SET changes = changes + 1
+                                 WHERE table_name = '{table}';
+                             END''')
+
+
+def _add_user_id_cursor_indexes(conn):
+    # A plain user_id index ends in the rowid, so "user_id = ? AND id > ?"
+    # range-scans only the new rows; the (user_id, created_at) indexes would
+    # read and sort every row the farm has
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_notifications_user
+                    ON notifications (user_id)''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_water_history_user
+                    ON water_level_history (user_id)''')
+
+
+def _split_readings_and_state(conn):
+    # sensor_readings becomes the whole sensor history, drain state included;
+    # sensor_data is only looked up by user_id, which the unique index from
+    # version 5 already covers, so its (user_id, last_update) index is dead
+    # weight on every state update
+    conn.execute("ALTER TABLE sensor_readings ADD COLUMN drain_status INTEGER")
+    conn.execute("DROP INDEX IF EXISTS idx_sensor_data_user_update")
+
+
+def _add_readings_time_index(conn):
+    # The data viewer pages through every farm's readings newest first and
+    # archiving deletes by age; the primary key only orders readings within a
+    # farm. Index entries end in the primary key, so this orders (ts, user_id)
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_sensor_readings_ts
+                    ON sensor_readings (ts)''')
+
+
+# (version, description, step) in the order they must be applied
+MIGRATIONS = [
+    (1, "create base tables", _create_base_tables),
+    (2, "index per-farm time lookups", _add_user_time_indexes),
+    (3, "index fleet-wide time ranges", _add_time_range_indexes),
+    (4, "water level minute/hour/day rollups", rollups.create_rollups),
+    (5, "one sensor_data row per farm", _unique_sensor_rows),
+    (6, "per-table change counters", _add_change_counters),
+    (7, "index per-farm id cursors", _add_user_id_cursor_indexes),
+    (8, "per-channel sensor readings", readings.create_readings),
+    (9, "sensor readings log beside current state", _split_readings_and_state),
+    (10, "fixed-point sensor readings", readings.use_fixed_point),
+    (11, "index sensor readings by time", _add_readings_time_index),
+    (12, "change log for incremental exports", changes.create_change_log),
+    (13, "per-farm activity counters", activity.create_activity),
+    (14, "system-wide stats", stats.create_stats),
+    (15, "grouped fleet rollups per tick", rollups.batch_fleet_rollups),
+]
+
+
+# ------------------ RUNNER ------------------
+def _ensure_version_table(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_version
+                    (version INTEGER PRIMARY KEY,
+                     name TEXT NOT NULL,
+                     applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+
+def applied_migrations():
+    """Rows of (version, name, applied_at) for every applied migration"""
+    db.write(_ensure_version_table)
+    with db.connection() as conn:
+        return [tuple(row) for row in conn.execute(
+            "SELECT version, name, applied_at FROM schema_version ORDER BY version")]
+
+
+def pending_migrations():
+    """Migrations from MIGRATIONS that have not been applied yet"""
+    applied = {version for version, _, _ in applied_migrations()}
+    return [m for m in MIGRATIONS if m[0] not in applied]
+
+
+def migrate():
+    """Apply pending migrations in order; returns the versions applied"""
+    applied = []
+    for version, name, step in pending_migrations():
+        def apply(conn, version=version, name=name, step=step):
+            # Another process may have applied it while this one was waiting
+            if conn.execute("SELECT 1 FROM schema_version WHERE version = ?",
+                            (version,)).fetchone():
+                return False
+            step(conn)
+            conn.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)",
+                         (version, name))
+            return True
+
+        if db.write(apply):
+            logger.info("Applied migration %s: %s", version, name)
+            applied.append(version)
+    return applied
+
+
+def status_report():
+    """Human-readable summary of applied and pending migrations"""
+    lines = [f"Schema version {version}: {name} (applied {applied_at})"
+             for version, name, applied_at in applied_migrations()]
+    lines += [f"Schema version {version}: {name} (pending)"
+              for version, name, _ in pending_migrations()]
+    return lines
+
+
+# ------------------ SCHEMA BOOTSTRAP ------------------
+_bootstrapped = set()
+_bootstrap_lock = threading.Lock()
+
+
+def _seed_admin(conn):
+    c = conn.cursor()
+
+    # Check if admin user exists, if not create it
+    admin_hash = hashlib.sha256("admin@1234".encode()).hexdigest()
+    c.execute("SELECT COUNT(*) FROM users WHERE username = 'admin'")
+    if c.fetchone()[0] == 0:
+        c.execute('''INSERT INTO users (username, password_hash, user_id, farm_name, location, is_admin)
+                     VALUES (?, ?, ?, ?, ?, ?)''',
+                  ('admin', admin_hash, 'ADMIN001', 'System Administration', 'Control Center', 1))
+    else:
+        # Ensure admin user has is_admin set to 1
+        c.execute("UPDATE users SET is_admin = 1 WHERE username = 'admin' AND is_admin != 1")
+
+
+def _run_bootstrap():
+    migrate()
+    db.write(_seed_admin)
+    for line in status_report():
+        print(line)
+    _bootstrapped.add(db.DB_PATH)
+
+
+def bootstrap():
+    """Apply pending migrations, seed the admin account and report the schema"""
+    with _bootstrap_lock:
+        _run_bootstrap()
+
+
+def reset():
+    """Drop every table with its indexes and triggers, then bootstrap a fresh schema
+
+    Goes through SQLite rather than removing the file, so the WAL and
+    shared-memory files and the connections other sessions hold stay paired
+    with the database they belong to.
+    """
+    def drop(conn):
+        tables = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+        for table in tables:
+            conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+        return len(tables)
+
+    with _bootstrap_lock:
+        # Buffered rows would otherwise land in the fresh tables
+        db.flush_buffer()
+        dropped = db.write(drop)
+        _bootstrapped.discard(db.DB_PATH)
+        try:
+            # Hand the dropped pages back to the file system
+            with db.connection() as conn:
+                conn.execute("VACUUM")
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.OperationalError as e:
+            logger.warning("VACUUM after reset skipped: %s", e)
+        _run_bootstrap()
+    return dropped
+
+
+def ensure_bootstrapped():
+    """Run bootstrap() once per process; returns True if it ran on this call"""
+    if db.DB_PATH in _bootstrapped:
+        return False
+    # Concurrent first sessions wait here for a single bootstrap
+    with _bootstrap_lock:
+        if db.DB_PATH in _bootstrapped:
+            return False
+        _run_bootstrap()
+        return True
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["migrate"]:
+        migrate()
+    print("\n".join(status_report()))
@@ -0,0 +1,196 @@
+"""Keyset pagination for the data viewer tables.
+
+fetch_page() reads one page of a query ordered newest first by its sort
+keys. The next page starts just past the last row shown (a row-value
+comparison on the keys) instead of at an OFFSET, so page 500 costs the same
+as page 1 as long as an index supplies the key order. Only that page is
+turned into a DataFrame.
+
+Totals come from estimate_rows(), which scales the row counts ANALYZE keeps in
+sqlite_stat1 by the share of the table's time span a range covers. That is a
+few index lookups however large the table is, where COUNT(*) would read every
+row in the range.
+"""
+import os
+import threading
+import time
+
+import pandas as pd
+import streamlit as st
+
+import database as db
+
+PAGE_SIZE = int(os.environ.get("AGRIGURD_PAGE_SIZE", "100"))
+PAGE_SIZES = (25, 50, 100, 250, 500)
+
+# table -> time column; each table also has an index led by user_id
+ROW_ESTIMATES = {
+    "sensor_readings": "ts",
+    "water_level_history": "created_at",
+    "notifications": "created_at",
+}
+
+# Statistics are re-sampled at most this often per table
+STATS_MAX_AGE_SECONDS = 300
+# Rows ANALYZE samples per index; enough for an estimate, cheap on any size
+STATS_SAMPLE_ROWS = 10000
+
+_stats_lock = threading.Lock()
+# (database path, table) -> (refreshed at, total rows, rows per farm)
+_stats = {}
+
+
+# ------------------ PAGES ------------------
+def _plain(value):
+    # NumPy scalars from a frame are not valid SQLite parameters
+    return value.item() if hasattr(value, "item") else value
+
+
+def fetch_page(conn, sql, params, keys, where=(), after=None, page_size=PAGE_SIZE):
+    """One page of ``sql`` ordered by ``keys`` descending, as (frame, next_cursor)
+
+    ``sql`` is a SELECT ... FROM without a WHERE clause; ``where`` holds its
+    conditions, bound to ``params``. ``keys`` are (expression, result column)
+    pairs that together identify a row. ``after`` is the cursor returned with
+    the previous page; next_cursor is None on the last page.
+    """
+    expressions = [expression for expression, _ in keys]
+    where, params = list(where), list(params)
+    if after is not None:
+        # Listed first, so SQLite takes it over a range's own upper bound
+        # when it picks the bounds of the index range
+        where.insert(0, f"({', '.join(expressions)}) < ({', '.join('?' * len(keys))})")
+        params = list(after) + params
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY " + ", ".join(f"{expression} DESC" for expression in expressions)
+    # One extra row tells whether another page follows
+    sql += f" LIMIT {int(page_size) + 1}"
+    frame = pd.read_sql_query(sql, conn, params=params)
+
+    next_cursor = None
+    if len(frame) > page_size:
+        frame = frame.iloc[:page_size]
+        next_cursor = tuple(_plain(frame[column].iat[-1]) for _, column in keys)
+    return frame, next_cursor
+
+
+class Pager:
+    """Position in one paged table: the cursor each visited page started at"""
+
+    def __init__(self, filters):
+        self.filters = filters
+        self.cursors = [None]
+
+    @property
+    def page(self):
+        return len(self.cursors)
+
+    @property
+    def after(self):
+        return self.cursors[-1]
+
+
+def pager(key, filters):
+    """The session's Pager for ``key``, back on page 1 whenever ``filters`` change"""
+    current = st.session_state.get(key)
+    if current is None or current.filters != filters:
+        current = st.session_state[key] = Pager(filters)
+    return current
+
+
+def page_controls(current, next_cursor, rows, total, page_size, key):
+    """Previous / next buttons and a "rows a-b of about n" caption"""
+    col1, col2, col3 = st.columns([1, 1, 4])
+    # Callbacks move the cursor before the rerun the click triggers
+    with col1:
+        st.button("⬅️ Previous", key=f"{key}_previous", disabled=current.page == 1,
+                  on_click=current.cursors.pop, use_container_width=True)
+    with col2:
+        st.button("Next ➡️", key=f"{key}_next", disabled=next_cursor is None,
+                  on_click=current.cursors.append, args=(next_cursor,), use_container_width=True)
+    with col3:
+        first = (current.page - 1) * page_size + 1 if rows else 0
+        last = first + rows - 1 if rows else 0
+        # An estimate can undershoot the rows already paged through
+        total = max(total, last + (next_cursor is not None))
+        st.caption(f"Page {current.page} · rows {first:,}–{last:,} of about {total:,}")
+
+
+# ------------------ ROW ESTIMATES ------------------
+def _seconds(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    return pd.Timestamp(value).timestamp()
+
+
+def _farm_count(conn, table):
+    # A loose index scan: one seek per farm instead of a pass over every row
+    return conn.execute(f"""
+        WITH RECURSIVE farms(user_id) AS (
+            SELECT MIN(user_id) FROM {table}
+            UNION ALL
+            SELECT (SELECT MIN(user_id) FROM {table} WHERE user_id > farms.user_id)
+            FROM farms WHERE farms.user_id IS NOT NULL
+        )
+        SELECT COUNT(user_id) FROM farms
+    """).fetchone()[0]
+
+
+def refresh_stats(tables):
+    """Re-sample sqlite_stat1 for ``tables`` (bounded by STATS_SAMPLE_ROWS)"""
+    def analyze(conn):
+        conn.execute(f"PRAGMA analysis_limit = {STATS_SAMPLE_ROWS}")
+        for table in tables:
+            conn.execute(f"ANALYZE {table}")
+    db.write(analyze)
+    now = time.monotonic()
+    with db.connection() as conn:
+        for table in tables:
+            total = 0
+            for (stat,) in conn.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = ?", (table,)):
+                first = stat.split()[0]
+                total = max(total, int(first)) if first.isdigit() else total
+            # A sampled ANALYZE caps its rows-per-key figure at the sample
+            # size, so rows per farm come from a count of the farms instead
+            farms = _farm_count(conn, table) if table in ROW_ESTIMATES else 0
+            with _stats_lock:
+                _stats[(db.DB_PATH, table)] = (now, total, total / farms if farms else 0)
+
+
+def _table_stats(table):
+    with _stats_lock:
+        stats = _stats.get((db.DB_PATH, table))
+    if stats is None or time.monotonic() - stats[0] > STATS_MAX_AGE_SECONDS:
+        refresh_stats([table])
+        with _stats_lock:
+            stats = _stats[(db.DB_PATH, table)]
+    return stats[1], stats[2]
+
+
+def estimate_rows(conn, table, start=None, end=None, user_id=None):
+    """Approximate rows of ``table`` in the time range ``[start, end)``
+
+    ``start`` and ``end`` are timestamps as text or epoch seconds; leave them
+    out for the whole table. With ``user_id`` only that farm's rows count,
+    taken as the average rows per farm. Tables missing from ROW_ESTIMATES
+    only have a whole-table estimate.
+    """
+    time_column = ROW_ESTIMATES.get(table)
+    total, per_user = _table_stats(table)
+    where, params = "", []
+    if user_id is not None:
+        total, where, params = per_user, "WHERE user_id = ?", [user_id]
+    if not total or time_column is None:
+        return total
+
+    # Separate statements, so each is a single index lookup
+    first = conn.execute(f"SELECT MIN({time_column}) FROM {table} {where}", params).fetchone()[0]
+    last = conn.execute(f"SELECT MAX({time_column}) FROM {table} {where}", params).fetchone()[0]
+    if first is None:
+        return 0
+    first, last = _seconds(first), _seconds(last)
+    start = first if start is None else _seconds(start)
+    end = last + 1 if end is None else _seconds(end)
+    covered = max(0.0, min(last + 1, end) - max(first, start))
+    return int(round(total * covered / (last + 1 - first)))
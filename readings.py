@@ -0,0 +1,370 @@
+"""Sensor readings: an append-only log next to a keyed current-state table.
+
+sensor_readings is the log. Every sensor write appends one row: solar input,
+battery level, water level and drain state under the farm's user_id and an
+epoch-seconds ``ts``. The table is keyed on (user_id, ts) WITHOUT ROWID, so a
+farm's readings sit together on disk and a time range is one contiguous
+primary-key scan. Two writes for a farm within the same second keep the later
+one. History views range-scan the log.
+
+sensor_data is the current state: one row per farm, unique on user_id and
+updated in place. The dashboard and the simulator take the latest values from
+it with one key lookup (current_state) and never scan the log for them.
+record() writes both tables on the caller's connection, so they commit
+together.
+
+Channels are stored as fixed-point integers: tenths of a watt or percent,
+per SCALES. SQLite stores small integers in one to three bytes where a REAL
+always takes eight, so rows and the primary key shrink and comparisons stay
+integer. APPEND_READING and RECORD_READING encode in SQL; readers decode
+whole columns at once with decode().
+
+Chart queries average readings into fixed-width buckets in SQL, so a 24-hour
+curve costs one range scan and returns at most ``points`` rows however often
+the farm reports.
+"""
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import rollups
+
+CHANNELS = ("solar_input", "battery_level", "water_level")
+
+DAY_SECONDS = 24 * 3600
+
+# Five-minute buckets over a day
+CURVE_POINTS = 288
+
+# Energy integration does not bridge gaps longer than this; a farm that stopped
+# reporting is not assumed to have kept generating
+MAX_GAP_SECONDS = 15 * 60
+
+# Stored integer units per channel unit (tenths of a watt or percent)
+SCALES = {"solar_input": 10, "battery_level": 10, "water_level": 10}
+
+# Columns of a farm's state, in the order UPSERT_STATE and APPEND_READING take them
+STATE_FIELDS = ("solar_input", "battery_level", "water_level", "drain_status")
+
+# One current-state row per farm (unique on user_id since schema version 5)
+UPSERT_STATE = '''INSERT INTO sensor_data (user_id, solar_input, battery_level, water_level,
+                                           drain_status, last_update)
+                  VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                  ON CONFLICT (user_id) DO UPDATE SET
+                      solar_input = excluded.solar_input,
+                      battery_level = excluded.battery_level,
+                      water_level = excluded.water_level,
+                      drain_status = excluded.drain_status,
+                      last_update = excluded.last_update'''
+
+
+
+def _fixed(channel):
+    # SQL for a bound value in the channel's fixed-point units
+    return f"CAST(ROUND(? * {SCALES[channel]}) AS INTEGER)"
+
+
+# A second reading in the same second updates the first. An UPSERT rather than
+# INSERT OR REPLACE, whose implicit delete skips the per-farm activity triggers
+# (see activity.py) and would leave the replaced row counted
+_KEEP_LATER = '''ON CONFLICT (user_id, ts) DO UPDATE SET
+                     solar_input = excluded.solar_input,
+                     battery_level = excluded.battery_level,
+                     water_level = excluded.water_level,
+                     drain_status = excluded.drain_status'''
+
+APPEND_READING = f'''INSERT INTO sensor_readings (user_id, solar_input, battery_level, water_level,
+                                                  drain_status, ts)
+                     VALUES (?, {_fixed("solar_input")}, {_fixed("battery_level")}, {_fixed("water_level")},
+                             ?, CAST(strftime('%s', 'now') AS INTEGER))
+                     {_KEEP_LATER}'''
+
+# APPEND_READING with the epoch-seconds ts as the last parameter
+RECORD_READING = f'''INSERT INTO sensor_readings (user_id, solar_input, battery_level, water_level,
+                                                  drain_status, ts)
+                     VALUES (?, {_fixed("solar_input")}, {_fixed("battery_level")}, {_fixed("water_level")}, ?, ?)
+                     {_KEEP_LATER}'''
+
+
+# ------------------ SCHEMA ------------------
+def create_readings(conn):
+    """Create sensor_readings and seed it with each farm's current state"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS sensor_readings
+                    (user_id TEXT NOT NULL,
+                     ts INTEGER NOT NULL,
+                     solar_input REAL,
+                     battery_level REAL,
+                     water_level REAL,
+                     PRIMARY KEY (user_id, ts)) WITHOUT ROWID''')
+    conn.execute('''INSERT OR IGNORE INTO sensor_readings (user_id, ts, solar_input, battery_level, water_level)
+                    SELECT user_id, CAST(strftime('%s', last_update) AS INTEGER),
+                           solar_input, battery_level, water_level
+                    FROM sensor_data''')
+
+
+def use_fixed_point(conn):
+    """Rebuild sensor_readings with fixed-point integer channels"""
+    conn.execute("ALTER TABLE sensor_readings RENAME TO sensor_readings_real")
+    conn.execute('''CREATE TABLE sensor_readings
+                    (user_id TEXT NOT NULL,
+                     ts INTEGER NOT NULL,
+                     solar_input INTEGER,
+                     battery_level INTEGER,
+                     water_level INTEGER,
+                     drain_status INTEGER,
+                     PRIMARY KEY (user_id, ts)) WITHOUT ROWID''')
+    conn.execute(f'''INSERT INTO sensor_readings (user_id, ts, solar_input, battery_level, water_level,
+                                                  drain_status)
+                     SELECT user_id, ts, {", ".join(f"CAST(ROUND({channel} * {SCALES[channel]}) AS INTEGER)"
+                                                    for channel in CHANNELS)}, drain_status
+                     FROM sensor_readings_real''')
+    conn.execute("DROP TABLE sensor_readings_real")
+
+
+def decode(frame):
+    """Turn a frame's fixed-point channel columns back into floats, in place"""
+    for channel, scale in SCALES.items():
+        if channel in frame:
+            frame[channel] = frame[channel].to_numpy(dtype=np.float64) / scale
+    return frame
+
+
+# ------------------ STORAGE POLICY ------------------
+# A reading is stored only if some channel moved further than its deadband
+# from the farm's last stored reading, or HEARTBEAT_SECONDS have passed since
+# it. Between stored readings every channel stays within its deadband of the
+# stored value, so reads hold that value step-wise.
+DEADBANDS = {"solar_input": 20.0, "battery_level": 1.0, "water_level": 1.0, "drain_status": 0.0}
+HEARTBEAT_SECONDS = int(os.environ.get("AGRIGURD_HEARTBEAT_SECONDS", "300"))
+DEADBAND_ENABLED = os.environ.get("AGRIGURD_DEADBAND", "1") != "0"
+
+
+class StoragePolicy:
+    """Deadband and heartbeat filter for one stream of per-farm readings
+
+    The last stored value of each channel and its time are kept per farm in
+    memory, stacked into arrays so a fleet tick is decided in one vectorized
+    pass. Farms the policy has not seen yet are always stored, so a fresh
+    process never skips a reading relative to something only on disk.
+
+    decide() leaves the reference alone and returns a callable that moves
+    it; writers call that only once their transaction has committed, so a
+    rolled-back write never becomes the value later readings are compared to.
+    """
+
+    def __init__(self, name, deadbands, heartbeat=HEARTBEAT_SECONDS, enabled=DEADBAND_ENABLED):
+        self.name = name
+        self.channels = tuple(deadbands)
+        self.tolerance = np.array([deadbands[channel] for channel in self.channels], dtype=np.float64)
+        self.heartbeat = heartbeat
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._index = {}
+            self._values = np.zeros((0, len(self.channels)), dtype=np.float64)
+            self._times = np.zeros(0, dtype=np.int64)
+            # False until a farm's first stored reading is accepted
+            self._stored = np.zeros(0, dtype=bool)
+            self.offered = self.stored = 0
+
+    def decide(self, user_ids, times, **values):
+        """Boolean mask of the readings to store, and a callable that makes them the reference
+
+        ``values`` holds one array (or scalar) per channel of the policy and
+        ``times`` epoch seconds, both aligned with ``user_ids``. Nothing
+        changes until the callable is called.
+        """
+        user_ids = list(user_ids)
+        n = len(user_ids)
+        current = np.column_stack([np.broadcast_to(np.asarray(values[channel], dtype=np.float64), (n,))
+                                   for channel in self.channels]) if n else np.zeros((0, len(self.channels)))
+        times = np.broadcast_to(np.asarray(times, dtype=np.int64), (n,))
+
+        with self._lock:
+            rows = np.empty(n, dtype=np.int64)
+            for i, user_id in enumerate(user_ids):
+                row = self._index.get(user_id)
+                if row is None:
+                    row = self._index[user_id] = len(self._index)
+                rows[i] = row
+            grow = len(self._index) - len(self._times)
+            if grow > 0:
+                grow = max(grow, len(self._times), 16)
+                self._values = np.concatenate([self._values, np.zeros((grow, len(self.channels)))])
+                self._times = np.concatenate([self._times, np.zeros(grow, dtype=np.int64)])
+                self._stored = np.concatenate([self._stored, np.zeros(grow, dtype=bool)])
+
+            if self.enabled:
+                moved = (np.abs(current - self._values[rows]) > self.tolerance).any(axis=1)
+                due = times - self._times[rows] >= self.heartbeat
+                keep = ~self._stored[rows] | moved | due
+            else:
+                keep = np.ones(n, dtype=bool)
+
+        def accept(rows=rows[keep], current=current[keep], times=times[keep]):
+            with self._lock:
+                # A reading committed after a newer one never moves the reference back
+                newer = ~self._stored[rows] | (times >= self._times[rows])
+                rows = rows[newer]
+                self._values[rows] = current[newer]
+                self._times[rows] = times[newer]
+                self._stored[rows] = True
+                self.offered += n
+                self.stored += int(keep.sum())
+        return keep, accept
+
+    def keep(self, user_ids, times, **values):
+        """decide() for readings that need no commit; kept ones become the reference at once"""
+        keep, accept = self.decide(user_ids, times, **values)
+        accept()
+        return keep
+
+    def stats(self):
+        with self._lock:
+            return {
+                "offered": self.offered,
+                "stored": self.stored,
+                "reduction": 1 - self.stored / self.offered if self.offered else 0.0,
+            }
+
+
+log_policy = StoragePolicy("readings log", DEADBANDS)
+history_policy = StoragePolicy("water history", {"water_level": DEADBANDS["water_level"]})
+
+
+def reset_policies():
+    """Forget the last stored readings, e.g. after the database was replaced"""
+    for policy in (log_policy, history_policy):
+        policy.clear()
+
+
+def policy_stats():
+    """Offered and stored reading counts per policy"""
+    return {policy.name: policy.stats() for policy in (log_policy, history_policy)}
+
+
+# ------------------ CURRENT STATE ------------------
+def current_state(conn, user_id):
+    """Latest values of one farm plus last_update, or None if it has no state row"""
+    row = conn.execute('''SELECT solar_input, battery_level, water_level, drain_status, last_update
+                          FROM sensor_data WHERE user_id = ?''', (user_id,)).fetchone()
+    if row is None:
+        return None
+    return dict(zip(STATE_FIELDS + ("last_update",), row))
+
+
+def record(conn, user_id, state):
+    """Write ``state`` as the farm's current state and log it if the policy keeps it
+
+    Returns the log policy's accept callable (see StoragePolicy.decide), to
+    be called once the write has committed.
+    """
+    row = (user_id,) + tuple(state[field] for field in STATE_FIELDS)
+    conn.execute(UPSERT_STATE, row)
+    logged, accept = log_policy.decide([user_id], int(time.time()),
+                                       **{channel: state[channel] for channel in log_policy.channels})
+    if logged[0]:
+        conn.execute(APPEND_READING, row)
+    return accept
+
+
+def record_history(conn, user_id, water_level):
+    """Add a water_level_history row if the history policy keeps the reading
+
+    Written on the caller's connection, inside its transaction, so the
+    reading is stored exactly when the returned accept callable is due.
+    """
+    kept, accept = history_policy.decide([user_id], int(time.time()), water_level=water_level)
+    if kept[0]:
+        conn.execute("INSERT INTO water_level_history (user_id, water_level) VALUES (?, ?)",
+                     (user_id, water_level))
+    return accept
+
+
+# ------------------ QUERIES ------------------
+def channel_curves(conn, user_id, end=None, seconds=DAY_SECONDS, points=CURVE_POINTS):
+    """Bucket-averaged readings of one farm over the ``seconds`` before ``end``
+
+    Returns ``(times, {channel: values})`` as NumPy arrays of length
+    ``points``, oldest first. Times are bucket starts in epoch seconds.
+    Buckets without stored readings hold the last stored value, as the
+    storage policy implies, unless the farm's heartbeat is overdue; then
+    they are NaN.
+    """
+    end = int(time.time()) if end is None else int(end)
+    width = -(-seconds // points)
+    start = end - width * points
+    # The bare columns next to MAX(ts) come from each bucket's newest row
+    rows = conn.execute('''SELECT (ts - ?) / ? AS bucket, AVG(solar_input), AVG(battery_level), AVG(water_level),
+                                  MAX(ts), solar_input, battery_level, water_level
+                           FROM sensor_readings
+                           WHERE user_id = ? AND ts >= ? AND ts < ?
+                           GROUP BY bucket''', (start, width, user_id, start, end)).fetchall()
+    before = conn.execute('''SELECT ts, solar_input, battery_level, water_level FROM sensor_readings
+                             WHERE user_id = ? AND ts < ? ORDER BY ts DESC LIMIT 1''',
+                          (user_id, start)).fetchone()
+
+    channels = len(CHANNELS)
+    scales = np.array([SCALES[channel] for channel in CHANNELS], dtype=np.float64)[:, None]
+    times = start + width * np.arange(points, dtype=np.int64)
+    curves = np.full((channels, points), np.nan)
+    last = np.full((channels, points), np.nan)
+    last_ts = np.full(points, np.nan)
+    if rows:
+        values = np.array(rows, dtype=np.float64)
+        buckets = values[:, 0].astype(np.int64)
+        curves[:, buckets] = values[:, 1:1 + channels].T / scales
+        last_ts[buckets] = values[:, 1 + channels]
+        last[:, buckets] = values[:, 2 + channels:].T / scales
+
+    # Empty buckets take the newest reading at or before them
+    source = np.maximum.accumulate(np.where(np.isnan(last_ts), -1, np.arange(points)))
+    held = np.where(source >= 0, last[:, source], np.nan)
+    held_ts = np.where(source >= 0, last_ts[source], np.nan)
+    if before is not None:
+        held[:, source < 0] = np.array(before[1:], dtype=np.float64)[:, None] / scales
+        held_ts[source < 0] = before[0]
+    fresh = times - held_ts <= HEARTBEAT_SECONDS + rollups.RAW_INTERVAL_SECONDS
+    empty = np.isnan(last_ts) & fresh
+    curves[:, empty] = held[:, empty]
+    return times, dict(zip(CHANNELS, curves))
+
+
+def farm_frame(conn, user_id, start, end):
+    """One farm's readings with ``start <= ts < end`` as a frame indexed by time
+
+    Rows go from the cursor into a single float64 array, then channels are
+    scaled back and ts converted a column at a time.
+    """
+    rows = conn.execute('''SELECT ts, solar_input, battery_level, water_level, drain_status
+                           FROM sensor_readings
+                           WHERE user_id = ? AND ts >= ? AND ts < ?''', (user_id, start, end)).fetchall()
+    values = np.array(rows, dtype=np.float64).reshape(-1, len(CHANNELS) + 2)
+    scales = np.array([SCALES[channel] for channel in CHANNELS], dtype=np.float64)
+    frame = pd.DataFrame(values[:, 1:1 + len(CHANNELS)] / scales, columns=list(CHANNELS),
+                         index=pd.to_datetime(values[:, 0].astype(np.int64), unit="s"))
+    frame["drain_status"] = values[:, -1]
+    return frame
+
+
+def energy_kwh(times, watts, max_gap=MAX_GAP_SECONDS):
+    """Trapezoid integral of power samples in kWh
+
+    NaN samples are dropped and intervals longer than ``max_gap`` seconds
+    count as no output.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    watts = np.asarray(watts, dtype=np.float64)
+    present = ~np.isnan(watts)
+    times, watts = times[present], watts[present]
+    if len(times) < 2:
+        return 0.0
+    dt = np.diff(times)
+    joules = np.where(dt <= max_gap, (watts[1:] + watts[:-1]) / 2 * dt, 0.0)
+    return float(joules.sum() / 3.6e6)
@@ -0,0 +1,222 @@
+"""Minute, hour and day rollups of water_level_history.
+
+Each resolution has its own table holding min/max/sum/count/last per farm and
+bucket. Triggers on water_level_history keep them current on every insert, so
+charts over long ranges read a few thousand pre-aggregated rows instead of
+every raw 5-second reading.
+
+A fleet tick inserts a row for every farm at once, and each would upsert the
+same fleet-wide rows. It inserts them inside batch() instead: the triggers
+stand aside and the tick's rows are folded in with one grouped upsert per
+resolution, for the farms and for the fleet, when the batch ends.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+# (name, bucket length in seconds, strftime pattern for the bucket start)
+RESOLUTIONS = [
+    ("minute", 60, "%Y-%m-%d %H:%M:00"),
+    ("hour", 3600, "%Y-%m-%d %H:00:00"),
+    ("day", 86400, "%Y-%m-%d 00:00:00"),
+]
+
+# Raw readings arrive roughly every 5 seconds per farm
+RAW_INTERVAL_SECONDS = 5
+
+# Upper bound on points per series a chart should need
+MAX_POINTS = 2000
+
+# user_id of the rows that aggregate every farm, so fleet charts read one row
+# per bucket instead of one per farm
+FLEET_ID = "*"
+
+
+# Merges an aggregate row into the rollup row for the same farm and bucket
+_MERGE = '''ON CONFLICT (user_id, bucket) DO UPDATE SET
+                min_level = MIN(min_level, excluded.min_level),
+                max_level = MAX(max_level, excluded.max_level),
+                sum_level = sum_level + excluded.sum_level,
+                count = count + excluded.count,
+                last_level = CASE WHEN excluded.last_at >= last_at
+                                  THEN excluded.last_level ELSE last_level END,
+                last_at = MAX(last_at, excluded.last_at)'''
+
+
+def rollup_table(resolution):
+    return f"water_level_{resolution}"
+
+
+# ------------------ SCHEMA ------------------
+def create_rollups(conn):
+    """Create rollup tables and triggers, then backfill them from existing history"""
+    for resolution, _, pattern in RESOLUTIONS:
+        table = rollup_table(resolution)
+        conn.execute(f'''CREATE TABLE IF NOT EXISTS {table}
+                         (user_id TEXT NOT NULL,
+                          bucket TIMESTAMP NOT NULL,
+                          min_level REAL NOT NULL,
+                          max_level REAL NOT NULL,
+                          sum_level REAL NOT NULL,
+                          count INTEGER NOT NULL,
+                          last_level REAL NOT NULL,
+                          last_at TIMESTAMP NOT NULL,
+                          PRIMARY KEY (user_id, bucket)) WITHOUT ROWID''')
+
+        upsert = f'''INSERT INTO {table} (user_id, bucket, min_level, max_level, sum_level,
+                                             count, last_level, last_at)
+                        VALUES ({{user}}, strftime('{pattern}', NEW.created_at),
+                                NEW.water_level, NEW.water_level, NEW.water_level,
+                                1, NEW.water_level, NEW.created_at)
+                        ON CONFLICT (user_id, bucket) DO UPDATE SET
+                            min_level = MIN(min_level, excluded.min_level),
+                            max_level = MAX(max_level, excluded.max_level),
+                            sum_level = sum_level + excluded.sum_level,
+                            count = count + 1,
+                            last_level = CASE WHEN excluded.last_at >= last_at
+                                              THEN excluded.last_level ELSE last_level END,
+                            last_at = MAX(last_at, excluded.last_at);'''
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_insert
+                         AFTER INSERT ON water_level_history
+                         BEGIN
+                             {upsert.format(user="NEW.user_id")}
+                             {upsert.format(user=f"'{FLEET_ID}'")}
+                         END''')
+
+        # Backfill from whatever history is already stored
+        for user, match in (("user_id", "h.user_id = g.user_id AND "), (f"'{FLEET_ID}'", "")):
+            conn.execute(f'''INSERT OR REPLACE INTO {table}
+                             (user_id, bucket, min_level, max_level, sum_level, count, last_level, last_at)
+                             SELECT g.user_id, g.bucket, g.min_level, g.max_level, g.sum_level, g.count,
+                                    (SELECT h.water_level FROM water_level_history h
+                                     WHERE {match}h.created_at = g.last_at
+                                     ORDER BY h.id DESC LIMIT 1),
+                                    g.last_at
+                             FROM (SELECT {user} AS user_id, strftime('{pattern}', created_at) AS bucket,
+                                          MIN(water_level) AS min_level, MAX(water_level) AS max_level,
+                                          SUM(water_level) AS sum_level, COUNT(*) AS count,
+                                          MAX(created_at) AS last_at
+                                   FROM water_level_history
+                                   GROUP BY 1, 2) g''')
+
+
+def batch_fleet_rollups(conn):
+    """Replace the rollup triggers with ones that stand aside during batch()"""
+    # Holds a row only inside a batch, in the writer's uncommitted transaction
+    conn.execute('''CREATE TABLE IF NOT EXISTS rollup_batch
+                    (id INTEGER PRIMARY KEY)''')
+    for resolution, _, pattern in RESOLUTIONS:
+        table = rollup_table(resolution)
+        upsert = f'''INSERT INTO {table} (user_id, bucket, min_level, max_level, sum_level,
+                                             count, last_level, last_at)
+                        VALUES ({{user}}, strftime('{pattern}', NEW.created_at),
+                                NEW.water_level, NEW.water_level, NEW.water_level,
+                                1, NEW.water_level, NEW.created_at)
+                        {_MERGE};'''
+        conn.execute(f"DROP TRIGGER IF EXISTS trg_{table}_insert")
+        conn.execute(f'''CREATE TRIGGER trg_{table}_insert
+                         AFTER INSERT ON water_level_history
+                         WHEN NOT EXISTS (SELECT 1 FROM rollup_batch)
+                         BEGIN
+                             {upsert.format(user="NEW.user_id")}
+                             {upsert.format(user=f"'{FLEET_ID}'")}
+                         END''')
+
+
+# ------------------ BATCHES ------------------
+@contextmanager
+def batch(conn):
+    """Insert water_level_history rows in the block without per-row rollup upserts
+
+    Must run inside the caller's write transaction. The rows the block
+    inserted (ids above the highest one before it) are added to every
+    rollup when it ends, grouped by farm and bucket and once more for the
+    fleet. If the block raises, nothing is added and the caller's rollback
+    undoes its rows.
+    """
+    after_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM water_level_history").fetchone()[0]
+    conn.execute("INSERT OR IGNORE INTO rollup_batch (id) VALUES (1)")
+    try:
+        yield
+    finally:
+        conn.execute("DELETE FROM rollup_batch")
+    for resolution, _, pattern in RESOLUTIONS:
+        for user in ("user_id", f"'{FLEET_ID}'"):
+            # The newest row of a group holds its last reading
+            conn.execute(f'''INSERT INTO {rollup_table(resolution)}
+                             (user_id, bucket, min_level, max_level, sum_level, count, last_level, last_at)
+                             SELECT g.user_id, g.bucket, g.min_level, g.max_level, g.sum_level, g.count,
+                                    h.water_level, g.last_at
+                             FROM (SELECT {user} AS user_id, strftime('{pattern}', created_at) AS bucket,
+                                          MIN(water_level) AS min_level, MAX(water_level) AS max_level,
+                                          SUM(water_level) AS sum_level, COUNT(*) AS count,
+                                          MAX(created_at) AS last_at, MAX(id) AS last_id
+                                   FROM water_level_history
+                                   WHERE id > ?
+                                   GROUP BY 1, 2) g
+                             JOIN water_level_history h ON h.id = g.last_id
+                             WHERE true
+                             {_MERGE}''', (after_id,))
+
+
+# ------------------ QUERIES ------------------
+def pick_resolution(start, end, max_points=MAX_POINTS):
+    """Finest resolution that keeps a ``start``..``end`` series under max_points"""
+    span = (_as_datetime(end) - _as_datetime(start)).total_seconds()
+    if span / RAW_INTERVAL_SECONDS <= max_points:
+        return "raw"
+    for resolution, seconds, _ in RESOLUTIONS:
+        if span / seconds <= max_points:
+            return resolution
+    return RESOLUTIONS[-1][0]
+
+
+def water_level_series(conn, start, end, user_id=None, max_points=MAX_POINTS):
+    """Water level series for ``[start, end)`` from the cheapest table that fits
+
+    Returns ``(resolution, frame)``; the frame has one row per bucket with
+    time, avg_level, min_level, max_level, readings and last_level columns.
+    Without a user_id the series covers the whole fleet.
+    """
+    resolution = pick_resolution(start, end, max_points)
+    params = [_as_text(start), _as_text(end)]
+
+    if resolution == "raw":
+        where = "created_at >= ? AND created_at < ?"
+        if user_id is not None:
+            where += " AND user_id = ?"
+            params.append(user_id)
+        sql = f'''SELECT g.time, g.avg_level, g.min_level, g.max_level, g.readings,
+                         h.water_level AS last_level
+                  FROM (SELECT created_at AS time, AVG(water_level) AS avg_level,
+                               MIN(water_level) AS min_level, MAX(water_level) AS max_level,
+                               COUNT(*) AS readings, MAX(id) AS last_id
+                        FROM water_level_history
+                        WHERE {where}
+                        GROUP BY created_at) g
+                  JOIN water_level_history h ON h.id = g.last_id
+                  ORDER BY g.time'''
+    else:
+        params.append(FLEET_ID if user_id is None else user_id)
+        sql = f'''SELECT bucket AS time, sum_level / count AS avg_level,
+                         min_level, max_level, count AS readings, last_level
+                  FROM {rollup_table(resolution)}
+                  WHERE bucket >= ? AND bucket < ? AND user_id = ?
+                  ORDER BY bucket'''
+
+    return resolution, pd.read_sql_query(sql, conn, params=params)
+
+
+def _as_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return datetime.combine(value, datetime.min.time())
+
+
+def _as_text(value):
+    if isinstance(value, str):
+        return value
+    return _as_datetime(value).strftime('%Y-%m-%d %H:%M:%S')
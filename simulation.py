@@ -0,0 +1,306 @@
+"""Whole-fleet sensor simulation.
+
+simulate_fleet() loads the current state of every farm into NumPy arrays,
+advances solar, battery, water and drain state for all of them in one
+vectorized step, applies the water level control thresholds as array masks
+and writes everything back in a single transaction.
+
+SimulationScheduler runs that step on a background thread at a fixed rate,
+once per process, so farms advance whether or not anyone has a dashboard
+open. Dashboards only read the state it leaves behind.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+import cache
+import database as db
+import readings
+import rollups
+import timeseries
+
+# Water level control thresholds (%)
+EMERGENCY_LEVEL = 95
+HIGH_LEVEL = 90
+LOW_LEVEL = 30
+
+# Chance per farm and step of an informational notification
+NOTIFICATION_CHANCE = 0.1
+
+# Seconds between background fleet ticks; AGRIGURD_SIMULATION=0 turns them off
+TICK_SECONDS = float(os.environ.get("AGRIGURD_SIMULATION_INTERVAL", "5"))
+SIMULATION_ENABLED = os.environ.get("AGRIGURD_SIMULATION", "1") != "0"
+
+logger = logging.getLogger(__name__)
+
+_rng = np.random.default_rng()
+
+
+# ------------------ STATE ------------------
+def load_fleet(conn, user_ids=None):
+    """Current sensor rows as arrays: ids, user_ids, solar, battery, water, drain"""
+    sql = "SELECT id, user_id, solar_input, battery_level, water_level, drain_status FROM sensor_data"
+    params = ()
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        sql += f" WHERE user_id IN ({','.join('?' * len(user_ids))})"
+        params = user_ids
+    rows = conn.execute(sql, params).fetchall()
+
+    ids, users, solar, battery, water, drain = (zip(*rows) if rows else ([],) * 6)
+    return {
+        "id": np.array(ids, dtype=np.int64),
+        "user_id": np.array(users, dtype=object),
+        "solar_input": np.array(solar, dtype=np.float64),
+        "battery_level": np.array(battery, dtype=np.float64),
+        "water_level": np.array(water, dtype=np.float64),
+        "drain_status": np.array(drain, dtype=bool),
+    }
+
+
+# ------------------ STEP ------------------
+def step_fleet(state, hour=None, rng=None):
+    """Advance every farm one tick; returns (new state, notifications)
+
+    Notifications are (user_id, title, message, type) tuples. The new state's
+    "alert" array holds the alert sound each control decision calls for.
+    """
+    rng = rng or _rng
+    hour = datetime.now().hour if hour is None else hour
+    n = len(state["id"])
+
+    # Solar input follows the time of day
+    if 6 <= hour <= 18:
+        solar_change = rng.uniform(-50, 100, n)
+    else:
+        solar_change = rng.uniform(-100, 20, n)
+    solar = np.clip(state["solar_input"] + solar_change, 0, 1200)
+
+    # Battery charges from solar above 500W and otherwise slowly discharges
+    discharge = np.where(solar > 500, -(solar - 500) / 100, 0.1)
+    battery = np.clip(state["battery_level"] - discharge + rng.uniform(-1, 1, n), 0, 100)
+
+    # Water drains while the drain is open and rises more slowly near the limit
+    water = state["water_level"]
+    drain = state["drain_status"].copy()
+    rise = np.where(water >= HIGH_LEVEL, rng.uniform(0.1, 0.5, n), rng.uniform(0.5, 2.0, n))
+    rise[water >= EMERGENCY_LEVEL] = 0
+    change = np.where(drain, -rng.uniform(0.5, 2.0, n), rise)
+    water = np.clip(water + change, 0, 100)
+    simulated_water = water.copy()
+
+    # Control thresholds
+    emergency = water >= EMERGENCY_LEVEL
+    shutdown = emergency & drain
+    high = ~emergency & (water >= HIGH_LEVEL) & ~drain
+    low = ~emergency & ~high & (water <= LOW_LEVEL) & drain
+    drain[shutdown | low] = False
+    drain[high] = True
+    water[emergency] = np.minimum(water[emergency], EMERGENCY_LEVEL)
+
+    users = state["user_id"]
+    notifications = []
+    for i in np.flatnonzero(shutdown):
+        notifications.append((users[i], "🚨 EMERGENCY SHUTDOWN",
+                              f"Water level CRITICAL at {simulated_water[i]:.1f}%. Drainage CLOSED automatically!",
+                              "emergency"))
+    for i in np.flatnonzero(high):
+        notifications.append((users[i], "⚠️ High Water Level",
+                              f"Water level reached {simulated_water[i]:.1f}%. Drainage automatically OPENED.",
+                              "warning"))
+    for i in np.flatnonzero(low):
+        notifications.append((users[i], "💧 Low Water Level",
+                              f"Water level dropped to {simulated_water[i]:.1f}%. Drainage CLOSED to conserve water.",
+                              "info"))
+
+    # Occasional status notifications, first matching condition wins
+    chance = rng.random(n) < NOTIFICATION_CHANCE
+    for i in np.flatnonzero(chance & (simulated_water > HIGH_LEVEL)):
+        notifications.append((users[i], "High Water Level Warning",
+                              f"Water level at {simulated_water[i]:.1f}%.", "warning"))
+    chance &= simulated_water <= HIGH_LEVEL
+    for i in np.flatnonzero(chance & (battery < 30)):
+        notifications.append((users[i], "Low Battery Warning", f"Battery at {battery[i]:.0f}%.", "warning"))
+    chance &= battery >= 30
+    for i in np.flatnonzero(chance & (solar < 200)):
+        notifications.append((users[i], "Low Solar Output", f"Solar input at {solar[i]:.0f}W.", "info"))
+    for i in np.flatnonzero(chance & (solar > 900)):
+        notifications.append((users[i], "High Solar Output",
+                              f"Excellent solar generation: {solar[i]:.0f}W!", "success"))
+
+    # Control decisions that should sound an alert on the farm's dashboard
+    alert = np.full(n, None, dtype=object)
+    alert[shutdown] = "emergency"
+    alert[high] = "warning"
+    alert[low] = "info"
+
+    new_state = dict(state, solar_input=solar, battery_level=battery, water_level=water,
+                     drain_status=drain, alert=alert)
+    return new_state, notifications
+
+
+# ------------------ PERSISTENCE ------------------
+def save_fleet(conn, state, notifications):
+    """Write stepped state, readings, history rows and notifications on one connection
+
+    Returns a callable that moves the storage policies' references to the
+    readings written; call it once the transaction has committed.
+    """
+    rows = list(zip(state["user_id"].tolist(), state["solar_input"].tolist(),
+                    state["battery_level"].tolist(), state["water_level"].tolist(),
+                    state["drain_status"].astype(int).tolist()))
+    conn.executemany(readings.UPSERT_STATE, rows)
+
+    # Only readings the storage policies keep reach the log and the history
+    now = int(time.time())
+    logged, accept_logged = readings.log_policy.decide(
+        state["user_id"], now, **{channel: state[channel] for channel in readings.log_policy.channels})
+    conn.executemany(readings.APPEND_READING, (rows[i] for i in np.flatnonzero(logged)))
+    kept, accept_kept = readings.history_policy.decide(state["user_id"], now, water_level=state["water_level"])
+    # Rollups take the whole tick in one grouped upsert per resolution
+    with rollups.batch(conn):
+        conn.executemany("INSERT INTO water_level_history (user_id, water_level) VALUES (?, ?)",
+                         zip(state["user_id"][kept].tolist(), state["water_level"][kept].tolist()))
+    conn.executemany('''INSERT INTO notifications (user_id, title, message, notification_type)
+                        VALUES (?, ?, ?, ?)''', notifications)
+
+    def accept():
+        accept_logged()
+        accept_kept()
+    return accept
+
+
+def simulate_fleet(user_ids=None, hour=None, rng=None):
+    """Simulate one tick for every farm (or just ``user_ids``) in one transaction
+
+    Reading state, the control decision and every write share one connection
+    and one commit. Returns a summary with the number of farms stepped,
+    notifications raised and the alert sounds due, keyed by user_id.
+    """
+    def tick(conn):
+        state = load_fleet(conn, user_ids)
+        state, notifications = step_fleet(state, hour, rng)
+        accept = save_fleet(conn, state, notifications)
+        alerts = {state["user_id"][i]: state["alert"][i] for i in np.flatnonzero(state["alert"])}
+        return state, accept, {"farms": len(state["id"]), "notifications": len(notifications), "alerts": alerts}
+
+    # A tick that fails leaves the storage policies where they were
+    state, accept, summary = db.write(tick)
+    accept()
+    # Recent-readings store only sees committed state
+    timeseries.store().append(state["user_id"].tolist(), water_level=state["water_level"],
+                              solar_input=state["solar_input"], battery_level=state["battery_level"])
+    if user_ids is None:
+        cache.bump()
+    else:
+        for user_id in user_ids:
+            cache.bump(user_id)
+    return summary
+
+
+# ------------------ SCHEDULER ------------------
+class SimulationScheduler:
+    """Background thread that runs simulate_fleet() every ``interval`` seconds"""
+
+    def __init__(self, interval=TICK_SECONDS):
+        self.interval = interval
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.ticks = 0
+        self.missed = 0
+        self.last_tick = None
+        self.last_duration = None
+        self.last_error = None
+        # user_id -> (tick, alert sound) of the farm's latest alert
+        self._alerts = {}
+
+    def start(self):
+        """Start the thread unless it is already running; returns True if started"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="agrigurd-simulation",
+                                            daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        self._stop.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while not self._stop.wait(max(0, next_tick - time.monotonic())):
+            started = time.monotonic()
+            try:
+                summary = simulate_fleet()
+                with self._lock:
+                    self._alerts.update((user_id, (self.ticks, alert))
+                                        for user_id, alert in summary["alerts"].items())
+                self.last_error = None
+            except Exception as e:
+                # Keep ticking; the database may be mid-reset or briefly locked
+                logger.exception("Fleet simulation tick failed")
+                self.last_error = str(e)
+            self.ticks += 1
+            self.last_tick = datetime.now()
+            self.last_duration = time.monotonic() - started
+
+            # Fixed rate: a slow tick skips the slots it overran instead of
+            # running them back to back
+            next_tick += self.interval
+            now = time.monotonic()
+            if next_tick < now:
+                skipped = int((now - next_tick) // self.interval) + 1
+                self.missed += skipped
+                next_tick += skipped * self.interval
+
+    def latest_alert(self, user_id):
+        """(tick, alert sound) of the farm's latest alert, or None if it had none"""
+        with self._lock:
+            return self._alerts.get(user_id)
+
+    def status(self):
+        return {
+            "running": self.running(),
+            "interval": self.interval,
+            "ticks": self.ticks,
+            "missed": self.missed,
+            "last_tick": self.last_tick,
+            "last_duration": self.last_duration,
+            "last_error": self.last_error,
+        }
+
+
+_scheduler = SimulationScheduler()
+
+
+def ensure_scheduler():
+    """Start the process-wide scheduler once; later calls are a cheap check"""
+    if SIMULATION_ENABLED and not _scheduler.running():
+        _scheduler.start()
+    return _scheduler
+
+
+def stop_scheduler():
+    _scheduler.stop()
+
+
+def scheduler_status():
+    return _scheduler.status()
+
+
+def latest_alert(user_id):
+    return _scheduler.latest_alert(user_id)
@@ -0,0 +1,108 @@
+"""System-wide counters for the admin panels and sidebar boxes.
+
+system_stats holds a handful of named values, so a panel reads a few rows
+however large the tables grow:
+
+    <table>_rows        rows in each of TABLES, kept exact by insert and
+                        delete triggers as rows are written
+    WINDOWS             counts over a trailing window (active farms, recent
+                        notifications and emergencies, water readings).
+                        These change as time passes with no write at all, so
+                        values() recomputes them once they are older than
+                        REFRESH_SECONDS; each is one index range count
+
+The table is shared by every process on the database, so one refresh a
+minute serves all open dashboards and the data viewer.
+"""
+import logging
+import os
+import threading
+import time
+
+import database as db
+import rollups
+
+logger = logging.getLogger(__name__)
+
+# Tables whose row counts are kept
+TABLES = ("users", "sensor_data", "sensor_readings", "notifications", "water_level_history")
+
+REFRESH_SECONDS = int(os.environ.get("AGRIGURD_STATS_REFRESH_SECONDS", "60"))
+
+# Name -> query for each windowed count
+WINDOWS = {
+    # sensor_data holds one row per farm, stamped on every update
+    "active_farms_24h": "SELECT COUNT(*) FROM sensor_data WHERE last_update > datetime('now', '-1 day')",
+    "notifications_24h": "SELECT COUNT(*) FROM notifications WHERE created_at > datetime('now', '-1 day')",
+    "emergencies_24h": '''SELECT COUNT(*) FROM notifications
+                          WHERE notification_type = 'emergency' AND created_at > datetime('now', '-1 day')''',
+    "emergencies_7d": '''SELECT COUNT(*) FROM notifications
+                         WHERE notification_type = 'emergency' AND created_at > datetime('now', '-7 days')''',
+    # Summed from the fleet's minute rollups: 1440 rows instead of a day of readings
+    "water_readings_24h": f'''SELECT COALESCE(SUM(count), 0) FROM {rollups.rollup_table("minute")}
+                              WHERE user_id = '{rollups.FLEET_ID}'
+                              AND bucket >= strftime('%Y-%m-%d %H:%M:00', 'now', '-1 day')''',
+}
+
+_refresh_lock = threading.Lock()
+
+
+# ------------------ SCHEMA ------------------
+def create_stats(conn):
+    """Create system_stats with its row-count triggers, then count every table once"""
+    # refreshed_at is epoch seconds of the last refresh; NULL for trigger-kept rows
+    conn.execute('''CREATE TABLE IF NOT EXISTS system_stats
+                    (name TEXT PRIMARY KEY,
+                     value INTEGER NOT NULL DEFAULT 0,
+                     refreshed_at INTEGER) WITHOUT ROWID''')
+    # Emergency windows count a range of this index instead of checking the
+    # type of every recent notification
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_notifications_type_created
+                    ON notifications (notification_type, created_at)''')
+    for table in TABLES:
+        for event, step in (("INSERT", "+ 1"), ("DELETE", "- 1")):
+            conn.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_stats
+                             AFTER {event} ON {table}
+                             BEGIN
+                                 UPDATE system_stats SET value = value {step} WHERE name = '{table}_rows';
+                             END''')
+        conn.execute(f'''INSERT OR REPLACE INTO system_stats (name, value)
+                         SELECT '{table}_rows', COUNT(*) FROM {table}''')
+
+
+# ------------------ REFRESH ------------------
+def refresh():
+    """Recompute every windowed count now; returns them by name"""
+    with db.connection() as conn:
+        values = {name: conn.execute(sql).fetchone()[0] for name, sql in WINDOWS.items()}
+    now = int(time.time())
+    db.write(lambda conn: conn.executemany(
+        '''INSERT INTO system_stats (name, value, refreshed_at) VALUES (?, ?, ?)
+           ON CONFLICT (name) DO UPDATE SET value = excluded.value, refreshed_at = excluded.refreshed_at''',
+        [(name, value, now) for name, value in values.items()]))
+    return values
+
+
+def values():
+    """Every counter by name; windowed ones are refreshed first if stale
+
+    Only one thread refreshes at a time; the others return the values they
+    found, which are at most one refresh behind.
+    """
+    with db.connection() as conn:
+        rows = conn.execute("SELECT name, value, refreshed_at FROM system_stats").fetchall()
+    result = {f"{table}_rows": 0 for table in TABLES}
+    result.update(dict.fromkeys(WINDOWS, 0))
+    result.update((name, value) for name, value, _ in rows)
+
+    refreshed = {name: refreshed_at for name, _, refreshed_at in rows}
+    oldest = min((refreshed.get(name) or 0) for name in WINDOWS)
+    if time.time() - oldest >= REFRESH_SECONDS and _refresh_lock.acquire(blocking=False):
+        try:
+            result.update(refresh())
+        except Exception:
+            # A locked or half-migrated database: show the last values
+            logger.exception("Refreshing system stats failed")
+        finally:
+            _refresh_lock.release()
+    return result
@@ -0,0 +1,212 @@
+"""Recent sensor readings per farm, held in memory as NumPy ring buffers.
+
+Each farm gets a fixed-capacity float32 ring per metric plus one ring of
+uint32 epoch-second timestamps. Every append writes a full snapshot: metrics
+a write did not touch carry their last value forward. The simulation tick,
+update_sensor_data and update_water_level feed the store after their writes
+commit, and warm() loads recent sensor_readings once per process,
+so dashboards can draw recent charts and status boxes without touching
+SQLite.
+
+Memory per farm is CAPACITY * (4 bytes per metric + 4 bytes of timestamp),
+which is 11,520 bytes (11.25 KiB) with the default 720 slots and three
+metrics. That is about 11 MB per 1,000 farms. The store belongs to one
+process: writes made by another process show up here only after the next
+warm().
+"""
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import database as db
+import readings
+import rollups
+
+METRICS = ("water_level", "solar_input", "battery_level")
+
+# Slots per farm: one hour of readings at the default 5-second tick
+CAPACITY = int(os.environ.get("AGRIGURD_SERIES_CAPACITY", "720"))
+
+BYTES_PER_FARM = CAPACITY * (len(METRICS) * np.dtype(np.float32).itemsize
+                             + np.dtype(np.uint32).itemsize)
+
+
+class SeriesStore:
+    """Ring buffers for every farm, stacked into fleet-wide arrays
+
+    Farm ``i`` owns row ``i`` of each array; ``_head[i]`` is the slot its next
+    reading goes to and ``_count[i]`` how many slots hold data. Appending for
+    many farms at once is a handful of fancy-indexed assignments.
+    """
+
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._index = {}
+            self._values = np.full((0, len(METRICS), self.capacity), np.nan, dtype=np.float32)
+            self._times = np.zeros((0, self.capacity), dtype=np.uint32)
+            self._head = np.zeros(0, dtype=np.int64)
+            self._count = np.zeros(0, dtype=np.int64)
+            self.warmed = False
+
+    def _rows(self, user_ids):
+        # Caller holds the lock; unknown farms get a row, growing by doubling
+        rows = np.empty(len(user_ids), dtype=np.int64)
+        for i, user_id in enumerate(user_ids):
+            row = self._index.get(user_id)
+            if row is None:
+                row = self._index[user_id] = len(self._index)
+            rows[i] = row
+
+        needed = len(self._index)
+        if needed > len(self._head):
+            size = max(needed, 2 * len(self._head), 16)
+            grow = size - len(self._head)
+            self._values = np.concatenate(
+                [self._values, np.full((grow, len(METRICS), self.capacity), np.nan, dtype=np.float32)])
+            self._times = np.concatenate([self._times, np.zeros((grow, self.capacity), dtype=np.uint32)])
+            self._head = np.concatenate([self._head, np.zeros(grow, dtype=np.int64)])
+            self._count = np.concatenate([self._count, np.zeros(grow, dtype=np.int64)])
+        return rows
+
+    def append(self, user_ids, times=None, **metrics):
+        """Record one reading per farm; metrics left out keep their last value
+
+        ``user_ids`` must not repeat within one call. ``times`` are epoch
+        seconds and default to now.
+        """
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        unknown = set(metrics) - set(METRICS)
+        if unknown:
+            raise ValueError(f"Unknown metrics: {', '.join(sorted(unknown))}")
+        if times is None:
+            times = int(time.time())
+
+        with self._lock:
+            rows = self._rows(user_ids)
+            head = self._head[rows]
+            previous = (head - 1) % self.capacity
+            for m, name in enumerate(METRICS):
+                if name in metrics:
+                    value = np.asarray(metrics[name], dtype=np.float32)
+                else:
+                    value = self._values[rows, m, previous]
+                self._values[rows, m, head] = value
+            self._times[rows, head] = times
+            self._head[rows] = (head + 1) % self.capacity
+            self._count[rows] = np.minimum(self._count[rows] + 1, self.capacity)
+
+    def latest(self, user_id):
+        """Newest reading of a farm as {metric: value, "time": epoch}, or None"""
+        with self._lock:
+            row = self._index.get(user_id)
+            if row is None or not self._count[row]:
+                return None
+            slot = (self._head[row] - 1) % self.capacity
+            reading = {name: float(self._values[row, m, slot]) for m, name in enumerate(METRICS)}
+            reading["time"] = int(self._times[row, slot])
+        return reading
+
+    def window(self, user_id, seconds=None):
+        """(times, {metric: values}) for a farm, oldest first
+
+        ``seconds`` limits the result to readings that recent. The arrays are
+        copies, so callers may keep them.
+        """
+        with self._lock:
+            row = self._index.get(user_id)
+            count = 0 if row is None else int(self._count[row])
+            if not count:
+                return np.zeros(0, dtype=np.int64), {name: np.zeros(0, np.float32) for name in METRICS}
+            order = (self._head[row] - count + np.arange(count)) % self.capacity
+            times = self._times[row, order].astype(np.int64)
+            values = self._values[row][:, order]
+        if seconds is not None:
+            keep = times >= times[-1] - seconds
+            times, values = times[keep], values[:, keep]
+        return times, {name: values[m] for m, name in enumerate(METRICS)}
+
+    def warm(self, conn):
+        """Replace the store's contents with recent readings from the database
+
+        The new buffers are built off-lock and swapped in under one lock
+        acquisition. Readings appended while the query ran and newer than
+        anything it returned are carried over, so a concurrent tick is kept.
+        """
+        since = int(time.time()) - self.capacity * rollups.RAW_INTERVAL_SECONDS
+        # One primary-key range scan per farm listed in the current-state table
+        history = pd.read_sql_query('''SELECT user_id, ts, water_level, solar_input, battery_level
+                                       FROM sensor_readings
+                                       WHERE user_id IN (SELECT user_id FROM sensor_data) AND ts >= ?''',
+                                    conn, params=(since,))
+
+        fresh = SeriesStore(self.capacity)
+        if len(history):
+            # Group rows by farm in time order, number each within its farm and
+            # keep the newest ``capacity``
+            codes, farms = pd.factorize(history["user_id"])
+            order = np.lexsort((history["ts"].to_numpy(), codes))
+            history, codes = history.iloc[order], codes[order]
+            counts = np.bincount(codes)
+            starts = np.cumsum(counts) - counts
+            kept = np.minimum(counts, self.capacity)
+            slot = np.arange(len(codes)) - (starts + counts - kept)[codes]
+            keep = slot >= 0
+            rows = fresh._rows(list(farms))
+            for m, name in enumerate(METRICS):
+                fresh._values[rows[codes[keep]], m, slot[keep]] = \
+                    (history[name].to_numpy(np.float64) / readings.SCALES[name])[keep]
+            fresh._times[rows[codes[keep]], slot[keep]] = history["ts"].to_numpy()[keep]
+            fresh._head[rows] = kept % self.capacity
+            fresh._count[rows] = kept
+
+        with self._lock:
+            for user_id, row in self._index.items():
+                count = int(self._count[row])
+                if not count:
+                    continue
+                order = (self._head[row] - count + np.arange(count)) % self.capacity
+                times = self._times[row, order]
+                warmed = fresh.latest(user_id)
+                newer = np.flatnonzero(times > (warmed["time"] if warmed else since - 1))
+                for i in newer:
+                    fresh.append([user_id], times=int(times[i]),
+                                 **{name: [self._values[row, m, order[i]]] for m, name in enumerate(METRICS)})
+            self._index, self._values, self._times = fresh._index, fresh._values, fresh._times
+            self._head, self._count = fresh._head, fresh._count
+            self.warmed = True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "farms": len(self._index),
+                "capacity": self.capacity,
+                "bytes": self._values.nbytes + self._times.nbytes,
+                "bytes_per_farm": BYTES_PER_FARM,
+            }
+
+
+_store = SeriesStore()
+_warm_lock = threading.Lock()
+
+
+def ensure_warm():
+    """Warm the process-wide store from the database once"""
+    with _warm_lock:
+        if not _store.warmed:
+            with db.connection() as conn:
+                _store.warm(conn)
+    return _store
+
+
+def store():
+    return _store